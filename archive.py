@@ -0,0 +1,123 @@
+import os
+import gzip
+import asyncio
+import json
+import shutil
+import logging
+from datetime import date, timedelta
+from typing import Iterator, List, Optional, Tuple
+from report_store import DayReports, ReportRecord, get_day_reports
+
+logger = logging.getLogger(__name__)
+
+# Finished business days are moved out of bot_data into one gzip'd JSON-lines file per chat
+# and day: ARCHIVE_DIR/<chat_id>/<YYYY-MM-DD>.jsonl.gz. Files older than
+# ARCHIVE_RETENTION_DAYS are deleted; 0 keeps them forever.
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+ARCHIVE_RETENTION_DAYS = int(os.getenv('ARCHIVE_RETENTION_DAYS', '90'))
+ARCHIVE_SUFFIX = '.jsonl.gz'
+
+
+def archive_path(chat_id: str, day: str) -> str:
+    return os.path.join(ARCHIVE_DIR, str(chat_id), day + ARCHIVE_SUFFIX)
+
+
+def write_archived_day(chat_id: str, day: str, day_reports: DayReports) -> None:
+    path = archive_path(chat_id, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # The day's complete records replace the file in one step, so archiving a day again (a
+    # restart before the 'archive_day' changes were persisted) rewrites it rather than
+    # adding every row twice.
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as file:
+        for record in day_reports:
+            file.write(json.dumps(record._asdict(), ensure_ascii=False))
+            file.write('\n')
+    os.replace(tmp_path, path)
+
+
+def iter_archived_records(chat_id: str, day: str) -> Iterator[ReportRecord]:
+    path = archive_path(chat_id, day)
+    if not os.path.exists(path):
+        return
+
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        for line in file:
+            yield ReportRecord(**json.loads(line))
+
+
+def load_archived_day(chat_id: str, day: str) -> Optional[DayReports]:
+    day_reports = DayReports(tuple(iter_archived_records(chat_id, day)))
+    return day_reports if day_reports else None
+
+
+def archived_days(chat_id: str) -> List[str]:
+    directory = os.path.join(ARCHIVE_DIR, str(chat_id))
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len(ARCHIVE_SUFFIX)] for name in os.listdir(directory) if name.endswith(ARCHIVE_SUFFIX))
+
+
+def write_archived_days(days: List[Tuple[str, str, DayReports]]) -> None:
+    for chat_id, day, day_reports in days:
+        write_archived_day(chat_id, day, day_reports)
+
+
+async def archive_finished_days(bot_data: dict, current_day: str) -> List[Tuple[str, str]]:
+    """Move every day other than current_day from group_data into the archive.
+
+    The files are compressed and written on a worker thread; finished days get no new
+    reports, so they are read there while the event loop goes on. A day leaves group_data
+    only once its file is in place. Returns the (chat_id, day) pairs that were moved so the
+    caller can record them.
+    """
+    group_data = bot_data.get('group_data', {})
+    finished = [
+        (chat_id, day, get_day_reports(bot_data, chat_id, day))
+        for chat_id, days in group_data.items()
+        for day in days if day != current_day
+    ]
+    if not finished:
+        return []
+
+    await asyncio.to_thread(write_archived_days, [entry for entry in finished if entry[2]])
+
+    moved = []
+    for chat_id, day, day_reports in finished:
+        days = group_data.get(chat_id)
+        if days is None or day not in days:
+            # Cleared while its file was written: the archive must not bring it back.
+            if day_reports:
+                os.remove(archive_path(chat_id, day))
+            continue
+        del days[day]
+        moved.append((chat_id, day))
+        if not days:
+            del group_data[chat_id]
+
+    return moved
+
+
+def prune_archive(today: date, retention_days: int = ARCHIVE_RETENTION_DAYS) -> int:
+    if retention_days <= 0 or not os.path.isdir(ARCHIVE_DIR):
+        return 0
+
+    cutoff = (today - timedelta(days=retention_days)).strftime('%Y-%m-%d')
+    removed = 0
+
+    for chat_id in os.listdir(ARCHIVE_DIR):
+        for day in archived_days(chat_id):
+            if day < cutoff:
+                os.remove(archive_path(chat_id, day))
+                removed += 1
+
+        directory = os.path.join(ARCHIVE_DIR, chat_id)
+        if os.path.isdir(directory) and not os.listdir(directory):
+            os.rmdir(directory)
+
+    return removed
+
+
+def remove_chat_archive(chat_id: str) -> None:
+    shutil.rmtree(os.path.join(ARCHIVE_DIR, str(chat_id)), ignore_errors=True)
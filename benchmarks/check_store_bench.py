@@ -0,0 +1,74 @@
+"""Memory and throughput of CheckStore against the plain dict previously used for check_records.
+
+Usage: python benchmarks/check_store_bench.py [count]   (default: 10,000,000 numbers)
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from check_store import CheckStore  # noqa: E402
+
+
+def iter_numbers(count: int, seed: int = 1):
+    # Numbers are generated on the fly so the key strings a dict keeps alive are counted
+    # against the dict, as they are in production.
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield f"09{rng.randrange(10 ** 9):09d}"
+
+
+def fill_dict(count: int) -> dict:
+    records = {}
+    for number in iter_numbers(count):
+        records[number] = records.get(number, 0) + 1
+    return records
+
+
+def fill_store(count: int) -> CheckStore:
+    store = CheckStore()
+    for number in iter_numbers(count):
+        store.increment(number)
+    return store
+
+
+def measure(name: str, fill, count: int, lookups: list) -> None:
+    tracemalloc.start()
+    structure = fill(count)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del structure
+
+    started = time.perf_counter()
+    structure = fill(count)
+    insert_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for number in lookups:
+        structure.get(number, 0)
+    lookup_seconds = time.perf_counter() - started
+
+    print(
+        f"{name:<10} {memory / 2 ** 20:>10.1f} MiB "
+        f"{count / insert_seconds:>14,.0f} inserts/s "
+        f"{len(lookups) / lookup_seconds:>14,.0f} lookups/s"
+    )
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    sample = min(count, 500_000) // 2
+    # Half repeat lookups of known numbers, half first-time numbers.
+    lookups = list(iter_numbers(sample)) + list(iter_numbers(sample, seed=2))
+    random.Random(3).shuffle(lookups)
+
+    print(f"{count:,} numbers")
+    measure('dict', fill_dict, count, lookups)
+    measure('CheckStore', fill_store, count, lookups)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Throughput with sequential vs. chat-ordered concurrent update processing.
+
+Usage: python benchmarks/concurrency_bench.py [updates] [api latency ms]   (default: 2000, 20)
+
+Two workloads run against a stub Bot API that answers after a fixed latency, like the real
+one would:
+
+  reports  reports handled by main.extract_and_save_data. The handler queues its reply in the
+           Outbox and returns, so the API latency is paid by the Outbox's per-chat senders
+           rather than by the handler.
+  pages    /showdata page buttons handled by main.show_data_page, which awaits answering the
+           callback and editing the message: two API round trips inside the handler.
+
+A run is timed until every update was handled and the Outbox delivered every queued message.
+The Outbox paces nothing here, so Telegram's flood limits do not mask the bot's own
+throughput. With sequential processing the latency of awaiting handlers adds up regardless
+of how many chats are active; with ChatOrderedUpdateProcessor the throughput grows with the
+number of active chats until UPDATE_CONCURRENCY is reached. The script also checks that
+every chat's updates took effect in the order they were sent.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '')
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application, CallbackQueryHandler, MessageHandler, filters  # noqa: E402
+from telegram.request import BaseRequest  # noqa: E402
+
+import main  # noqa: E402
+from outbox import Outbox, get_outbox  # noqa: E402
+from report_store import ReportRecord, get_day_reports  # noqa: E402
+from update_processor import ChatOrderedUpdateProcessor, UPDATE_CONCURRENCY  # noqa: E402
+
+WORKLOADS = ('reports', 'pages')
+# Reports stored per chat before the pages workload, enough for a few /showdata pages.
+PAGE_HISTORY = 150
+
+
+class StubRequest(BaseRequest):
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        # chat id -> texts of the messages sent or edited there, in the order they arrived
+        self.texts = defaultdict(list)
+
+    @property
+    def read_timeout(self):
+        return 5.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        parameters = request_data.parameters if request_data else {}
+        if api_method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+        elif api_method == 'answerCallbackQuery':
+            await asyncio.sleep(self.latency)
+            result = True
+        else:
+            await asyncio.sleep(self.latency)
+            chat_id = int(parameters.get('chat_id', 1))
+            self.texts[chat_id].append(parameters.get('text', ''))
+            result = {'message_id': int(parameters.get('message_id', 1)), 'date': 0,
+                      'chat': {'id': chat_id, 'type': 'group'}, 'text': parameters.get('text', '')}
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def unpaced_outbox() -> Outbox:
+    return Outbox(rate=1e9, chat_rate=1e9, chat_burst=1e9, group_rate=1e9, group_burst=1e9)
+
+
+def chat_id_of(index: int, chats: int) -> int:
+    return -1000 - index % chats
+
+
+def report_update(bot, update_id: int, chat_id: int, sequence: int) -> Update:
+    text = f"Gmail - user{sequence}@gmail.com\nDate - 1.1.2025\nKhaifa - K{sequence % 7}"
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': 0, 'text': text,
+            'chat': {'id': chat_id, 'type': 'group', 'title': 'bench'},
+            'from': {'id': 10, 'is_bot': False, 'first_name': 'u'},
+        },
+    }, bot)
+
+
+def page_update(bot, update_id: int, chat_id: int, day: str, page: int) -> Update:
+    return Update.de_json({
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id), 'chat_instance': 'bench', 'data': f'showdata_{day}_{page}',
+            'from': {'id': 10, 'is_bot': False, 'first_name': 'u'},
+            'message': {'message_id': 1, 'date': 0, 'chat': {'id': chat_id, 'type': 'group', 'title': 'bench'},
+                        'text': '.'},
+        },
+    }, bot)
+
+
+def seed_pages(bot_data: dict, chats: int, day: str) -> int:
+    """Store PAGE_HISTORY reports in every chat; returns the number of /showdata pages."""
+    for chat in range(chats):
+        reports = get_day_reports(bot_data, str(chat_id_of(chat, chats)), day, create=True)
+        for sequence in range(PAGE_HISTORY):
+            reports.add(ReportRecord('1.1.2025', f'K{sequence % 7}', f'user{sequence}@gmail.com', f'k{sequence % 7}'))
+    return len(get_day_reports(bot_data, str(chat_id_of(0, chats)), day).pages())
+
+
+async def run(workload: str, chats: int, updates: int, latency: float, concurrent: bool) -> float:
+    request = StubRequest(latency)
+    builder = Application.builder().token('1:bench').request(request).rate_limiter(unpaced_outbox()).updater(None)
+    if concurrent:
+        builder = builder.concurrent_updates(ChatOrderedUpdateProcessor(UPDATE_CONCURRENCY))
+    application = builder.build()
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, main.extract_and_save_data))
+    application.add_handler(CallbackQueryHandler(main.show_data_page, pattern='^showdata_'))
+
+    day = main.get_data_key()
+    async with application:
+        await application.start()
+        if workload == 'reports':
+            batch = [report_update(application.bot, i + 1, chat_id_of(i, chats), i // chats) for i in range(updates)]
+        else:
+            page_count = seed_pages(application.bot_data, chats, day)
+            batch = [
+                page_update(application.bot, i + 1, chat_id_of(i, chats), day, (i // chats) % page_count)
+                for i in range(updates)
+            ]
+
+        started = time.perf_counter()
+        for update in batch:
+            await application.update_queue.put(update)
+        await application.update_queue.join()
+        await get_outbox(application.bot).join()
+        elapsed = time.perf_counter() - started
+        await application.stop()
+
+        for chat in range(chats):
+            chat_id = chat_id_of(chat, chats)
+            if workload == 'reports':
+                stored = [record.contact for record in get_day_reports(application.bot_data, str(chat_id), day)]
+                expected = [f"user{sequence}@gmail.com" for sequence in range(len(stored))]
+            else:
+                pages = get_day_reports(application.bot_data, str(chat_id), day).pages()
+                stored = request.texts[chat_id]
+                expected = [pages[(i // chats) % page_count] for i in range(chat, updates, chats)]
+            if stored != expected:
+                raise SystemExit(f"{workload}: chat {chat_id} handled its updates out of order")
+
+    return updates / elapsed
+
+
+def main_bench() -> None:
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+
+    print(f"{updates} updates, {latency * 1000:.0f} ms API latency, UPDATE_CONCURRENCY={UPDATE_CONCURRENCY}")
+    print(f"{'':>6} {'reports':>25} {'pages':>25}")
+    print(f"{'chats':>6} " + f"{'sequential':>12} {'concurrent':>12} " * len(WORKLOADS) + "  updates/s")
+    for chats in (1, 2, 4, 8, 16, 32):
+        columns = []
+        for workload in WORKLOADS:
+            # Sequential processing of awaiting handlers does not depend on the number of
+            # chats; keep those runs short.
+            sequential_updates = min(updates, 200) if workload == 'pages' else updates
+            columns.append(asyncio.run(run(workload, chats, sequential_updates, latency, concurrent=False)))
+            columns.append(asyncio.run(run(workload, chats, updates, latency, concurrent=True)))
+        print(f"{chats:>6} " + " ".join(f"{column:>12,.0f}" for column in columns))
+
+
+if __name__ == '__main__':
+    main_bench()
@@ -0,0 +1,426 @@
+"""Offline load test of the whole bot: main.build_application() against a stub Bot API.
+
+Usage: python benchmarks/load_test.py [--chats N] [--history N] [--updates N] [--latency MS]
+                                      [--backend pickle|sqlite|journal] [--scenarios a,b,...]
+                                      [--save FILE] [--baseline FILE]
+
+The real Application, handlers, persistence backend and update processor are built exactly as
+in production; only the Bot API is replaced by an httpx transport that answers every call
+after --latency milliseconds. Before the run, --history reports per chat are stored for today
+through the configured persistence backend, in a scratch directory (--workdir), so loading and
+flushing work on a realistically sized bot_data.
+
+Scenarios, run in this order on the same application:
+  reports    REPORT_TEMPLATE-shaped reports in the group chats
+  numbers    bare phone numbers in the group chats (repeats included)
+  chk        /chk <number> in private chats
+  showdata   /showdata in the group chats (updates / 10 of them; the days are large by now)
+  broadcast  an admin /broadcast to all users and groups; timed until the summary is sent,
+             so it is bounded by OUTBOX_RATE rather than by the bot
+
+For each scenario it prints updates/s, latency percentiles (update queued until all handler
+groups ran), Bot API calls, messages sent, persistence flushes and the process RSS. Handlers
+queue most replies in the Outbox and return, so a scenario's clock (and updates/s) only stops
+once the Outbox has delivered every queued message; the latency percentiles do not include
+that delivery. --save writes the results as JSON; --baseline compares against a file written
+by an earlier --save. Settings the bot reads from the environment (UPDATE_CONCURRENCY,
+PERSISTENCE_FLUSH_INTERVAL, BROADCAST_CONCURRENCY, ...) apply as usual. With Telegram's
+per-chat limits (the OUTBOX_* defaults) the delivery of replies bounds updates/s as soon as
+chats get more than a burst of messages; raise OUTBOX_CHAT_RATE / OUTBOX_GROUP_RATE to
+measure the bot itself.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import urllib.parse
+from collections import Counter
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCENARIOS = ('reports', 'numbers', 'chk', 'showdata', 'broadcast')
+
+
+def configure() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline load test against a stub Bot API.")
+    parser.add_argument('--chats', type=int, default=100, help="group chats (and as many private chats)")
+    parser.add_argument('--history', type=int, default=200, help="reports per group already stored today")
+    parser.add_argument('--updates', type=int, default=2000, help="updates per scenario")
+    parser.add_argument('--latency', type=float, default=20, help="stub Bot API latency in ms")
+    parser.add_argument('--backend', choices=('pickle', 'sqlite', 'journal'),
+                        default=os.getenv('PERSISTENCE_BACKEND', 'pickle'))
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--workdir', help="directory for the persistence files (default: a new temp dir)")
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="compare against results saved earlier with --save")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios.split(',')) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # The bot's modules read their settings at import time, and persistence files are
+    # relative to the working directory.
+    os.environ['PERSISTENCE_BACKEND'] = args.backend
+    os.environ['TELEGRAM_BOT_TOKEN'] = '1:loadtest'
+    os.environ.pop('TELEGRAM_API_URL', None)
+    if args.save:
+        args.save = os.path.abspath(args.save)
+    if args.baseline:
+        args.baseline = os.path.abspath(args.baseline)
+    args.workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='bot-loadtest-'))
+    os.makedirs(args.workdir, exist_ok=True)
+    os.chdir(args.workdir)
+    return args
+
+
+ARGS = configure() if __name__ == '__main__' else None
+
+import httpx  # noqa: E402
+from telegram import Update  # noqa: E402
+from telegram.ext import TypeHandler  # noqa: E402
+
+import main  # noqa: E402
+import perf  # noqa: E402
+from metrics import TimedHTTPXRequest  # noqa: E402
+from outbox import get_outbox  # noqa: E402
+from report_parser import parse_report  # noqa: E402
+from report_store import ReportRecord  # noqa: E402
+from storage import build_persistence, seed_persistence  # noqa: E402
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'loadtest', 'username': 'loadtest_bot'}
+BROADCAST_DONE_PREFIX = "✅ Broadcast"
+# Runs after every handler group the bot uses, so it sees each update once it is fully handled.
+LATENCY_GROUP = 100
+
+
+class StubBotApi:
+    """An httpx transport handler answering Bot API calls after a fixed latency."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.message_ids = itertools.count(1)
+        self.broadcast_done: Optional[asyncio.Event] = None
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        api_method = request.url.path.rsplit('/', 1)[-1]
+        parameters = {key: values[0] for key, values in urllib.parse.parse_qs(request.content.decode()).items()}
+        self.calls[api_method] += 1
+
+        if api_method == 'getMe':
+            result = BOT_USER
+        else:
+            await asyncio.sleep(self.latency)
+            result = self.result(api_method, parameters)
+        return httpx.Response(200, json={'ok': True, 'result': result})
+
+    def result(self, api_method: str, parameters: Dict[str, str]):
+        if api_method in ('sendMessage', 'editMessageText'):
+            text = parameters.get('text', '')
+            if api_method == 'editMessageText' and text.startswith(BROADCAST_DONE_PREFIX) and self.broadcast_done:
+                self.broadcast_done.set()
+            chat_id = int(parameters.get('chat_id', 1))
+            return {
+                'message_id': int(parameters.get('message_id', 0)) or next(self.message_ids), 'date': 0,
+                'chat': chat_json(chat_id), 'from': BOT_USER, 'text': text,
+            }
+        if api_method == 'getChat':
+            chat_id = int(parameters['chat_id'])
+            return dict(chat_json(chat_id), accent_color_id=0, max_reaction_count=0)
+        return True
+
+
+def chat_json(chat_id: int) -> dict:
+    if chat_id < 0:
+        return {'id': chat_id, 'type': 'group', 'title': f"Group {-chat_id}"}
+    return {'id': chat_id, 'type': 'private', 'first_name': f"User {chat_id}"}
+
+
+def group_id(index: int) -> int:
+    return -100000 - index
+
+
+def user_id(index: int) -> int:
+    return 100000 + index
+
+
+def report_text(sequence: int) -> str:
+    return (
+        f"Gmail        - user{sequence}@gmail.com\n"
+        f"Tele name    - User {sequence}\n"
+        f"Username    - @user{sequence}\n"
+        f"Date        - 1.1.2025\n"
+        f"Age         - {20 + sequence % 30}\n"
+        f"Current work - Sales\n"
+        f"Khaifa      - K{sequence % 7}\n"
+    )
+
+
+class TrafficGenerator:
+    def __init__(self, chats: int, seed: int = 1) -> None:
+        self.chats = chats
+        self.rng = random.Random(seed)
+        self.update_ids = itertools.count(1)
+        self.sequence = itertools.count(1_000_000)
+
+    def message(self, chat_id: int, sender: int, text: str, command: bool = False) -> dict:
+        update_id = next(self.update_ids)
+        message = {
+            'message_id': update_id, 'date': int(time.time()), 'text': text,
+            'chat': chat_json(chat_id), 'from': {'id': sender, 'is_bot': False, 'first_name': 'u'},
+        }
+        if command:
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'update_id': update_id, 'message': message}
+
+    def callback(self, chat_id: int, data: str, message_id: int) -> dict:
+        update_id = next(self.update_ids)
+        return {'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'chat_instance': 'loadtest', 'data': data,
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'admin'},
+            'message': {'message_id': message_id, 'date': 0, 'chat': chat_json(chat_id), 'from': BOT_USER, 'text': '.'},
+        }}
+
+    def number(self, pool: int) -> str:
+        return f"09{self.rng.randrange(pool):09d}"
+
+    def reports(self, count: int) -> List[dict]:
+        return [
+            self.message(group_id(i % self.chats), user_id(i % self.chats), report_text(next(self.sequence)))
+            for i in range(count)
+        ]
+
+    def numbers(self, count: int) -> List[dict]:
+        # Draw from a pool half the size of the run, so about a third of the numbers repeat.
+        return [
+            self.message(group_id(i % self.chats), user_id(i % self.chats), self.number(max(count // 2, 1)))
+            for i in range(count)
+        ]
+
+    def chk(self, count: int) -> List[dict]:
+        return [
+            self.message(user_id(i % self.chats), user_id(i % self.chats), f"/chk {self.number(max(count // 2, 1))}", True)
+            for i in range(count)
+        ]
+
+    def showdata(self, count: int) -> List[dict]:
+        return [
+            self.message(group_id(i % self.chats), user_id(i % self.chats), "/showdata", True)
+            for i in range(max(count // 10, 1))
+        ]
+
+
+class LatencyRecorder:
+    def __init__(self) -> None:
+        self.queued_at: Dict[int, float] = {}
+        self.latencies: List[float] = []
+        self.expected = 0
+        self.all_done = asyncio.Event()
+
+    def expect(self, count: int) -> None:
+        self.latencies = []
+        self.expected = count
+        self.all_done.clear()
+
+    async def __call__(self, update: Update, context) -> None:
+        queued_at = self.queued_at.pop(update.update_id, None)
+        if queued_at is None:
+            return
+        self.latencies.append(time.perf_counter() - queued_at)
+        if len(self.latencies) >= self.expected:
+            self.all_done.set()
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def rss_mb() -> float:
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def flush_count() -> int:
+    return sum(histogram.count for histogram in perf.TABLES['flush'].values())
+
+
+async def seed(chats: int, history: int) -> float:
+    """Store `history` reports per group for today, plus the chat registry. Returns seconds."""
+    started = time.perf_counter()
+    day = main.get_data_key()
+    changes = []
+    for index in range(chats):
+        changes.append(('chat', group_id(index), 'group'))
+        changes.append(('chat', user_id(index), 'private'))
+        changes.extend(
+            ('report', str(group_id(index)), day, ReportRecord.from_parsed(parse_report(report_text(sequence))))
+            for sequence in range(history)
+        )
+    await seed_persistence(build_persistence(), changes)
+    return time.perf_counter() - started
+
+
+async def run_scenario(name: str, application, stub: StubBotApi, recorder: LatencyRecorder, updates: List[dict],
+                       wait_for=None) -> dict:
+    calls_before = sum(stub.calls.values())
+    messages_before = stub.calls['sendMessage']
+    flushes_before = flush_count()
+    batch = [Update.de_json(data, application.bot) for data in updates]
+    recorder.expect(len(batch))
+
+    started = time.perf_counter()
+    for update in batch:
+        recorder.queued_at[update.update_id] = time.perf_counter()
+        await application.update_queue.put(update)
+    await recorder.all_done.wait()
+    if wait_for is not None:
+        await wait_for
+    outbox = get_outbox(application.bot)
+    if outbox is not None:
+        await outbox.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'scenario': name,
+        'updates': len(batch),
+        'seconds': elapsed,
+        'updates_per_s': len(batch) / elapsed,
+        'p50_ms': recorder.percentile(0.5) * 1000,
+        'p95_ms': recorder.percentile(0.95) * 1000,
+        'p99_ms': recorder.percentile(0.99) * 1000,
+        'api_calls': sum(stub.calls.values()) - calls_before,
+        'messages': stub.calls['sendMessage'] - messages_before,
+        'flushes': flush_count() - flushes_before,
+        'rss_mb': rss_mb(),
+    }
+
+
+async def broadcast(application, stub: StubBotApi, recorder: LatencyRecorder, traffic: TrafficGenerator) -> dict:
+    admin = main.ADMIN_IDS[0]
+    stub.broadcast_done = asyncio.Event()
+    # Walk the conversation one step at a time, as the admin would.
+    steps = [
+        traffic.message(admin, admin, "/broadcast", True),
+        traffic.callback(admin, 'bcast_all', 1),
+        traffic.message(admin, admin, "Load test broadcast"),
+    ]
+    for step in steps:
+        await run_scenario('broadcast-setup', application, stub, recorder, [step])
+
+    bot_data = application.bot_data
+    targets = len(bot_data.get('users', ())) + len(bot_data.get('groups', ()))
+    result = await run_scenario(
+        'broadcast', application, stub, recorder, [traffic.callback(admin, 'bcast_confirm', 1)],
+        wait_for=stub.broadcast_done.wait()
+    )
+    result['updates'] = targets
+    result['updates_per_s'] = targets / result['seconds']
+    return result
+
+
+async def load_test(args: argparse.Namespace) -> dict:
+    scenarios = args.scenarios.split(',')
+    seed_seconds = await seed(args.chats, args.history)
+
+    stub = StubBotApi(args.latency / 1000)
+    request = TimedHTTPXRequest(connection_pool_size=256, httpx_kwargs={'transport': httpx.MockTransport(stub)})
+    application = main.build_application(build_persistence(), polling=False, request=request)
+    recorder = LatencyRecorder()
+    application.add_handler(TypeHandler(Update, recorder), group=LATENCY_GROUP)
+    traffic = TrafficGenerator(args.chats)
+
+    results = []
+    started = time.perf_counter()
+    async with application:
+        load_seconds = time.perf_counter() - started
+        await application.start()
+
+        for name in SCENARIOS:
+            if name not in scenarios:
+                continue
+            if name == 'broadcast':
+                results.append(await broadcast(application, stub, recorder, traffic))
+            else:
+                updates = getattr(traffic, name)(args.updates)
+                results.append(await run_scenario(name, application, stub, recorder, updates))
+
+        await application.stop()
+
+    return {
+        'settings': {
+            'backend': args.backend, 'chats': args.chats, 'history': args.history, 'updates': args.updates,
+            'latency_ms': args.latency, 'update_concurrency': int(os.getenv('UPDATE_CONCURRENCY', '16')),
+        },
+        'seed_seconds': seed_seconds,
+        'load_seconds': load_seconds,
+        'peak_rss_mb': max(result['rss_mb'] for result in results) if results else rss_mb(),
+        'results': results,
+    }
+
+
+def print_report(report: dict, baseline: Optional[dict]) -> None:
+    settings = report['settings']
+    print(
+        f"backend={settings['backend']} chats={settings['chats']} history={settings['history']} "
+        f"updates={settings['updates']} latency={settings['latency_ms']:.0f}ms "
+        f"UPDATE_CONCURRENCY={settings['update_concurrency']}"
+    )
+    print(f"seeded in {report['seed_seconds']:.2f}s, persistence loaded in {report['load_seconds']:.2f}s")
+    print(f"{'scenario':<10} {'updates':>8} {'upd/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'api':>7} {'msgs':>7} {'flushes':>7} {'rss MB':>7}")
+
+    previous = {result['scenario']: result for result in (baseline or {}).get('results', ())}
+    for result in report['results']:
+        print(
+            f"{result['scenario']:<10} {result['updates']:>8} {result['updates_per_s']:>9,.0f} "
+            f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+            f"{result['api_calls']:>7} {result.get('messages', 0):>7} {result['flushes']:>7} {result['rss_mb']:>7.1f}"
+        )
+        before = previous.get(result['scenario'])
+        if before:
+            print(
+                f"{'  vs base':<10} {'':>8} {change(before['updates_per_s'], result['updates_per_s']):>9} "
+                f"{change(before['p50_ms'], result['p50_ms']):>8} {change(before['p95_ms'], result['p95_ms']):>8} "
+                f"{change(before['p99_ms'], result['p99_ms']):>8} {'':>7} {'':>7} {'':>7} "
+                f"{change(before['rss_mb'], result['rss_mb']):>7}"
+            )
+
+
+def change(before: float, after: float) -> str:
+    if not before:
+        return '-'
+    return f"{(after - before) / before:+.0%}"
+
+
+def main_load_test(args: argparse.Namespace) -> None:
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    report = asyncio.run(load_test(args))
+    print_report(report, baseline)
+    print(f"persistence files in {args.workdir}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main_load_test(ARGS)
@@ -0,0 +1,119 @@
+"""Equivalence check and microbenchmark of report_parser.parse_report against the regex chain
+extract_and_save_data used before it.
+
+Usage: python benchmarks/report_parser_bench.py [repeat]   (default: 20 passes over the corpus)
+
+Every corpus message is first run through both implementations and the script exits with an
+error if the "date    khaifa    contact" line or the report/not-report decision differs.
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from report_parser import REPORT_TEMPLATE, parse_report  # noqa: E402
+
+
+def legacy_extract(full_text: str):
+    required_fields_present = all(
+        re.search(field, full_text, re.IGNORECASE)
+        for field in ["Khaifa", "Date"]
+    )
+
+    if not required_fields_present:
+        re.sub(r'[\s\n\-\(\)\+]+', '', full_text).strip()
+        return None
+
+    khaifa_match = re.search(r"(?:Khaifa|Khat)\s*[\-\–]?\s*(.+?)(?:\r?\n|$)", full_text, re.IGNORECASE | re.DOTALL)
+    extracted_khaifa = khaifa_match.group(1).strip() if khaifa_match else "N/A"
+
+    date_match = re.search(r"Date\s*[\-\–]?\s*(.+?)(?:\n|$)", full_text, re.IGNORECASE | re.DOTALL)
+    extracted_date = date_match.group(1).strip() if date_match else "N/A"
+
+    email_phone_match = re.search(r"(?:Gmail|Email|Phone number|Phone)\s*[\-\–]?\s*(.+?)(?:\n|$)", full_text, re.IGNORECASE | re.DOTALL)
+    extracted_email_phone = email_phone_match.group(1).strip() if email_phone_match else "N/A"
+
+    return f"{extracted_date}    {extracted_khaifa}    {extracted_email_phone}"
+
+
+def build_corpus(size: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    names = ["Ko Aung", "koaung", "Ma Ma", "U Ba", "Khin Khin", "Zaw", "မောင်မောင်"]
+    lines = REPORT_TEMPLATE.split("\n")
+    corpus = [REPORT_TEMPLATE, "", "hello", "0912345678", "09 123 456 78", "Date - today", "Khaifa - Ko"]
+
+    while len(corpus) < size:
+        values = {
+            "Gmail": f"user{rng.randrange(10 ** 6)}@gmail.com" if rng.random() < 0.9 else "",
+            "Tele name": rng.choice(names),
+            "Username": f"@user{rng.randrange(1000)}" if rng.random() < 0.8 else "",
+            "Date": f"{rng.randrange(1, 29)}.{rng.randrange(1, 13)}.2025",
+            "Age": str(rng.randrange(18, 60)),
+            "Current work": rng.choice(["Driver", "Seller", "", "Student"]),
+            "Phone number": f"09{rng.randrange(10 ** 9):09d}",
+            "Khaifa": rng.choice(names),
+        }
+        filled = []
+        for line in lines:
+            label = line.split("-")[0].strip()
+            filled.append(line + values[label] if label in values else line)
+        text = "\n".join(filled)
+
+        variant = rng.random()
+        if variant < 0.1:
+            text = text.replace("Khaifa", "Khat")
+        elif variant < 0.2:
+            text = text.replace("Gmail", "Email")
+        elif variant < 0.3:
+            text = text.replace("\n", "\r\n")
+        elif variant < 0.4:
+            text = text.replace(" - ", " – ")
+        elif variant < 0.5:
+            text = "Please check:\n" + text.lower()
+        elif variant < 0.55:
+            text = text.replace("Date        - ", "Date")
+        elif variant < 0.6:
+            text = f"09{rng.randrange(10 ** 9):09d}"
+        corpus.append(text)
+
+    return corpus
+
+
+def check_equivalence(corpus: list) -> None:
+    for text in corpus:
+        report = parse_report(text)
+        expected = legacy_extract(text)
+        actual = report.summary if report else None
+        if actual != expected:
+            raise SystemExit(f"Mismatch for {text!r}:\n  legacy: {expected!r}\n  parser: {actual!r}")
+
+
+def timed(function, corpus: list, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in corpus:
+            function(text)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    corpus = build_corpus(5000)
+    check_equivalence(corpus)
+    print(f"{len(corpus)} messages: parser output matches the legacy extraction")
+
+    # Most messages a group sends are not reports, so those are timed on their own as well.
+    reports = [text for text in corpus if legacy_extract(text) is not None]
+    others = [text for text in corpus if legacy_extract(text) is None]
+    for label, messages in (('all', corpus), ('reports', reports), ('other', others)):
+        total = len(messages) * repeat
+        for name, function in (('legacy', legacy_extract), ('parse_report', parse_report)):
+            seconds = timed(function, messages, repeat)
+            print(f"{label:<8} {name:<13} {total / seconds:>12,.0f} messages/s  {seconds / total * 1e6:>7.2f} us/message")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from telegram import Bot
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# The sends themselves are paced by the bot's rate limiter (the Outbox, see outbox.py);
+# BROADCAST_CONCURRENCY only bounds how many are in flight. A chat is never retried sooner
+# than BROADCAST_PER_CHAT_INTERVAL after its previous attempt.
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '8'))
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv('BROADCAST_PER_CHAT_INTERVAL', '1.1'))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv('BROADCAST_MAX_ATTEMPTS', '4'))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv('BROADCAST_PROGRESS_INTERVAL', '3'))
+
+UNREACHABLE_ERRORS = ('chat not found', 'user not found', 'peer_id_invalid', 'group chat was deactivated')
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+
+
+class FanOut:
+    """Send one text to many chats concurrently, paced by the bot's rate limiter.
+
+    Flood-control (RetryAfter) and transient network errors are retried with backoff; chats
+    that block the bot, were left or no longer exist end up in ``unreachable`` so the caller
+    can drop them. A group that was upgraded to a supergroup is retried under its new id and
+    reported in ``migrated``. Any other error counts the chat as failed; it never ends the
+    broadcast.
+    """
+
+    def __init__(self, bot: Bot, chat_ids: Iterable[int], text: str,
+                 concurrency: int = BROADCAST_CONCURRENCY, rate_limit_args: Any = None) -> None:
+        self.bot = bot
+        self.chat_ids = list(chat_ids)
+        self.text = text
+        self.concurrency = concurrency
+        # Passed on to the bot's rate limiter, e.g. to queue the broadcast behind replies.
+        self.rate_limit_args = rate_limit_args
+        self.sent = 0
+        self.failed = 0
+        self.unreachable: List[int] = []
+        self.migrated: Dict[int, int] = {}
+        self.started = time.monotonic()
+
+    @property
+    def total(self) -> int:
+        return len(self.chat_ids)
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def throughput(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    async def _send(self, chat_id: int) -> None:
+        target = chat_id
+        last_attempt = 0.0
+
+        for attempt in range(BROADCAST_MAX_ATTEMPTS):
+            # Never hit the same chat faster than its own limit, even on retries.
+            wait = last_attempt + BROADCAST_PER_CHAT_INTERVAL - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            last_attempt = time.monotonic()
+
+            try:
+                if self.rate_limit_args is None:
+                    await self.bot.send_message(chat_id=target, text=self.text)
+                else:
+                    await self.bot.send_message(chat_id=target, text=self.text, rate_limit_args=self.rate_limit_args)
+                self.sent += 1
+                return
+            except RetryAfter as e:
+                await asyncio.sleep(retry_after_seconds(e))
+            except ChatMigrated as e:
+                self.migrated[chat_id] = e.new_chat_id
+                target = e.new_chat_id
+            except Forbidden:
+                self.unreachable.append(chat_id)
+                break
+            except BadRequest as e:
+                if any(reason in str(e).lower() for reason in UNREACHABLE_ERRORS):
+                    self.unreachable.append(chat_id)
+                else:
+                    logger.warning("Broadcast to %s failed: %s", chat_id, e)
+                break
+            except NetworkError as e:
+                logger.info("Broadcast to %s attempt %d failed: %s", chat_id, attempt + 1, e)
+                await asyncio.sleep(2 ** attempt)
+            except TelegramError as e:
+                logger.warning("Broadcast to %s failed: %s", chat_id, e)
+                break
+
+        self.failed += 1
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            try:
+                chat_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await self._send(chat_id)
+
+    async def run(self, on_progress: Optional[Callable[['FanOut'], Awaitable[None]]] = None) -> 'FanOut':
+        queue = asyncio.Queue()
+        for chat_id in self.chat_ids:
+            queue.put_nowait(chat_id)
+
+        self.started = time.monotonic()
+        workers = asyncio.gather(*(self._worker(queue) for _ in range(min(self.concurrency, self.total) or 1)))
+
+        while on_progress:
+            try:
+                await asyncio.wait_for(asyncio.shield(workers), timeout=BROADCAST_PROGRESS_INTERVAL)
+                break
+            except asyncio.TimeoutError:
+                await on_progress(self)
+
+        await workers
+        return self
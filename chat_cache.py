@@ -0,0 +1,126 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Iterable, List, NamedTuple, Optional
+from telegram import Bot, Chat
+from telegram.error import TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Titles and names of tracked chats, kept in bot_data['chat_cache'] so admin commands can
+# label chats without one get_chat round trip each. Entries older than CHAT_CACHE_TTL
+# seconds are still shown but refreshed in the background; beyond CHAT_CACHE_SIZE entries
+# the least recently used ones are dropped.
+CHAT_CACHE_TTL = float(os.getenv('CHAT_CACHE_TTL', str(24 * 3600)))
+CHAT_CACHE_SIZE = int(os.getenv('CHAT_CACHE_SIZE', '5000'))
+CHAT_CACHE_REFRESH_CONCURRENCY = int(os.getenv('CHAT_CACHE_REFRESH_CONCURRENCY', '5'))
+CHAT_CACHE_REFRESH_BATCH = int(os.getenv('CHAT_CACHE_REFRESH_BATCH', '50'))
+CHAT_CACHE_REFRESH_INTERVAL = float(os.getenv('CHAT_CACHE_REFRESH_INTERVAL', '900'))
+
+
+class ChatInfo(NamedTuple):
+    chat_type: str
+    name: str
+    fetched_at: float
+
+
+def chat_display_name(chat: Chat) -> str:
+    return chat.title or chat.full_name or str(chat.id)
+
+
+class ChatCache:
+    def __init__(self, ttl: float = CHAT_CACHE_TTL, max_size: int = CHAT_CACHE_SIZE) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries: 'OrderedDict[int, ChatInfo]' = OrderedDict()
+        self._refreshing = set()
+
+    def __getstate__(self) -> tuple:
+        # The set of in-flight refreshes only makes sense for the running process.
+        return self.ttl, self.max_size, self.entries
+
+    def __setstate__(self, state: tuple) -> None:
+        self.ttl, self.max_size, self.entries = state
+        self._refreshing = set()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, chat_id: int) -> Optional[ChatInfo]:
+        info = self.entries.get(chat_id)
+        if info is not None:
+            self.entries.move_to_end(chat_id)
+        return info
+
+    def name(self, chat_id: int, default: Optional[str] = None) -> Optional[str]:
+        info = self.get(chat_id)
+        return info.name if info else default
+
+    def is_fresh(self, chat_id: int, now: Optional[float] = None) -> bool:
+        info = self.entries.get(chat_id)
+        return info is not None and (now or time.time()) - info.fetched_at < self.ttl
+
+    def put(self, chat_id: int, chat_type: str, name: str) -> bool:
+        """Store a chat's name; returns True if it differs from what was cached."""
+        previous = self.entries.get(chat_id)
+        self.entries[chat_id] = ChatInfo(chat_type, name, time.time())
+        self.entries.move_to_end(chat_id)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+        return previous is None or previous.name != name or previous.chat_type != chat_type
+
+    def update_from_chat(self, chat: Chat) -> bool:
+        return self.put(chat.id, chat.type, chat_display_name(chat))
+
+    def discard(self, chat_id: int) -> None:
+        self.entries.pop(chat_id, None)
+
+    def stale(self, chat_ids: Iterable[int]) -> List[int]:
+        now = time.time()
+        return [
+            chat_id for chat_id in chat_ids
+            if chat_id not in self._refreshing and not self.is_fresh(chat_id, now)
+        ]
+
+    async def refresh(self, bot: Bot, chat_ids: Iterable[int],
+                      concurrency: int = CHAT_CACHE_REFRESH_CONCURRENCY,
+                      batch_size: int = CHAT_CACHE_REFRESH_BATCH) -> int:
+        """Fetch the given chats with at most `concurrency` get_chat calls in flight.
+
+        Chats are fetched batch by batch so a refresh of thousands of chats never queues more
+        than one batch of requests at a time. Returns how many entries changed.
+        """
+        chat_ids = self.stale(chat_ids)
+        self._refreshing.update(chat_ids)
+        semaphore = asyncio.Semaphore(concurrency)
+        changed = 0
+
+        async def fetch(chat_id: int) -> bool:
+            async with semaphore:
+                try:
+                    return self.update_from_chat(await bot.get_chat(chat_id=chat_id))
+                except TelegramError as e:
+                    logger.debug("get_chat(%s) failed: %s", chat_id, e)
+                    return False
+                finally:
+                    self._refreshing.discard(chat_id)
+
+        try:
+            for start in range(0, len(chat_ids), batch_size):
+                results = await asyncio.gather(*(fetch(chat_id) for chat_id in chat_ids[start:start + batch_size]))
+                changed += sum(results)
+        finally:
+            self._refreshing.difference_update(chat_ids)
+
+        return changed
+
+
+def get_chat_cache(bot_data: dict) -> ChatCache:
+    cache = bot_data.get('chat_cache')
+    if not isinstance(cache, ChatCache):
+        cache = bot_data['chat_cache'] = ChatCache()
+    return cache
@@ -0,0 +1,105 @@
+import os
+import time
+from typing import Callable, Iterable, List, Optional, Tuple
+from telegram import ChatMember, ChatMemberUpdated
+from chat_cache import get_chat_cache
+
+# The chats the bot can reach: bot_data['users'] (private chats) and bot_data['groups'].
+# A chat is registered on first contact and when the bot is added to it (my_chat_member),
+# and dropped again when the bot is removed, blocked, or has not heard from the chat for
+# CHAT_INACTIVE_DAYS. The day each chat was last seen is kept in
+#   bot_data['chat_seen'] = {chat_id: day number (days since the epoch, UTC)}
+# and changes at most once per chat per day, so only that first update of the day costs a
+# persistence change.
+CHAT_SEEN_KEY = 'chat_seen'
+CHAT_INACTIVE_DAYS = int(os.getenv('CHAT_INACTIVE_DAYS', '180'))
+
+MEMBER_STATUSES = (ChatMember.MEMBER, ChatMember.ADMINISTRATOR, ChatMember.OWNER)
+
+
+def seen_day(now: Optional[float] = None) -> int:
+    return int((now if now is not None else time.time()) // 86400)
+
+
+def chat_kind(chat_type: str) -> str:
+    return 'users' if chat_type == 'private' else 'groups'
+
+
+def is_registered(bot_data: dict, chat_id: int) -> bool:
+    return chat_id in bot_data.get('users', ()) or chat_id in bot_data.get('groups', ())
+
+
+def register_chat(bot_data: dict, chat_id: int, chat_type: str) -> Optional[tuple]:
+    """Add a chat to the registry; returns the change to record, or None if it was known."""
+    chats = bot_data.setdefault(chat_kind(chat_type), set())
+    if chat_id in chats:
+        return None
+    chats.add(chat_id)
+    return ('chat', chat_id, chat_type)
+
+
+def touch_chat(bot_data: dict, chat_id: int, day: Optional[int] = None) -> Optional[tuple]:
+    """Note that the chat was active today; returns a change on the first call of the day."""
+    day = seen_day() if day is None else day
+    seen = bot_data.setdefault(CHAT_SEEN_KEY, {})
+    if seen.get(chat_id) == day:
+        return None
+    seen[chat_id] = day
+    return ('seen', ((chat_id, day),))
+
+
+def drop_chat(bot_data: dict, chat_id: int) -> tuple:
+    bot_data.get('users', set()).discard(chat_id)
+    bot_data.get('groups', set()).discard(chat_id)
+    bot_data.get(CHAT_SEEN_KEY, {}).pop(chat_id, None)
+    get_chat_cache(bot_data).discard(chat_id)
+    return ('drop_chat', chat_id)
+
+
+def is_member(chat_member: ChatMember) -> bool:
+    if chat_member.status == ChatMember.RESTRICTED:
+        return bool(getattr(chat_member, 'is_member', False))
+    return chat_member.status in MEMBER_STATUSES
+
+
+def membership_changed(update: ChatMemberUpdated) -> Optional[bool]:
+    """True if the bot joined (or was unblocked), False if it left (or was blocked), None if
+    its membership did not change."""
+    was_member = is_member(update.old_chat_member)
+    now_member = is_member(update.new_chat_member)
+    if was_member == now_member:
+        return None
+    return now_member
+
+
+def unseen_chats(bot_data: dict, owns: Optional[Callable[[int], bool]] = None) -> List[int]:
+    """Registered chats without a last-seen day, e.g. those registered before it was kept."""
+    seen = bot_data.get(CHAT_SEEN_KEY, {})
+    return [
+        chat_id
+        for chat_id in list(bot_data.get('users', ())) + list(bot_data.get('groups', ()))
+        if chat_id not in seen and (owns is None or owns(chat_id))
+    ]
+
+
+def inactive_chats(bot_data: dict, today: Optional[int] = None, days: int = CHAT_INACTIVE_DAYS) -> List[int]:
+    cutoff = (seen_day() if today is None else today) - days
+    return [chat_id for chat_id, day in bot_data.get(CHAT_SEEN_KEY, {}).items() if day < cutoff]
+
+
+def active_since(bot_data: dict, day: int, chat_ids: Iterable[int]) -> int:
+    # One pass over the last-seen days rather than a lookup per chat, which for a shard
+    # worker's shared chat_seen would be one query each.
+    active = {chat_id for chat_id, seen in bot_data.get(CHAT_SEEN_KEY, {}).items() if seen >= day}
+    return sum(1 for chat_id in chat_ids if chat_id in active)
+
+
+def stamp_unseen(bot_data: dict, chat_ids: Iterable[int], day: Optional[int] = None) -> Tuple[tuple, ...]:
+    # Chats with no last-seen day get today, so their inactivity counts from now.
+    day = seen_day() if day is None else day
+    seen = bot_data.setdefault(CHAT_SEEN_KEY, {})
+    stamped = []
+    for chat_id in chat_ids:
+        seen[chat_id] = day
+        stamped.append((chat_id, day))
+    return tuple(stamped)
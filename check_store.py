@@ -0,0 +1,363 @@
+import os
+import re
+from array import array
+from bisect import bisect_left
+from collections import deque
+from datetime import date
+from typing import Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+# Phone numbers are packed into one unsigned 64-bit integer as int('1' + digits); the leading
+# '1' keeps leading zeros ("09...") distinct. 18 digits is the most that still fits.
+MAX_PACKED_DIGITS = 18
+MIN_PENDING = 4096
+# Bumped whenever BloomFilter hashes keys differently; a pickled CheckStore whose filter
+# has another version rebuilds it on load.
+BLOOM_VERSION = 2
+
+NUMBER_NOISE_PATTERN = re.compile(r'[\s\n\-\(\)\+]+')
+# Separators between numbers in a bulk check: one number per line, or comma/semicolon/tab
+# separated (CSV cells, pasted spreadsheet rows).
+NUMBER_LIST_SEPARATORS = re.compile(r'[\n\r,;\t]+')
+# A message that normalizes to at least this many digits is treated as a number to check.
+MIN_NUMBER_DIGITS = 7
+# /chk reports how often a number was checked in the last CHECK_WINDOW_DAYS business days,
+# next to its lifetime total.
+CHECK_WINDOW_DAYS = int(os.getenv('CHECK_WINDOW_DAYS', '30'))
+
+
+def normalize_number(text: str) -> str:
+    return NUMBER_NOISE_PATTERN.sub('', text).strip()
+
+
+def as_number(text: str) -> Optional[str]:
+    number = normalize_number(text)
+    return number if number.isdigit() and len(number) >= MIN_NUMBER_DIGITS else None
+
+
+def split_numbers(text: str, strict: bool = True) -> Optional[List[str]]:
+    """The numbers in a pasted list, in order of appearance.
+
+    Entries are separated by newlines, commas, semicolons or tabs; an entry of several
+    space-separated numbers counts as several, otherwise its spaces are part of the number
+    ("09 123 456 789"). With strict=True any entry that is not a number makes the whole text
+    not a list (None), so ordinary messages are never mistaken for one; with strict=False such
+    entries (headers, names in a CSV) are skipped.
+    """
+    numbers = []
+    for entry in NUMBER_LIST_SEPARATORS.split(text):
+        if not entry.strip():
+            continue
+        parts = entry.split()
+        candidates = [as_number(part) for part in parts] if len(parts) > 1 else []
+        if candidates and all(candidates):
+            numbers.extend(candidates)
+            continue
+        number = as_number(entry)
+        if number:
+            numbers.append(number)
+        elif strict:
+            return None
+    return numbers
+
+
+def pack_number(number: str) -> Optional[int]:
+    if number.isascii() and number.isdigit() and len(number) <= MAX_PACKED_DIGITS:
+        return int('1' + number)
+    return None
+
+
+def unpack_number(key: int) -> str:
+    return str(key)[1:]
+
+
+class BloomFilter:
+    # Three probes by double hashing, h1 + i * h2, with h1 and h2 from two 64-bit
+    # multiplicative hashes whose high halves are folded in (the bare products are linearly
+    # related and leave the probes correlated). Every probe can reach every bit however large
+    # the filter is; with the default 12 bits per key that is roughly a 1% false-positive rate.
+    def __init__(self, capacity: int, bits_per_key: int = 12) -> None:
+        self.capacity = max(capacity, 1024)
+        self.size = self.capacity * bits_per_key
+        self.bits = bytearray((self.size + 7) // 8)
+        self.version = BLOOM_VERSION
+
+    def add(self, key: int) -> None:
+        h1 = (key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        h1 ^= h1 >> 32
+        h2 = (key * 0xC2B2AE3D27D4EB4F) & 0xFFFFFFFFFFFFFFFF
+        h2 = (h2 ^ (h2 >> 32)) | 1
+        bits, size = self.bits, self.size
+        for position in (h1 % size, (h1 + h2) % size, (h1 + 2 * h2) % size):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: int) -> bool:
+        h1 = (key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        h1 ^= h1 >> 32
+        bits, size = self.bits, self.size
+        position = h1 % size
+        if not bits[position >> 3] & (1 << (position & 7)):
+            return False
+        h2 = (key * 0xC2B2AE3D27D4EB4F) & 0xFFFFFFFFFFFFFFFF
+        h2 = (h2 ^ (h2 >> 32)) | 1
+        position = (h1 + h2) % size
+        if not bits[position >> 3] & (1 << (position & 7)):
+            return False
+        position = (h1 + 2 * h2) % size
+        return bool(bits[position >> 3] & (1 << (position & 7)))
+
+
+class CheckStore:
+    """Counter of how often each number was checked with /chk.
+
+    Numbers are stored as packed 64-bit keys in a sorted array with a parallel array of
+    counts. New numbers go into a small pending dict that is merged into the arrays once
+    it grows past 1/8 of them, and a Bloom filter in front answers the common
+    "never seen before" lookup without touching the arrays. Input that is not a packable
+    number is kept in a plain dict.
+    """
+
+    def __init__(self, capacity: int = 0) -> None:
+        self.keys = array('Q')
+        self.counts = array('I')
+        self.pending = {}
+        self.other = {}
+        self.bloom = BloomFilter(capacity * 2)
+
+    @classmethod
+    def from_items(cls, items: Iterable[Tuple[str, int]]) -> 'CheckStore':
+        items = list(items)
+        store = cls(capacity=len(items))
+        for number, count in items:
+            number = normalize_number(number) or number
+            store[number] = store.get(number) + count
+        store._merge()
+        return store
+
+    def __len__(self) -> int:
+        return len(self.keys) + len(self.pending) + len(self.other)
+
+    def _index(self, key: int) -> int:
+        # Position of key in the sorted arrays, or -1. The Bloom filter answers most misses.
+        if key not in self.bloom:
+            return -1
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return index
+        return -1
+
+    def get(self, number: str, default: int = 0) -> int:
+        key = pack_number(number)
+        if key is None:
+            return self.other.get(number, default)
+
+        count = self.pending.get(key)
+        if count is not None:
+            return count
+
+        index = self._index(key)
+        return self.counts[index] if index >= 0 else default
+
+    def __getitem__(self, number: str) -> int:
+        return self.get(number)
+
+    def __setitem__(self, number: str, count: int) -> None:
+        self._update(number, count, increment=False)
+
+    def increment(self, number: str) -> int:
+        return self._update(number, 1, increment=True)
+
+    def increment_many(self, numbers: Iterable[str]) -> List[int]:
+        return [self._update(number, 1, increment=True) for number in numbers]
+
+    def _update(self, number: str, value: int, increment: bool) -> int:
+        key = pack_number(number)
+        if key is None:
+            count = self.other.get(number, 0) + value if increment else value
+            self.other[number] = count
+            return count
+
+        pending = self.pending
+        if key in pending:
+            count = pending[key] + value if increment else value
+            pending[key] = count
+            return count
+
+        index = self._index(key)
+        if index >= 0:
+            count = self.counts[index] + value if increment else value
+            self.counts[index] = count
+            return count
+
+        self.bloom.add(key)
+        pending[key] = value
+        if len(pending) > max(MIN_PENDING, len(self.keys) >> 3):
+            self._merge()
+        return value
+
+    def _merge(self) -> None:
+        if not self.pending:
+            return
+
+        keys, counts = self.keys, self.counts
+        merged_keys, merged_counts = array('Q'), array('I')
+        start = 0
+
+        # Copy runs of the existing arrays with slice extends (memcpy) and only step through
+        # the pending keys in Python.
+        for key in sorted(self.pending):
+            index = bisect_left(keys, key, start)
+            merged_keys.extend(keys[start:index])
+            merged_counts.extend(counts[start:index])
+            merged_keys.append(key)
+            merged_counts.append(self.pending[key])
+            start = index
+
+        merged_keys.extend(keys[start:])
+        merged_counts.extend(counts[start:])
+
+        self.keys, self.counts = merged_keys, merged_counts
+        self.pending = {}
+
+        if len(self.keys) > self.bloom.capacity:
+            self._rebuild_bloom()
+
+    def _rebuild_bloom(self) -> None:
+        bloom = BloomFilter(len(self.keys) * 2)
+        for key in self.keys:
+            bloom.add(key)
+        for key in self.pending:
+            bloom.add(key)
+        self.bloom = bloom
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        if getattr(self.bloom, 'version', None) != BLOOM_VERSION:
+            self._rebuild_bloom()
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        for key, count in zip(self.keys, self.counts):
+            yield unpack_number(key), count
+        for key, count in self.pending.items():
+            yield unpack_number(key), count
+        yield from self.other.items()
+
+
+class CheckWindow:
+    """Per-day /chk counts over the last `days` business days.
+
+    A ring of day buckets, oldest first, each a {number: count} dict. A new day appends a
+    bucket and drops the ones that left the window from the other end, one popleft per
+    day, so memory follows the checks inside the window rather than all history. A
+    number's count in the window is the sum over at most `days` buckets.
+    """
+
+    def __init__(self, days: int = CHECK_WINDOW_DAYS) -> None:
+        self.days = days
+        self.buckets: Deque[Tuple[int, Dict[str, int]]] = deque()
+
+    @staticmethod
+    def ordinal(day: str) -> int:
+        return date.fromisoformat(day).toordinal()
+
+    def _expire(self, ordinal: int) -> None:
+        buckets = self.buckets
+        while buckets and buckets[0][0] <= ordinal - self.days:
+            buckets.popleft()
+
+    def _bucket(self, day: str) -> Dict[str, int]:
+        ordinal = self.ordinal(day)
+        buckets = self.buckets
+        if buckets and buckets[-1][0] == ordinal:
+            return buckets[-1][1]
+
+        if not buckets or buckets[-1][0] < ordinal:
+            buckets.append((ordinal, {}))
+            self._expire(ordinal)
+            return buckets[-1][1]
+
+        # A day before the newest one, e.g. restored out of order: find or insert it.
+        if ordinal <= buckets[-1][0] - self.days:
+            return {}
+        for index, (bucket_ordinal, counts) in enumerate(buckets):
+            if bucket_ordinal == ordinal:
+                return counts
+            if bucket_ordinal > ordinal:
+                buckets.insert(index, (ordinal, {}))
+                return buckets[index][1]
+        return {}
+
+    def add_many(self, numbers: Iterable[str], day: str) -> List[Tuple[int, int]]:
+        """Count a check of each number on `day`; returns (count that day, count in the window)."""
+        bucket = self._bucket(day)
+        results = []
+        for number in numbers:
+            count = bucket.get(number, 0) + 1
+            bucket[number] = count
+            results.append((count, self.recent(number, day)))
+        return results
+
+    def add(self, number: str, day: str) -> Tuple[int, int]:
+        return self.add_many((number,), day)[0]
+
+    def set(self, day: str, number: str, count: int) -> None:
+        self._bucket(day)[number] = count
+
+    def recent(self, number: str, day: str) -> int:
+        self._expire(self.ordinal(day))
+        return sum(counts.get(number, 0) for _, counts in self.buckets)
+
+    def __len__(self) -> int:
+        return sum(len(counts) for _, counts in self.buckets)
+
+    def items(self) -> Iterator[Tuple[str, str, int]]:
+        for ordinal, counts in self.buckets:
+            day = date.fromordinal(ordinal).isoformat()
+            for number, count in counts.items():
+                yield day, number, count
+
+
+def check_window_cutoff(day: str, days: int = CHECK_WINDOW_DAYS) -> str:
+    """The newest day that is outside the window ending on `day`."""
+    return date.fromordinal(CheckWindow.ordinal(day) - days).isoformat()
+
+
+class CheckResult(NamedTuple):
+    number: str
+    total: int
+    recent: int
+    today: int
+
+
+def check_numbers(bot_data: dict, numbers: List[str], day: str) -> Tuple[List[CheckResult], tuple]:
+    """Count a check of each number: its lifetime total and its business-day bucket.
+
+    Returns the results and the ('checked', ...) change that records them.
+    """
+    totals = get_check_store(bot_data).increment_many(numbers)
+    window = get_check_window(bot_data).add_many(numbers, day)
+    results = [
+        CheckResult(number, total, recent, today)
+        for number, total, (today, recent) in zip(numbers, totals, window)
+    ]
+    return results, ('checked', day, tuple((result.number, result.total, result.today) for result in results))
+
+
+def get_check_window(bot_data: dict) -> CheckWindow:
+    # Shard workers hold a shared_store.SharedCheckWindow instead.
+    window = bot_data.get('check_window')
+    if window is None:
+        window = bot_data['check_window'] = CheckWindow()
+    elif isinstance(window, CheckWindow):
+        window.days = CHECK_WINDOW_DAYS
+    return window
+
+
+def get_check_store(bot_data: dict) -> CheckStore:
+    # Older persistence files hold check_records as a plain {number: count} dict; convert it
+    # the first time it is touched. Shard workers hold a shared_store.SharedCheckStore, which
+    # offers the same interface.
+    store = bot_data.get('check_records')
+    if store is None or isinstance(store, dict):
+        store = CheckStore.from_items((store or {}).items())
+        bot_data['check_records'] = store
+    return store
@@ -0,0 +1,141 @@
+import os
+import csv
+import io
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Commission = amount / COMMISSION_DIVISOR * COMMISSION_BASE_RATE * <type rate> * COMMISSION_MULTIPLIER.
+# The type rates can be overridden with COMMISSION_RATES="killer=0.45,deposit=0.3,m1=0.25";
+# new types added there work everywhere, with their key as label.
+COMMISSION_DIVISOR = float(os.getenv('COMMISSION_DIVISOR', '1600'))
+COMMISSION_BASE_RATE = float(os.getenv('COMMISSION_BASE_RATE', '0.04'))
+COMMISSION_MULTIPLIER = float(os.getenv('COMMISSION_MULTIPLIER', '4.7'))
+DEFAULT_COMMISSION_RATES = 'killer=0.45,deposit=0.3,m1=0.25'
+COMMISSION_LABELS = {'killer': 'Killer', 'deposit': 'Deposit (M2)', 'm1': 'M1'}
+COMMISSION_ALIASES = {'m2': 'deposit', 'dep': 'deposit', 'kill': 'killer'}
+# A cell of a pasted row: an amount written with spaces as thousands separators ("12 000",
+# "1 250 000") or any run of non-space characters.
+ROW_CELL_PATTERN = re.compile(r'\d{1,3}(?: \d{3})+(?!\S)|\S+')
+
+
+def parse_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for item in spec.split(','):
+        kind, _, rate = item.partition('=')
+        if kind.strip() and rate.strip():
+            rates[kind.strip().lower()] = float(rate)
+    return rates
+
+
+COMMISSION_RATES = parse_rates(os.getenv('COMMISSION_RATES', DEFAULT_COMMISSION_RATES))
+
+
+def commission_label(kind: str) -> str:
+    return COMMISSION_LABELS.get(kind, kind.upper())
+
+
+def commission_factor(kind: str) -> float:
+    """What one unit of amount earns for `kind`; a commission is amount * factor."""
+    return COMMISSION_BASE_RATE * COMMISSION_RATES[kind] * COMMISSION_MULTIPLIER / COMMISSION_DIVISOR
+
+
+def commission_type(token: str) -> Optional[str]:
+    token = token.strip().lower().strip('()')
+    token = COMMISSION_ALIASES.get(token, token)
+    return token if token in COMMISSION_RATES else None
+
+
+def parse_amount(token: str) -> Optional[float]:
+    try:
+        return float(token.replace(',', '').replace(' ', ''))
+    except ValueError:
+        return None
+
+
+class CommissionRow(NamedTuple):
+    kind: str
+    amount: float
+    commission: float
+
+
+class CommissionTotal(NamedTuple):
+    count: int
+    amount: float
+    commission: float
+
+
+def parse_commission_rows(rows: Iterable[List[str]], kind: Optional[str] = None) -> Tuple[List[Tuple[str, float]], int]:
+    """(type, amount) pairs from table rows, plus the number of rows that were skipped.
+
+    A row may hold a type and any number of amounts ("killer 12000 8000"). Amounts without a
+    type on their row take the last type seen, so a bare type on its own row works as a
+    heading for the rows below it, and `kind` is the type before any heading. Rows with
+    neither (headers, notes) are skipped.
+    """
+    items = []
+    skipped = 0
+
+    for row in rows:
+        row_kind = None
+        amounts = []
+        for cell in row:
+            cell_kind = commission_type(cell)
+            if cell_kind:
+                row_kind = cell_kind
+                continue
+            amount = parse_amount(cell)
+            if amount is not None:
+                amounts.append(amount)
+
+        if row_kind and not amounts:
+            kind = row_kind
+        elif amounts and (row_kind or kind):
+            items.extend((row_kind or kind, amount) for amount in amounts)
+        elif any(cell.strip() for cell in row):
+            skipped += 1
+
+    return items, skipped
+
+
+def text_rows(text: str) -> List[List[str]]:
+    # Whitespace separates cells, except a single space between digit groups of three, which
+    # is a thousands separator like a comma: "killer 12 000 8000" is two amounts, 12000 and 8000.
+    return [ROW_CELL_PATTERN.findall(line) for line in text.splitlines()]
+
+
+def csv_rows(text: str) -> List[List[str]]:
+    return list(csv.reader(io.StringIO(text)))
+
+
+def calculate_batch(items: List[Tuple[str, float]]) -> Tuple[List[CommissionRow], Dict[str, CommissionTotal]]:
+    """Commission of every (type, amount) pair and the totals per type.
+
+    Each type's factor is worked out once, so every row costs a single multiplication.
+    """
+    factors = {kind: commission_factor(kind) for kind in {kind for kind, _ in items}}
+    rows = [CommissionRow(kind, amount, amount * factors[kind]) for kind, amount in items]
+
+    totals = {}
+    for row in rows:
+        count, amount, commission = totals.get(row.kind, (0, 0.0, 0.0))
+        totals[row.kind] = CommissionTotal(count + 1, amount + row.amount, commission + row.commission)
+    return rows, totals
+
+
+def format_totals(totals: Dict[str, CommissionTotal]) -> str:
+    lines = [
+        f"{commission_label(kind)}: {total.count} rows, amount {total.amount:,.2f}, commission {total.commission:,.4f}"
+        for kind, total in sorted(totals.items())
+    ]
+    if len(totals) > 1:
+        lines.append(f"Total commission: {sum(total.commission for total in totals.values()):,.4f}")
+    return "\n".join(lines)
+
+
+def write_batch_csv(rows: List[CommissionRow]) -> bytes:
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['row', 'type', 'amount', 'commission'])
+    for number, row in enumerate(rows, 1):
+        writer.writerow([number, commission_label(row.kind), f"{row.amount:.2f}", f"{row.commission:.4f}"])
+    return output.getvalue().encode('utf-8-sig')
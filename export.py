@@ -0,0 +1,154 @@
+import os
+import csv
+import asyncio
+import tempfile
+from datetime import datetime
+from typing import List, Optional, Tuple
+from archive import archived_days, load_archived_day
+from report_store import DayReports, ReportRecord, get_day_reports
+
+try:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+except ImportError:
+    Workbook = WriteOnlyCell = None
+
+# /export writes a chat's reports to a temporary CSV or XLSX file one row at a time and
+# sends it as a document. Only one day of reports is held in memory at once, however long
+# the range; days come from group_data while they are live and from the archive after.
+EXPORT_MAX_DAYS = int(os.getenv('EXPORT_MAX_DAYS', '366'))
+# Telegram does not accept bot uploads above 50 MB.
+EXPORT_MAX_BYTES = 50 * 1024 * 1024
+EXPORT_FORMATS = ('csv', 'xlsx')
+EXPORT_COLUMNS = ('day', 'khaifa', 'date', 'contact', 'tele_name', 'username', 'age', 'current_work', 'phone')
+DAY_FORMAT = '%Y-%m-%d'
+ALL_DAYS_START = '0000-00-00'
+# Report fields are typed by members. A spreadsheet app opening the export would evaluate a
+# cell starting with one of these as a formula; in CSV such cells are prefixed with a quote,
+# in XLSX they are stored as text.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+EXPORT_USAGE = (
+    "Usage: /export [YYYY-MM-DD | YYYY-MM-DD YYYY-MM-DD | YYYY-MM-DD..YYYY-MM-DD | all] [csv|xlsx]\n"
+    "Without a date, today's data is exported."
+)
+
+
+def xlsx_available() -> bool:
+    return Workbook is not None
+
+
+def parse_export_args(args: List[str], today: str) -> Tuple[str, str, str]:
+    """(first day, last day, format) from /export arguments.
+
+    Accepts a day (2025-01-31), a range as two days or as 2025-01-01..2025-01-31, or 'all',
+    plus an optional 'csv' or 'xlsx' in any position. No range means today. Raises
+    ValueError on bad input, including more dates than a range has.
+    """
+    fmt = 'csv'
+    dates = []
+
+    for arg in (arg.lower() for arg in args):
+        if arg in EXPORT_FORMATS:
+            fmt = arg
+        else:
+            dates.append(arg)
+
+    if not dates:
+        return today, today, fmt
+    if dates == ['all']:
+        return ALL_DAYS_START, today, fmt
+    if len(dates) > 2 or 'all' in dates or (len(dates) == 2 and any('..' in date for date in dates)):
+        raise ValueError("expected one day, one range or 'all'")
+
+    first, _, last = '..'.join(dates).partition('..')
+    first_day, last_day = sorted(datetime.strptime(day, DAY_FORMAT) for day in (first, last or first))
+    if (last_day - first_day).days >= EXPORT_MAX_DAYS:
+        raise ValueError(f"ranges are limited to {EXPORT_MAX_DAYS} days")
+    return first_day.strftime(DAY_FORMAT), last_day.strftime(DAY_FORMAT), fmt
+
+
+def export_label(start: str, end: str) -> str:
+    if start == ALL_DAYS_START:
+        return 'all'
+    return start if start == end else f"{start}..{end}"
+
+
+def export_sources(bot_data: dict, chat_id: str, start: str, end: str) -> List[Tuple[str, Optional[Tuple[ReportRecord, ...]]]]:
+    """The days of the range that have reports, oldest first.
+
+    Live days come with a snapshot of their records, taken on the event loop so the export
+    can be written on a worker thread while handlers keep adding reports. Archived days come
+    with None and are read from the archive by the writer, one at a time.
+    """
+    live = bot_data.get('group_data', {}).get(chat_id, {})
+    days = sorted(day for day in set(archived_days(chat_id)) | set(live) if start <= day <= end)
+
+    sources = []
+    for day in days:
+        day_reports = get_day_reports(bot_data, chat_id, day) if day in live else None
+        sources.append((day, tuple(day_reports) if day_reports is not None else None))
+    return sources
+
+
+def csv_cell(value: str) -> str:
+    return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+
+def xlsx_cell(sheet, value: str):
+    cell = WriteOnlyCell(sheet, value)
+    # openpyxl turns any string starting with '=' into a formula.
+    cell.data_type = 's'
+    return cell
+
+
+def iter_rows(chat_id: str, sources):
+    for day, records in sources:
+        day_reports = DayReports(records) if records is not None else load_archived_day(chat_id, day)
+        if not day_reports:
+            continue
+        # Within a day rows are grouped by Khaifa, in the order /showdata uses.
+        for _, group in day_reports.grouped():
+            for record in group:
+                yield (day, record.khaifa, record.date, record.contact, record.tele_name,
+                       record.username, record.age, record.current_work, record.phone)
+
+
+def write_export(path: str, fmt: str, chat_id: str, sources) -> int:
+    rows = 0
+
+    if fmt == 'xlsx':
+        # write_only streams rows to the file instead of building the sheet in memory.
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('reports')
+        sheet.append(EXPORT_COLUMNS)
+        for row in iter_rows(chat_id, sources):
+            sheet.append([xlsx_cell(sheet, value) for value in row])
+            rows += 1
+        workbook.save(path)
+        return rows
+
+    # utf-8-sig so spreadsheet apps recognise the encoding of Burmese names.
+    with open(path, 'w', newline='', encoding='utf-8-sig') as file:
+        writer = csv.writer(file)
+        writer.writerow(EXPORT_COLUMNS)
+        for row in iter_rows(chat_id, sources):
+            writer.writerow([csv_cell(value) for value in row])
+            rows += 1
+    return rows
+
+
+async def build_export(bot_data: dict, chat_id: str, start: str, end: str, fmt: str) -> Tuple[str, int]:
+    """Write the export to a temporary file; returns its path and the number of rows.
+
+    The caller removes the file once it has been sent.
+    """
+    sources = export_sources(bot_data, chat_id, start, end)
+
+    handle, path = tempfile.mkstemp(prefix='export_', suffix=f'.{fmt}')
+    os.close(handle)
+    try:
+        rows = await asyncio.to_thread(write_export, path, fmt, chat_id, sources)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, rows
@@ -1,20 +1,49 @@
 import os
+import io
+import csv
+import html
+import asyncio
 from telegram.ext import (
-    Application, CommandHandler, MessageHandler,
-    CallbackQueryHandler, ConversationHandler,
-    PicklePersistence,
+    Application, ChatMemberHandler, CommandHandler, MessageHandler,
+    CallbackQueryHandler, ConversationHandler, TypeHandler,
     filters
 )
 from telegram import (
-    Update, InlineKeyboardButton, InlineKeyboardMarkup,
+    Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile,
     KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
 )
 from telegram.ext import CallbackContext
 from datetime import datetime, time, timedelta
-import re
 import pytz
 import logging
-from web_server import keep_alive
+from web_server import BOT_MODE, WebServer, add_monitoring_routes, attach_to_polling, run_webhook
+from metrics import TimedHTTPXRequest, instrument_handlers
+from update_processor import build_update_processor
+from sharding import SHARD_WORKERS, run_sharded, shard_of
+import perf
+from storage import build_persistence, mark_dirty
+from check_store import CHECK_WINDOW_DAYS, CheckResult, check_numbers, get_check_store, normalize_number, split_numbers
+from report_parser import MISSING, REPORT_TEMPLATE, parse_report
+from report_store import PAGE_LIMIT, ReportRecord, get_day_reports
+from report_index import describe_key, get_report_index
+from archive import archive_finished_days, prune_archive, remove_chat_archive
+from broadcast import FanOut
+from outbox import ADMIN, BULK, Outbox, queue_message, queue_reply
+from rollups import (
+    REPORT_MAX_DAYS, ROLLUPS_BUILT_KEY, add_to_rollup, count_records, day_rollup_counts, drop_chat_rollups,
+    drop_day_rollup, iter_archived_rollups, set_day_rollup, summarize
+)
+from commission import (
+    COMMISSION_DIVISOR, COMMISSION_MULTIPLIER, COMMISSION_RATES, calculate_batch, commission_factor,
+    commission_label, commission_type, csv_rows, format_totals, parse_amount, parse_commission_rows,
+    text_rows, write_batch_csv
+)
+from export import EXPORT_MAX_BYTES, EXPORT_USAGE, build_export, export_label, parse_export_args, xlsx_available
+from chat_cache import CHAT_CACHE_REFRESH_INTERVAL, get_chat_cache
+from chat_registry import (
+    CHAT_INACTIVE_DAYS, active_since, drop_chat, inactive_chats, is_registered, membership_changed,
+    register_chat, seen_day, stamp_unseen, touch_chat, unseen_chats
+)
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -24,7 +53,11 @@ logging.basicConfig(
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("httpcore").setLevel(logging.WARNING)
 
+logger = logging.getLogger(__name__)
+
 TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+# Point the bot at another Bot API server (a local one, or a fake for testing).
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
 
 # --- MODIFICATION: Updated ADMIN_ID to ADMIN_IDS list ---
 # Add all authorized Telegram User IDs to this list.
@@ -37,27 +70,19 @@ BROADCAST_SELECT_CHAT = 10
 BROADCAST_AWAITING_MESSAGE = 11
 BROADCAST_CONFIRMATION = 12
 
-REPORT_TEMPLATE = (
-    "Gmail        - \n"
-    "  \n"
-    "Tele name    - \n"
-    "    \n"
-    "Username    - \n"
-    "    \n"
-    "Date        - \n"
-    "    \n"
-    "Age         - \n"
-    "    \n"
-    "Current work - \n"
-    "    \n"
-    "Phone number      - \n"
-    "\n"
-    "Khaifa - "
-)
+# Fan-out targets offered on top of the single-chat buttons in /broadcast.
+BROADCAST_GROUP_TARGETS = {
+    'all_users': "👤 All Users",
+    'all_groups': "👥 All Groups",
+    'all': "📢 All Users + Groups",
+}
 
 def get_yangon_tz() -> pytz.timezone:
     return pytz.timezone('Asia/Yangon')
 
+# The business day rolls over at 18:30 Yangon time.
+DAY_CUT_OFF_TIME = time(hour=18, minute=30, second=0)
+
 def get_data_key() -> str:
     try:
         tz = get_yangon_tz()
@@ -65,9 +90,7 @@ def get_data_key() -> str:
     except Exception:
         now = datetime.now()
 
-    cut_off_time = time(hour=18, minute=30, second=0)
-
-    if now.time() < cut_off_time:
+    if now.time() < DAY_CUT_OFF_TIME:
         work_day = now.date() - timedelta(days=1)
     else:
         work_day = now.date()
@@ -76,25 +99,81 @@ def get_data_key() -> str:
 
 get_today_key = get_data_key
 
-async def save_chat_id(chat_id: int, context: CallbackContext, chat_type: str) -> None:
-    if 'users' not in context.application.bot_data:
-        context.application.bot_data['users'] = set()
-    if 'groups' not in context.application.bot_data:
-        context.application.bot_data['groups'] = set()
+def mark_changes(context: CallbackContext, *changes) -> None:
+    # Registry helpers return None when nothing changed.
+    for change in changes:
+        if change:
+            mark_dirty(context, change)
+
+def note_group_data(bot_data: dict, chat_id: str) -> None:
+    # In a shard worker, publishes whether the chat has reports, so /listgroups on any
+    # worker can list the groups with data of every shard.
+    data_chats = bot_data.get('data_chats')
+    if data_chats is not None:
+        data_chats.set(int(chat_id), bool(bot_data.get('group_data', {}).get(chat_id)))
+
+async def remember_chat(update: Update, context: CallbackContext) -> None:
+    # Runs before every other handler: registers the chat on first contact, notes it as seen
+    # today and keeps its cached title/name current, all without a persistence change unless
+    # something actually changed.
+    chat = update.effective_chat
+    if not chat:
+        return
+    bot_data = context.application.bot_data
+    if get_chat_cache(bot_data).update_from_chat(chat):
+        mark_dirty(context)
+    if update.my_chat_member:
+        # Joins and removals are handled by chat_member_updated.
+        return
+    if chat.type in ('private', 'group', 'supergroup'):
+        mark_changes(context, register_chat(bot_data, chat.id, chat.type))
+    mark_changes(context, touch_chat(bot_data, chat.id))
+
+async def chat_member_updated(update: Update, context: CallbackContext) -> None:
+    # The bot was added to or removed from a group, or a user blocked/unblocked it.
+    member_update = update.my_chat_member
+    joined = membership_changed(member_update)
+    if joined is None:
+        return
+    bot_data = context.application.bot_data
+    chat = member_update.chat
+    if joined:
+        mark_changes(context, register_chat(bot_data, chat.id, chat.type), touch_chat(bot_data, chat.id))
+        logger.info("Registered chat %s (%s)", chat.id, chat.type)
+    elif is_registered(bot_data, chat.id):
+        mark_dirty(context, drop_chat(bot_data, chat.id))
+        logger.info("Dropped chat %s: bot is no longer a member", chat.id)
+
+async def chat_migrated(update: Update, context: CallbackContext) -> None:
+    # A group became a supergroup; it carries on under its new id.
+    message = update.effective_message
+    bot_data = context.application.bot_data
+    if message.migrate_to_chat_id and is_registered(bot_data, message.chat_id):
+        mark_changes(
+            context,
+            drop_chat(bot_data, message.chat_id),
+            register_chat(bot_data, message.migrate_to_chat_id, 'supergroup'),
+            touch_chat(bot_data, message.migrate_to_chat_id),
+        )
 
-    if chat_type == 'private' and chat_id not in context.application.bot_data['users']:
-        context.application.bot_data['users'].add(chat_id)
-    elif chat_type in ['group', 'supergroup'] and chat_id not in context.application.bot_data['groups']:
-        context.application.bot_data['groups'].add(chat_id)
+async def refresh_chat_cache(context: CallbackContext, chat_ids) -> None:
+    changed = await get_chat_cache(context.application.bot_data).refresh(context.application.bot, chat_ids)
+    if changed:
+        mark_dirty(context)
 
-    if context.application.persistence:
-        await context.application.persistence.flush()
+def schedule_chat_cache_refresh(context: CallbackContext, chat_ids) -> None:
+    stale = get_chat_cache(context.application.bot_data).stale(chat_ids)
+    if stale:
+        context.application.create_task(refresh_chat_cache(context, stale))
+
+async def chat_cache_refresh_job(context: CallbackContext) -> None:
+    bot_data = context.application.bot_data
+    await refresh_chat_cache(context, list(bot_data.get('users', set())) + list(bot_data.get('groups', set())))
 
 async def start(update: Update, context: CallbackContext) -> None:
     await main_menu_command(update, context)
 
 async def help_command(update: Update, context: CallbackContext) -> None:
-    await save_chat_id(update.effective_chat.id, context, update.effective_chat.type)
 
     await update.message.reply_text(
         'Bot commands and functions:\n\n'
@@ -104,9 +183,13 @@ async def help_command(update: Update, context: CallbackContext) -> None:
         '\n**User Commands (Menu Buttons):**\n'
         '• /form - Display the report submission template\n'
         '• /comm - Commission calculator\n'
+        '• /commbatch - Commission for many amounts at once (rows of <type> <amount>)\n'
         '• /chk <number> - Check and track number usage\n'
+        '• /chk with many numbers, one per line (or a .txt/.csv file captioned /chk) - Bulk check\n'
         '• /showdata - Show today\'s collected data\n'
         '• /cleardata - Clear today\'s collected data\n'
+        '• /export [date|from to|all] [csv|xlsx] - Download collected data as a file\n'
+        '• /report <from> <to> - Report totals per Khaifa and per day (dates as YYYY-MM-DD)\n'
         '• /feedback - Send feedback to admin\n'
         '• /hidemenu - Hide the menu buttons\n'
         '• /settings - Admin functions (Admin only)\n',
@@ -114,7 +197,6 @@ async def help_command(update: Update, context: CallbackContext) -> None:
     )
 
 async def report_form_command(update: Update, context: CallbackContext) -> None:
-    await save_chat_id(update.effective_chat.id, context, update.effective_chat.type)
 
     await update.message.reply_text(
         "**📝 Deposit Report Form Template**\n\n"
@@ -124,7 +206,6 @@ async def report_form_command(update: Update, context: CallbackContext) -> None:
     )
 
 async def main_menu_command(update: Update, context: CallbackContext) -> None:
-    await save_chat_id(update.effective_chat.id, context, update.effective_chat.type)
 
     keyboard = [
         [KeyboardButton("/showdata"), KeyboardButton("/cleardata")],
@@ -155,202 +236,369 @@ async def main_menu_command(update: Update, context: CallbackContext) -> None:
     )
 
 async def remove_menu(update: Update, context: CallbackContext) -> None:
-    await save_chat_id(update.effective_chat.id, context, update.effective_chat.type)
     reply_markup = ReplyKeyboardRemove()
     await update.message.reply_text(
         "Menu keyboard ကို ဖျက်လိုက်ပါပြီ တောသားရေ.....။ /start ဖြင့် ပြန်ခေါ်နိုင်ပါသည်။😒😒",
         reply_markup=reply_markup
     )
 
+# Bulk checks: up to BULK_CHECK_INLINE_LIMIT results are listed in the reply, larger ones come
+# back as a CSV file.
+BULK_CHECK_INLINE_LIMIT = int(os.getenv('BULK_CHECK_INLINE_LIMIT', '30'))
+BULK_CHECK_MAX_NUMBERS = int(os.getenv('BULK_CHECK_MAX_NUMBERS', '10000'))
+BULK_CHECK_MAX_FILE_BYTES = int(os.getenv('BULK_CHECK_MAX_FILE_BYTES', str(2 * 1024 * 1024)))
+
+def check_reply_text(check_number: str, result: CheckResult, extra_message: str = "") -> str:
+    # Only checks inside the window raise a warning; older ones are shown as the total.
+    if result.recent > 1:
+        return (
+            f"⚠️ **{check_number}** ⚠️\n\n"
+            f"ဤနံပါတ်ကို နောက်ဆုံး {CHECK_WINDOW_DAYS} ရက်အတွင်း **{result.recent} ကြိမ်** စစ်ဆေးထားပြီး ဖြစ်ပါသည်။\n"
+            f"(Total: {result.total}){extra_message}"
+        )
+    if result.total > 1:
+        return (
+            f"ℹ️ **{check_number}** ℹ️\n\n"
+            f"ဤနံပါတ်ကို နောက်ဆုံး {CHECK_WINDOW_DAYS} ရက်အတွင်း **ပထမဆုံးအကြိမ်** စစ်ဆေးခြင်းဖြစ်ပါသည်။\n"
+            f"(Total: {result.total}){extra_message}"
+        )
+    return (
+        f"✅ **{check_number}** ✅\n\n"
+        f"ဤနံပါတ်ကို **ယခုမှ ပထမဆုံးအကြိမ်** စစ်ဆေးမှတ်တမ်းတင်လိုက်ပါသည်။{extra_message}"
+    )
+
+def duplicate_report_text(bot_data: dict, chat_id: str, duplicates: list) -> str:
+    # Who reported the same Gmail/phone first today, in which chat, and when.
+    lines = ["⚠️ Duplicate report: already reported today"]
+    for key, seen in duplicates:
+        who = seen.khaifa if seen.tele_name == MISSING else f"{seen.khaifa} ({seen.tele_name})"
+        if seen.chat_id == chat_id:
+            where = "this chat"
+        else:
+            try:
+                where = get_chat_cache(bot_data).name(int(seen.chat_id), f"chat {seen.chat_id}")
+            except ValueError:
+                where = f"chat {seen.chat_id}"
+        when = (
+            f"at {datetime.fromtimestamp(seen.submitted, get_yangon_tz()).strftime('%H:%M')}"
+            if seen.submitted is not None else "earlier today"
+        )
+        lines.append(f"• {describe_key(key)} — {who}, {where}, {when}")
+    return "\n".join(lines)
+
 async def check_command(update: Update, context: CallbackContext) -> None:
     if not context.args:
         await update.message.reply_text("Usage: /chk <number>.")
         return
 
-    check_number = context.args[0].strip()
+    # Several numbers after the command (one per line, or separated by commas/spaces).
+    numbers = split_numbers(update.message.text.split(None, 1)[1])
+    if numbers and len(numbers) > 1:
+        await bulk_check(update, context, numbers)
+        return
 
-    records = context.application.bot_data.setdefault('check_records', {})
+    # One number, possibly written with spaces ("/chk 09 123 456 789"); anything else is
+    # recorded as its first word, as before.
+    check_number = numbers[0] if numbers else context.args[0].strip()
+    record_key = normalize_number(check_number) or check_number
 
-    current_count = records.get(check_number, 0)
-    new_count = current_count + 1
-    records[check_number] = new_count
+    results, change = check_numbers(context.application.bot_data, [record_key], get_data_key())
+    mark_dirty(context, change)
 
-    if new_count > 1:
-        await update.message.reply_text(
-            f"⚠️ **{check_number}** ⚠️\n\n"
-            f"ဤနံပါတ်ကို **{new_count} ကြိမ်** စစ်ဆေးထားပြီး ဖြစ်ပါသည်။"
-        )
-    else:
-        await update.message.reply_text(
-            f"✅ **{check_number}** ✅\n\n"
-            f"ဤနံပါတ်ကို **ယခုမှ ပထမဆုံးအကြိမ်** စစ်ဆေးမှတ်တမ်းတင်လိုက်ပါသည်။"
-        )
-
-    if context.application.persistence:
-        await context.application.persistence.flush()
+    queue_reply(update, check_reply_text(check_number, results[0]))
 
 async def clear_data(update: Update, context: CallbackContext) -> None:
     chat_id = str(update.effective_chat.id)
     today_key = get_data_key()
-    await save_chat_id(update.effective_chat.id, context, update.effective_chat.type)
 
     if 'group_data' in context.application.bot_data and chat_id in context.application.bot_data['group_data'] and today_key in context.application.bot_data['group_data'][chat_id]:
         del context.application.bot_data['group_data'][chat_id][today_key]
+        drop_day_rollup(context.application.bot_data, chat_id, today_key)
+        get_report_index(context.application.bot_data).discard(chat_id, today_key)
+        note_group_data(context.application.bot_data, chat_id)
+        mark_dirty(context, ('clear_day', chat_id, today_key))
 
-        if context.application.persistence:
-            await context.application.persistence.flush()
-
-        await update.message.reply_text(f"✅ Data deleted for today ({today_key}).")
+        queue_reply(update, f"✅ Data deleted for today ({today_key}).")
     else:
-        await update.message.reply_text(f"🤷‍♂️No data found for today ({today_key}).")
+        queue_reply(update, f"🤷‍♂️No data found for today ({today_key}).")
 
 async def show_data(update: Update, context: CallbackContext) -> None:
     chat_id = str(update.effective_chat.id)
     today_key = get_data_key()
-    await save_chat_id(update.effective_chat.id, context, update.effective_chat.type)
-
-    if 'group_data' not in context.application.bot_data:
-        context.application.bot_data['group_data'] = {}
-
-    if chat_id not in context.application.bot_data['group_data']:
-        context.application.bot_data['group_data'][chat_id] = {}
 
-    collected_data_list = context.application.bot_data['group_data'][chat_id].get(today_key, [])
+    day_reports = get_day_reports(context.application.bot_data, chat_id, today_key)
 
-    if not collected_data_list:
-        await update.message.reply_text(f"No data collected yet for today ({today_key}) in this chat.")
+    if not day_reports:
+        queue_reply(update, f"No data collected yet for today ({today_key}) in this chat.")
         return
 
-    grouped_data = {}
+    pages = day_reports.pages()
 
-    for entry in collected_data_list:
-        parts = entry.split('    ')
+    queue_reply(
+        update,
+        pages[0],
+        reply_markup=showdata_keyboard(today_key, 0, len(pages))
+    )
 
-        khaifa_name = "N/A"
-        if len(parts) >= 2:
-            khaifa_name = parts[1].strip()
+    queue_reply(
+        update,
+        "💡 အသင်တောသား Data များကို ရှင်းလင်းလိုပါက **`/cleardata`** ကို နှိပ်ပါ：\n\n"
+        "**သင်၏တစ်နေ့တာ အချက်အလက်များ မှန်ကန်မှုရှိမရှိကို စစ်ဆေးဖို့မမေ့ပါနဲ့။**",
+        parse_mode='Markdown'
+    )
+
+async def export_command(update: Update, context: CallbackContext) -> None:
+    chat_id = str(update.effective_chat.id)
 
-        normalized_key = khaifa_name.replace(" ", "").lower() if khaifa_name != "N/A" else "n/a"
+    try:
+        start, end, fmt = parse_export_args(context.args, get_data_key())
+    except ValueError:
+        await update.message.reply_text(EXPORT_USAGE)
+        return
 
-        if normalized_key not in grouped_data:
-            grouped_data[normalized_key] = []
+    note = ""
+    if fmt == 'xlsx' and not xlsx_available():
+        fmt, note = 'csv', "\n(XLSX is not available on this server; sent as CSV.)"
 
-        grouped_data[normalized_key].append(entry)
+    label = export_label(start, end)
+    path, rows = await build_export(context.application.bot_data, chat_id, start, end, fmt)
+    try:
+        if not rows:
+            await update.message.reply_text(f"🤷‍♂️ No data found for {label} in this chat.")
+            return
 
-    final_response_parts = []
-    separator = "------------------------------------"
+        if os.path.getsize(path) > EXPORT_MAX_BYTES:
+            await update.message.reply_text("❌ The export is larger than Telegram allows (50 MB). Please choose a shorter range.")
+            return
 
-    is_first_group = True
-    sorted_groups = sorted(grouped_data.items())
+        with open(path, 'rb') as file:
+            await update.message.reply_document(
+                document=file,
+                filename=f"reports_{label.replace('..', '_to_')}.{fmt}",
+                caption=f"📄 {rows} reports ({label}){note}"
+            )
+    finally:
+        os.remove(path)
+
+def parse_report_range(args: list, today: str):
+    # /report <from> <to>, /report <from..to>, /report <day>; no dates means the last 7 days.
+    if not args:
+        end = datetime.strptime(today, '%Y-%m-%d')
+        return (end - timedelta(days=6)).strftime('%Y-%m-%d'), today
+
+    first, _, last = ' '.join(args[:2]).replace(' ', '..', 1).partition('..')
+    first_day, last_day = sorted(datetime.strptime(day, '%Y-%m-%d') for day in (first, last or first))
+    if (last_day - first_day).days >= REPORT_MAX_DAYS:
+        raise ValueError(f"ranges are limited to {REPORT_MAX_DAYS} days")
+    return first_day.strftime('%Y-%m-%d'), last_day.strftime('%Y-%m-%d')
+
+async def report_command(update: Update, context: CallbackContext) -> None:
+    chat_id = str(update.effective_chat.id)
 
-    # --- START OF MODIFICATION for blank line between entries ---
-    for normalized_key, entries in sorted_groups:
-        if not is_first_group:
-            # Add separator with a blank line before and after
-            final_response_parts.append(separator)
+    try:
+        start, end = parse_report_range(context.args, get_data_key())
+    except ValueError:
+        await update.message.reply_text(
+            f"Usage: /report <from> <to> (YYYY-MM-DD, up to {REPORT_MAX_DAYS} days)\n"
+            "Without dates, the last 7 days are reported."
+        )
+        return
 
-        is_first_group = False
+    per_day, per_khaifa = summarize(context.application.bot_data, chat_id, start, end)
+    if not per_day:
+        await update.message.reply_text(f"🤷‍♂️ No data found for {start} → {end} in this chat.")
+        return
 
+    lines = [
+        f"📊 Report {start} → {end}",
+        f"Total: {sum(total for _, total in per_day)} reports on {len(per_day)} days",
+        "",
+        "Per Khaifa:",
+    ]
+    lines.extend(f"• {khaifa}: {total}" for khaifa, total in per_khaifa)
+    lines.extend(["", "Per day:"])
+    lines.extend(f"• {day}: {total}" for day, total in per_day)
+
+    # Long ranges with many Khaifas are sent in several messages below Telegram's limit.
+    message, length = [], 0
+    for line in lines:
+        if message and length + len(line) + 1 > PAGE_LIMIT:
+            await update.message.reply_text("\n".join(message))
+            message, length = [], 0
+        message.append(line)
+        length += len(line) + 1
+    await update.message.reply_text("\n".join(message))
+
+def showdata_keyboard(day_key: str, page: int, page_count: int):
+    if page_count <= 1:
+        return None
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("⬅️ Prev", callback_data=f'showdata_{day_key}_{page - 1}'))
+    buttons.append(InlineKeyboardButton(f"{page + 1}/{page_count}", callback_data='showdata_noop'))
+    if page < page_count - 1:
+        buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f'showdata_{day_key}_{page + 1}'))
+
+    return InlineKeyboardMarkup([buttons])
+
+async def show_data_page(update: Update, context: CallbackContext) -> None:
+    query = update.callback_query
+    await query.answer()
 
-        group_text = "\n\n".join(entries)
-        final_response_parts.append(group_text)
+    if query.data == 'showdata_noop':
+        return
 
+    try:
+        _, day_key, page_str = query.data.split('_')
+        page = int(page_str)
+    except ValueError:
+        await query.edit_message_text("❌ Error: Invalid page.")
+        return
 
-    response_text = "\n".join(final_response_parts)
+    day_reports = get_day_reports(context.application.bot_data, str(query.message.chat.id), day_key)
 
+    if not day_reports:
+        await query.edit_message_text(f"No data collected for {day_key} in this chat.")
+        return
 
-    if len(response_text) > 4096:
-        await update.message.reply_text("Warning: Data too long. Displaying partial data.")
-        await update.message.reply_text(response_text[:4000])
-    else:
-        await update.message.reply_text(response_text)
+    pages = day_reports.pages()
+    page = min(page, len(pages) - 1)
 
-    await update.message.reply_text(
-        "💡 အသင်တောသား Data များကို ရှင်းလင်းလိုပါက **`/cleardata`** ကို နှိပ်ပါ：\n\n"
-        "**သင်၏တစ်နေ့တာ အချက်အလက်များ မှန်ကန်မှုရှိမရှိကို စစ်ဆေးဖို့မမေ့ပါနဲ့။**",
-        parse_mode='Markdown'
+    await query.edit_message_text(
+        pages[page],
+        reply_markup=showdata_keyboard(day_key, page, len(pages))
     )
 
 async def extract_and_save_data(update: Update, context: CallbackContext) -> None:
     chat_id = str(update.effective_chat.id)
-    await save_chat_id(update.effective_chat.id, context, update.effective_chat.type)
 
     full_text = update.message.text or update.message.caption
 
     if not full_text:
         return
 
-    required_fields_present = all(
-        re.search(field, full_text, re.IGNORECASE)
-        for field in ["Khaifa", "Date"]
-    )
+    report = parse_report(full_text)
 
-    if not required_fields_present:
-        cleaned_text = re.sub(r'[\s\n\-\(\)\+]+', '', full_text).strip()
+    if report is None:
+        numbers = split_numbers(full_text)
+        if numbers and len(numbers) > 1:
+            await bulk_check(update, context, numbers)
+            return
+
+        cleaned_text = normalize_number(full_text)
 
         if cleaned_text.isdigit() and len(cleaned_text) >= 7:
             check_number = cleaned_text
 
-            records = context.application.bot_data.setdefault('check_records', {})
-            current_count = records.get(check_number, 0)
-            new_count = current_count + 1
-            records[check_number] = new_count
+            results, change = check_numbers(context.application.bot_data, [check_number], get_data_key())
+            mark_dirty(context, change)
 
             extra_message = "\n\n‼️ အသင်တောသား 🔍Search-barတွင် နံပါတ်ရိုက်ထည့်၍ ယခင်စစ်ဆေးထားသူအားမေးမြန်းနိုင်သည်။"
 
-            if new_count > 1:
-                await update.message.reply_text(
-                    f"⚠️ **{check_number}** ⚠️\n\n"
-                    f"ဤနံပါတ်ကို **{new_count} ကြိမ်** စစ်ဆေးထားပြီး ဖြစ်ပါသည်။{extra_message}"
-                )
-            else:
-                await update.message.reply_text(
-                    f"✅ **{check_number}** ✅\n\n"
-                    f"ဤနံပါတ်ကို **ယခုမှ ပထမဆုံးအကြိမ်** စစ်ဆေးမှတ်တမ်းတင်လိုက်ပါသည်။{extra_message}"
-                )
-
-            if context.application.persistence:
-                await context.application.persistence.flush()
+            queue_reply(update, check_reply_text(check_number, results[0], extra_message))
 
             return
         return
 
-    khaifa_match = re.search(r"(?:Khaifa|Khat)\s*[\-\–]?\s*(.+?)(?:\r?\n|$)", full_text, re.IGNORECASE | re.DOTALL)
-    extracted_khaifa = khaifa_match.group(1).strip() if khaifa_match else "N/A"
+    record = ReportRecord.from_parsed(report)
+    final_output = record.summary
 
-    date_match = re.search(r"Date\s*[\-\–]?\s*(.+?)(?:\n|$)", full_text, re.IGNORECASE | re.DOTALL)
-    extracted_date = date_match.group(1).strip() if date_match else "N/A"
+    today_key = get_data_key()
 
-    email_phone_match = re.search(r"(?:Gmail|Email|Phone number|Phone)\s*[\-\–]?\s*(.+?)(?:\n|$)", full_text, re.IGNORECASE | re.DOTALL)
-    extracted_email_phone = email_phone_match.group(1).strip() if email_phone_match else "N/A"
+    # Looked up before the report is stored, so it is not found as its own duplicate.
+    duplicates = get_report_index(context.application.bot_data).add(
+        context.application.bot_data, chat_id, today_key, record, update.message.date.timestamp()
+    )
 
-    final_output = f"{extracted_date}    {extracted_khaifa}    {extracted_email_phone}"
+    get_day_reports(context.application.bot_data, chat_id, today_key, create=True).add(record)
+    add_to_rollup(context.application.bot_data, chat_id, today_key, record)
+    note_group_data(context.application.bot_data, chat_id)
+    mark_dirty(context, ('report', chat_id, today_key, record))
 
-    today_key = get_data_key()
+    if duplicates:
+        final_output += "\n\n" + duplicate_report_text(context.application.bot_data, chat_id, duplicates)
 
-    if 'group_data' not in context.application.bot_data:
-        context.application.bot_data['group_data'] = {}
+    queue_reply(update, final_output)
 
-    if chat_id not in context.application.bot_data['group_data']:
-        context.application.bot_data['group_data'][chat_id] = {}
+async def bulk_check(update: Update, context: CallbackContext, numbers: list) -> None:
+    # A number listed twice in one batch is one check.
+    unique = list(dict.fromkeys(numbers))
+    if len(unique) > BULK_CHECK_MAX_NUMBERS:
+        await update.message.reply_text(
+            f"❌ Too many numbers ({len(unique)}). Up to {BULK_CHECK_MAX_NUMBERS} can be checked at once."
+        )
+        return
 
-    if today_key not in context.application.bot_data['group_data'][chat_id]:
-        context.application.bot_data['group_data'][chat_id][today_key] = []
+    results, change = check_numbers(context.application.bot_data, unique, get_data_key())
+    # The whole batch is one change, so it costs one journal record / one flush trigger.
+    mark_dirty(context, change)
+
+    new_count = sum(1 for result in results if result.total == 1)
+    recent_count = sum(1 for result in results if result.recent > 1)
+    summary = (
+        f"🔍 Bulk check: {len(results)} numbers\n"
+        f"✅ New: {new_count}\n"
+        f"⚠️ Checked in the last {CHECK_WINDOW_DAYS} days: {recent_count}\n"
+        f"ℹ️ Checked only before that: {len(results) - new_count - recent_count}"
+    )
+    if len(numbers) > len(unique):
+        summary += f"\n(Repeated in the list, counted once: {len(numbers) - len(unique)})"
+
+    if len(results) <= BULK_CHECK_INLINE_LIMIT:
+        # Numbers checked recently first: those are the ones to follow up on.
+        lines = [
+            f"⚠️ {result.number} — {result.recent} ကြိမ် / {CHECK_WINDOW_DAYS}d (total {result.total})" if result.recent > 1
+            else f"ℹ️ {result.number} — total {result.total}" if result.total > 1
+            else f"✅ {result.number} — ပထမဆုံးအကြိမ်"
+            for result in sorted(results, key=lambda result: (result.recent == 1, result.total == 1))
+        ]
+        queue_reply(update, summary + "\n\n" + "\n".join(lines))
+        return
 
-    context.application.bot_data['group_data'][chat_id][today_key].append(final_output)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['number', f'count_last_{CHECK_WINDOW_DAYS}_days', 'total', 'status'])
+    for result in results:
+        status = 'new' if result.total == 1 else 'checked recently' if result.recent > 1 else 'checked before'
+        writer.writerow([result.number, result.recent, result.total, status])
 
-    if context.application.persistence:
-        await context.application.persistence.flush()
+    await update.message.reply_document(
+        document=InputFile(io.BytesIO(output.getvalue().encode('utf-8-sig')), filename=f"chk_{get_data_key()}.csv"),
+        caption=summary
+    )
 
-    await update.message.reply_text(final_output)
+async def bulk_check_document(update: Update, context: CallbackContext) -> None:
+    document = update.message.document
+
+    if document.file_size and document.file_size > BULK_CHECK_MAX_FILE_BYTES:
+        await update.message.reply_text(f"❌ File too large (max {BULK_CHECK_MAX_FILE_BYTES // 1024} KB).")
+        return
+
+    telegram_file = await document.get_file()
+    text = bytes(await telegram_file.download_as_bytearray()).decode('utf-8-sig', errors='replace')
+
+    if (document.file_name or '').lower().endswith('.csv'):
+        text = "\n".join(cell for row in csv.reader(io.StringIO(text)) for cell in row)
+
+    # Headers, names and other columns are skipped; every cell that is a number is checked.
+    numbers = split_numbers(text, strict=False)
+    if not numbers:
+        await update.message.reply_text("🤷‍♂️ No numbers found in this file.")
+        return
+
+    await bulk_check(update, context, numbers)
+
+# Button icons of the built-in commission types; types added through COMMISSION_RATES get 💵.
+COMMISSION_ICONS = {'killer': "🔪", 'deposit': "💰", 'm1': "🥇"}
+COMM_BATCH_INLINE_LIMIT = int(os.getenv('COMM_BATCH_INLINE_LIMIT', '30'))
 
 async def commission_start(update: Update, context: CallbackContext) -> int:
     keyboard = [
-        [InlineKeyboardButton("🔪 Killer", callback_data='comm_killer')],
-        [InlineKeyboardButton("💰 Deposit (M2)", callback_data='comm_deposit')],
-        [InlineKeyboardButton("🥇 M1", callback_data='comm_m1')],
-        [InlineKeyboardButton("❌ Cancel", callback_data='cancel_commission')]
+        [InlineKeyboardButton(f"{COMMISSION_ICONS.get(kind, '💵')} {commission_label(kind)}", callback_data=f'comm_{kind}')]
+        for kind in COMMISSION_RATES
     ]
+    keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data='cancel_commission')])
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     await update.message.reply_text("**💰 Select Commission Type:**", reply_markup=reply_markup, parse_mode='Markdown')
@@ -362,46 +610,137 @@ async def request_amount(update: Update, context: CallbackContext) -> int:
 
     context.user_data['comm_type'] = query.data
 
-    await query.edit_message_text(f"You selected **{query.data.split('_')[1].upper()}**.\nPlease send the amount of money to calculate the commission:", parse_mode='Markdown')
+    await query.edit_message_text(
+        f"You selected **{query.data.split('_', 1)[1].upper()}**.\nPlease send the amount of money to calculate the commission:\n"
+        "(Several amounts, one per line, are calculated together.)",
+        parse_mode='Markdown'
+    )
 
     return COMMISSION_AMOUNT
 
 async def calculate_commission(update: Update, context: CallbackContext) -> int:
-    try:
-        amount_str = update.message.text.replace(',', '').strip()
-        amount = float(amount_str)
-    except ValueError:
+    comm_type = context.user_data.pop('comm_type', None)
+    kind = commission_type(comm_type[len('comm_'):]) if comm_type else None
+
+    if kind and len(update.message.text.split()) > 1:
+        # A pasted list of amounts: calculate them all in one go.
+        items, skipped = parse_commission_rows(text_rows(update.message.text), kind)
+        if items:
+            await reply_commission_batch(update, items, skipped)
+            return ConversationHandler.END
+
+    amount_str = update.message.text.replace(',', '').strip()
+    amount = parse_amount(amount_str)
+    if amount is None:
         await update.message.reply_text("❌ Invalid amount. Enter a valid number.")
         return ConversationHandler.END
 
-    comm_type = context.user_data.pop('comm_type', None)
-
-    if comm_type == 'comm_killer':
-        commission = amount / 1600 * 0.04 * 0.45 * 4.7
-    elif comm_type == 'comm_deposit':
-        commission = amount / 1600 * 0.04 * 0.3 * 4.7
-    elif comm_type == 'comm_m1':
-        commission = amount / 1600 * 0.04 * 0.25 * 4.7
-    else:
+    if kind is None:
         await update.message.reply_text("❌ Commission type not found. Please try again with /help.")
         return ConversationHandler.END
 
-    type_map = {
-        'comm_killer': 'Killer',
-        'comm_deposit': 'Deposit (M2)',
-        'comm_m1': 'M1'
-    }
-    type_name = type_map.get(comm_type, "N/A")
+    commission = amount * commission_factor(kind)
 
     await update.message.reply_text(
-        f"**💰 Commission Result for {type_name}:**\n\n"
+        f"**💰 Commission Result for {commission_label(kind)}:**\n\n"
         f"Input Amount: `{amount_str}`\n"
         f"Calculated Commission: **`{commission:.4f}`**\n\n"
-        f"Calculation: `{amount} / 1600 * (Rate) * 4.7`",
+        f"Calculation: `{amount} / {COMMISSION_DIVISOR:g} * (Rate) * {COMMISSION_MULTIPLIER:g}`",
         parse_mode='Markdown'
     )
     return ConversationHandler.END
 
+async def reply_commission_batch(update: Update, items: list, skipped: int) -> None:
+    rows, totals = calculate_batch(items)
+
+    summary = f"💰 Commission batch: {len(rows)} amounts\n\n{format_totals(totals)}"
+    if skipped:
+        summary += f"\n\n(Lines skipped, no type or amount: {skipped})"
+
+    if len(rows) <= COMM_BATCH_INLINE_LIMIT:
+        lines = [
+            f"{number}. {commission_label(row.kind)} {row.amount:,.2f} → {row.commission:,.4f}"
+            for number, row in enumerate(rows, 1)
+        ]
+        await update.message.reply_text("\n".join(lines) + "\n\n" + summary)
+        return
+
+    await update.message.reply_document(
+        document=InputFile(io.BytesIO(write_batch_csv(rows)), filename="commission.csv"),
+        caption=summary[:1024]
+    )
+
+async def commission_day(update: Update, context: CallbackContext, args: list) -> None:
+    # /commbatch day <type> <amount per report> [YYYY-MM-DD]: every report the chat collected
+    # that day counts as one amount, totalled per Khaifa from the day's rollup.
+    kind = commission_type(args[0]) if args else None
+    per_report = parse_amount(args[1]) if len(args) > 1 else None
+    try:
+        day = datetime.strptime(args[2], '%Y-%m-%d').strftime('%Y-%m-%d') if len(args) > 2 else get_data_key()
+    except ValueError:
+        day = None
+
+    if kind is None or per_report is None or day is None:
+        await update.message.reply_text(
+            "Usage: /commbatch day <type> <amount per report> [YYYY-MM-DD]\n"
+            f"Types: {', '.join(COMMISSION_RATES)}"
+        )
+        return
+
+    _, per_khaifa = summarize(context.application.bot_data, str(update.effective_chat.id), day, day)
+    if not per_khaifa:
+        await update.message.reply_text(f"🤷‍♂️ No data found for {day} in this chat.")
+        return
+
+    rows, totals = calculate_batch([(kind, count * per_report) for _, count in per_khaifa])
+    lines = [f"💰 {commission_label(kind)} commission per Khaifa, {day} ({per_report:,.2f} per report)", ""]
+    lines.extend(
+        f"• {khaifa}: {count} → {row.amount:,.2f} → {row.commission:,.4f}"
+        for (khaifa, count), row in zip(per_khaifa, rows)
+    )
+    lines.extend(["", format_totals(totals)])
+    await update.message.reply_text("\n".join(lines)[:PAGE_LIMIT])
+
+async def commission_batch_command(update: Update, context: CallbackContext) -> None:
+
+    if context.args and context.args[0].lower() == 'day':
+        await commission_day(update, context, context.args[1:])
+        return
+
+    items, skipped = parse_commission_rows(text_rows(update.message.text.split(None, 1)[1] if context.args else ''))
+    if not items:
+        await update.message.reply_text(
+            "Usage: /commbatch followed by rows of <type> <amount>, e.g.\n"
+            "/commbatch\nkiller 12000\ndeposit 8000\nm1 5000 6500\n\n"
+            "A type on its own line applies to the amounts below it. A .csv/.txt file with the "
+            "caption /commbatch works too, and /commbatch day <type> <amount per report> totals "
+            "today's reports per Khaifa.\n"
+            f"Types: {', '.join(COMMISSION_RATES)}"
+        )
+        return
+
+    await reply_commission_batch(update, items, skipped)
+
+async def commission_batch_document(update: Update, context: CallbackContext) -> None:
+    document = update.message.document
+
+    if document.file_size and document.file_size > BULK_CHECK_MAX_FILE_BYTES:
+        await update.message.reply_text(f"❌ File too large (max {BULK_CHECK_MAX_FILE_BYTES // 1024} KB).")
+        return
+
+    telegram_file = await document.get_file()
+    text = bytes(await telegram_file.download_as_bytearray()).decode('utf-8-sig', errors='replace')
+    rows = csv_rows(text) if (document.file_name or '').lower().endswith('.csv') else text_rows(text)
+
+    # "/commbatch killer" as the caption sets the type of rows that do not name one.
+    caption_args = update.message.caption.split()[1:]
+    items, skipped = parse_commission_rows(rows, commission_type(caption_args[0]) if caption_args else None)
+    if not items:
+        await update.message.reply_text("🤷‍♂️ No type/amount rows found in this file.")
+        return
+
+    await reply_commission_batch(update, items, skipped)
+
 async def cancel_commission(update: Update, context: CallbackContext) -> int:
     if update.callback_query:
         query = update.callback_query
@@ -422,14 +761,16 @@ async def process_feedback(update: Update, context: CallbackContext) -> int:
 
     # --- MODIFICATION: Send feedback to ALL IDs in ADMIN_IDS ---
     for admin_id in ADMIN_IDS:
-        await context.application.bot.send_message(
-            chat_id=admin_id,
-            text=f"***[NEW FEEDBACK]***\nFrom: {user.full_name} (@{user.username} - ID: {user.id})\n\nFeedback:\n{feedback_text}",
+        queue_message(
+            context.application.bot,
+            admin_id,
+            f"***[NEW FEEDBACK]***\nFrom: {user.full_name} (@{user.username} - ID: {user.id})\n\nFeedback:\n{feedback_text}",
+            ADMIN,
             parse_mode='Markdown'
         )
     # -----------------------------------------------------------
 
-    await update.message.reply_text("သင်၏အကြံပြုစာအား Owner ထံပေးပို့ပြီးပါပြီ။")
+    queue_reply(update, "သင်၏အကြံပြုစာအား Owner ထံပေးပို့ပြီးပါပြီ။")
     return ConversationHandler.END
 
 async def cancel_conversation(update: Update, context: CallbackContext) -> int:
@@ -449,23 +790,24 @@ async def broadcast_start(update: Update, context: CallbackContext) -> int:
         await update.message.reply_text("No tracked users or groups found.")
         return ConversationHandler.END
 
-    keyboard = []
+    keyboard = [
+        [InlineKeyboardButton(f"{label} ({broadcast_target_size(context, target)})", callback_data=f'bcast_{target}')]
+        for target, label in BROADCAST_GROUP_TARGETS.items()
+    ]
+
+    # Names come from the chat cache; anything unknown or stale is fetched in the background
+    # and shows up the next time the keyboard is opened.
+    chat_cache = get_chat_cache(context.application.bot_data)
 
     for user_id in sorted(list(users)):
-        try:
-            user = await context.application.bot.get_chat(chat_id=user_id)
-            name = user.full_name or f"User {user_id}"
-            keyboard.append([InlineKeyboardButton(f"👤 User: {name} (ID: {user_id})", callback_data=f'bcast_id_{user_id}')])
-        except Exception:
-            keyboard.append([InlineKeyboardButton(f"👤 Untracked User (ID: {user_id})", callback_data=f'bcast_id_{user_id}')])
+        name = chat_cache.name(user_id, f"User {user_id}")
+        keyboard.append([InlineKeyboardButton(f"👤 User: {name} (ID: {user_id})", callback_data=f'bcast_id_{user_id}')])
 
     for group_id in sorted(list(groups)):
-        try:
-            chat = await context.application.bot.get_chat(chat_id=group_id)
-            name = chat.title or f"Group {group_id}"
-            keyboard.append([InlineKeyboardButton(f"👥 Group: {name} (ID: {group_id})", callback_data=f'bcast_id_{group_id}')])
-        except Exception:
-            keyboard.append([InlineKeyboardButton(f"👥 Untracked Group (ID: {group_id})", callback_data=f'bcast_id_{group_id}')])
+        name = chat_cache.name(group_id, f"Group {group_id}")
+        keyboard.append([InlineKeyboardButton(f"👥 Group: {name} (ID: {group_id})", callback_data=f'bcast_id_{group_id}')])
+
+    schedule_chat_cache_refresh(context, list(users) + list(groups))
 
     keyboard.append([InlineKeyboardButton("❌ Cancel Broadcast", callback_data='bcast_cancel')])
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -482,6 +824,16 @@ async def broadcast_select_chat(update: Update, context: CallbackContext) -> int
     query = update.callback_query
     await query.answer()
 
+    target = query.data[len('bcast_'):]
+    if target in BROADCAST_GROUP_TARGETS:
+        context.user_data['target_broadcast_id'] = target
+        context.user_data['target_name'] = f"{BROADCAST_GROUP_TARGETS[target]} ({broadcast_target_size(context, target)})"
+        await query.edit_message_text(
+            f"✅ **{context.user_data['target_name']}** သို့ စာပေးပို့ရန် ရွေးချယ်ပြီးပါပြီ။\n\n"
+            "ကျေးဇူးပြု၍ **သင်ပေးပို့လိုသည့် စာသား** ကို ရိုက်ထည့်ပေးပါ။\n(ရပ်လိုပါက /cancel)"
+        )
+        return BROADCAST_AWAITING_MESSAGE
+
     if not query.data.startswith('bcast_id_'):
         await query.edit_message_text("❌ ရွေးချယ်မှု မှားယွင်းပါသည်။")
         return ConversationHandler.END
@@ -490,12 +842,9 @@ async def broadcast_select_chat(update: Update, context: CallbackContext) -> int
 
     context.user_data['target_broadcast_id'] = target_id_str
 
-    try:
-        chat = await context.application.bot.get_chat(chat_id=target_id_str)
-        name = chat.title or chat.full_name
-        context.user_data['target_name'] = name
-    except Exception:
-        context.user_data['target_name'] = f"Chat ID: {target_id_str}"
+    context.user_data['target_name'] = get_chat_cache(context.application.bot_data).name(
+        int(target_id_str), f"Chat ID: {target_id_str}"
+    )
 
     await query.edit_message_text(
         f"✅ **{context.user_data['target_name']}** သို့ စာပေးပို့ရန် ရွေးချယ်ပြီးပါပြီ။\n\n"
@@ -534,14 +883,75 @@ async def broadcast_confirm(update: Update, context: CallbackContext) -> int:
         await query.edit_message_text("❌ အချက်အလက်မပြည့်စုံ၍ ပေးပို့နိုင်ခြင်းမရှိပါ။")
         return ConversationHandler.END
 
+    if target_id in BROADCAST_GROUP_TARGETS:
+        # The fan-out can take minutes for large audiences; run it in the background so the
+        # conversation (and the update it came from) finishes right away.
+        await query.edit_message_text(f"⏳ **{target_name}** သို့ ပေးပို့နေပါသည်...", parse_mode='Markdown')
+        context.application.create_task(
+            run_broadcast(context, target_id, f"[ADMIN MESSAGE]\n{message}", query.message),
+            update=update
+        )
+        return ConversationHandler.END
+
     try:
-        await context.application.bot.send_message(chat_id=target_id, text=f"[ADMIN MESSAGE]\n{message}")
+        await context.application.bot.send_message(chat_id=target_id, text=f"[ADMIN MESSAGE]\n{message}", rate_limit_args=ADMIN)
         await query.edit_message_text(f"✅ **{target_name}** ထံသို့ စာကို အောင်မြင်စွာ ပေးပို့ပြီးပါပြီ။", parse_mode='Markdown')
     except Exception as e:
         await query.edit_message_text(f"❌ **{target_name}** ထံသို့ စာပေးပို့ရာတွင် အမှားဖြစ်ပွားပါသည်။ (Error: {e})")
 
     return ConversationHandler.END
 
+def broadcast_target_chats(context: CallbackContext, target: str) -> list:
+    bot_data = context.application.bot_data
+    chat_ids = []
+    if target in ('all_users', 'all'):
+        chat_ids.extend(sorted(bot_data.get('users', set())))
+    if target in ('all_groups', 'all'):
+        chat_ids.extend(sorted(bot_data.get('groups', set())))
+    return chat_ids
+
+def broadcast_target_size(context: CallbackContext, target: str) -> int:
+    return len(broadcast_target_chats(context, target))
+
+def broadcast_progress_text(fan_out: FanOut, finished: bool = False) -> str:
+    status = "✅ Broadcast ပြီးဆုံးပါပြီ။" if finished else "⏳ Broadcast ပေးပို့နေပါသည်..."
+    text = (
+        f"{status}\n\n"
+        f"Sent: {fan_out.sent} / {fan_out.total}\n"
+        f"Failed: {fan_out.failed}\n"
+        f"Speed: {fan_out.throughput:.1f} msg/s"
+    )
+    if finished and fan_out.unreachable:
+        text += f"\nRemoved unreachable chats: {len(fan_out.unreachable)}"
+    return text
+
+async def run_broadcast(context: CallbackContext, target: str, text: str, progress_message) -> None:
+    fan_out = FanOut(context.application.bot, broadcast_target_chats(context, target), text, rate_limit_args=BULK)
+
+    async def report_progress(fan_out: FanOut) -> None:
+        try:
+            await progress_message.edit_text(broadcast_progress_text(fan_out))
+        except Exception as e:
+            logger.debug("Could not update broadcast progress: %s", e)
+
+    await fan_out.run(on_progress=report_progress)
+
+    bot_data = context.application.bot_data
+    for chat_id in fan_out.unreachable:
+        mark_dirty(context, drop_chat(bot_data, chat_id))
+
+    for old_chat_id, new_chat_id in fan_out.migrated.items():
+        mark_changes(context, drop_chat(bot_data, old_chat_id), register_chat(bot_data, new_chat_id, 'supergroup'))
+
+    logger.info(
+        "Broadcast to %s finished: %d sent, %d failed, %d unreachable removed",
+        target, fan_out.sent, fan_out.failed, len(fan_out.unreachable)
+    )
+    try:
+        await progress_message.edit_text(broadcast_progress_text(fan_out, finished=True))
+    except Exception as e:
+        logger.warning("Could not send broadcast summary: %s", e)
+
 async def broadcast_cancel(update: Update, context: CallbackContext) -> int:
     if update.callback_query:
         query = update.callback_query
@@ -563,6 +973,66 @@ async def set_separator_command(update: Update, context: CallbackContext) -> Non
         return
     await update.message.reply_text("`Daily Separator` functions have been removed from the code.")
 
+LISTGROUPS_PAGE_SIZE = 10
+
+def list_groups_ids(context: CallbackContext, only_with_data: bool) -> list:
+    bot_data = context.application.bot_data
+    groups = bot_data.get('groups', set())
+    if only_with_data:
+        if 'data_chats' in bot_data:
+            # Sharded: group_data here only holds this worker's chats.
+            with_data = set(bot_data['data_chats'])
+            groups = [group_id for group_id in groups if group_id in with_data]
+        else:
+            group_data = bot_data.get('group_data', {})
+            groups = [group_id for group_id in groups if group_data.get(str(group_id))]
+    return sorted(groups)
+
+async def render_list_groups_page(context: CallbackContext, only_with_data: bool, page: int):
+    group_ids = list_groups_ids(context, only_with_data)
+    page_count = max(1, -(-len(group_ids) // LISTGROUPS_PAGE_SIZE))
+    page = max(0, min(page, page_count - 1))
+    page_ids = group_ids[page * LISTGROUPS_PAGE_SIZE:(page + 1) * LISTGROUPS_PAGE_SIZE]
+
+    # Only the groups on this page are looked up, and only if the cache has nothing fresh.
+    await refresh_chat_cache(context, page_ids)
+    chat_cache = get_chat_cache(context.application.bot_data)
+
+    mode = 'data' if only_with_data else 'all'
+    title = "👥 Tracked Groups with data" if only_with_data else "👥 Tracked Groups List"
+    lines = [f"{title} ({len(group_ids)}):", ""]
+    keyboard = []
+
+    for position, group_id in enumerate(page_ids, start=page * LISTGROUPS_PAGE_SIZE + 1):
+        group_name = chat_cache.name(group_id, "Unknown Group (ID may be outdated)")
+        lines.append(f"{position}. {group_name} ({group_id})")
+        # Mode and page come along so the list can be shown again after the clear.
+        keyboard.append([InlineKeyboardButton(
+            f"🗑️ Clear: {group_name}"[:60], callback_data=f'admin_clear_{group_id}_{mode}_{page}'
+        )])
+
+    if not page_ids:
+        lines.append("No groups with collected data." if only_with_data else "The bot is not currently in any tracked groups.")
+
+    if page_count > 1:
+        buttons = []
+        if page > 0:
+            buttons.append(InlineKeyboardButton("⬅️ Prev", callback_data=f'listgroups_{mode}_{page - 1}'))
+        buttons.append(InlineKeyboardButton(f"{page + 1}/{page_count}", callback_data='listgroups_noop'))
+        if page < page_count - 1:
+            buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f'listgroups_{mode}_{page + 1}'))
+        keyboard.append(buttons)
+
+    keyboard.append([
+        InlineKeyboardButton(
+            "📋 All groups" if only_with_data else "📊 Only groups with data",
+            callback_data='listgroups_all_0' if only_with_data else 'listgroups_data_0'
+        ),
+        InlineKeyboardButton("❌ Cancel", callback_data='admin_cancel')
+    ])
+
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
 async def list_groups(update: Update, context: CallbackContext) -> None:
     # --- MODIFICATION: Check if user is in ADMIN_IDS ---
     if update.effective_user.id not in ADMIN_IDS:
@@ -575,31 +1045,31 @@ async def list_groups(update: Update, context: CallbackContext) -> None:
         await update.message.reply_text("The bot is not currently in any tracked groups.")
         return
 
-    await update.message.reply_text("👥 **Tracked Groups List:**", parse_mode='Markdown')
+    # /listgroups data — only groups that have collected reports.
+    only_with_data = bool(context.args) and context.args[0].lower() == 'data'
+    text, reply_markup = await render_list_groups_page(context, only_with_data, 0)
+    await update.message.reply_text(text, reply_markup=reply_markup)
 
-    for group_id in list(groups):
-        try:
-            chat = await context.application.bot.get_chat(chat_id=group_id)
-            group_name = chat.title
-        except Exception:
-            group_name = "Unknown Group (ID may be outdated)"
-
-        response = f"**{group_name}** (`{group_id}`)\n"
-
-        keyboard = [
-            [
-                InlineKeyboardButton("🗑️ Clear All Data", callback_data=f'admin_clear_{group_id}'),
-                InlineKeyboardButton("❌ Cancel", callback_data='admin_cancel')
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+async def list_groups_page(update: Update, context: CallbackContext) -> None:
+    query = update.callback_query
+    await query.answer()
 
-        await context.application.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=response,
-            reply_markup=reply_markup,
-            parse_mode='Markdown'
-        )
+    if query.data == 'listgroups_noop':
+        return
+
+    if query.from_user.id not in ADMIN_IDS:
+        await query.edit_message_text("Admin only.")
+        return
+
+    try:
+        _, mode, page_str = query.data.split('_')
+        page = int(page_str)
+    except ValueError:
+        await query.edit_message_text("❌ Error: Invalid page.")
+        return
+
+    text, reply_markup = await render_list_groups_page(context, mode == 'data', page)
+    await query.edit_message_text(text, reply_markup=reply_markup)
 
 async def clear_group_data_callback(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
@@ -613,28 +1083,37 @@ async def clear_group_data_callback(update: Update, context: CallbackContext) ->
     try:
         data_parts = query.data.split('_')
         group_id_to_clear = data_parts[2]
-    except IndexError:
+        # admin_clear_<id>_<mode>_<page>; buttons sent before pages were kept carry only the id.
+        mode = data_parts[3] if len(data_parts) > 3 else 'data'
+        page = int(data_parts[4]) if len(data_parts) > 4 else 0
+    except (IndexError, ValueError):
         await query.edit_message_text("❌ Error: Invalid clear command.")
         return
 
     chat_id_str = str(group_id_to_clear)
 
-    if 'group_data' in context.application.bot_data and chat_id_str in context.application.bot_data['group_data']:
-        del context.application.bot_data['group_data'][chat_id_str]
-
-        if context.application.persistence:
-            await context.application.persistence.flush()
+    bot_data = context.application.bot_data
+    if chat_id_str in bot_data.get('group_data', {}) or chat_id_str in bot_data.get('rollups', {}):
+        bot_data.get('group_data', {}).pop(chat_id_str, None)
+        drop_chat_rollups(bot_data, chat_id_str)
+        get_report_index(bot_data).discard(chat_id_str)
+        note_group_data(bot_data, chat_id_str)
+        mark_dirty(context, ('clear_group', chat_id_str))
+        remove_chat_archive(chat_id_str)
 
         try:
-            chat = await context.application.bot.get_chat(chat_id=group_id_to_clear)
-            group_name = chat.title
-        except Exception:
+            group_name = get_chat_cache(context.application.bot_data).name(int(group_id_to_clear), "Unknown Group")
+        except ValueError:
             group_name = "Unknown Group"
 
-        await query.edit_message_text(f"✅ Group Data Cleared!\n**{group_name}** (`{group_id_to_clear}`)'s daily tracking data has been completely removed.", parse_mode='Markdown')
+        status = f"✅ Group Data Cleared! {group_name} ({group_id_to_clear})'s daily tracking data has been completely removed."
 
     else:
-        await query.edit_message_text(f"No daily tracking data found for group ID `{group_id_to_clear}`. Action cancelled.")
+        status = f"No daily tracking data found for group ID {group_id_to_clear}. Action cancelled."
+
+    # The list stays up, so the admin can go on with the other groups on the page.
+    text, reply_markup = await render_list_groups_page(context, mode == 'data', page)
+    await query.edit_message_text(f"{status}\n\n{text}", reply_markup=reply_markup)
 
 async def cancel_group_action(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
@@ -658,8 +1137,10 @@ async def admin_settings_command(update: Update, context: CallbackContext) -> No
         f"Daily Separator Jobs: `REMOVED`\n"
         f"Actions:\n"
         f"• /stats (Admin only)\n"
+        f"• /perf [reset | profile on [rate] | profile off] (Admin only - Handler/flush/API latency)\n"
         f"• /broadcast (Admin only - Selectively broadcast)\n"
-        f"• /listgroups (Admin only - Selectively clear group data)",
+        f"• /listgroups (Admin only - Selectively clear group data)\n"
+        f"• /listgroups data (Admin only - Only groups with collected data)",
         parse_mode='Markdown'
     )
 
@@ -669,29 +1150,138 @@ async def stats(update: Update, context: CallbackContext) -> None:
         await update.message.reply_text("You are not authorized to use this command.")
         return
 
-    user_count = len(context.application.bot_data.get('users', set()))
-    group_count = len(context.application.bot_data.get('groups', set()))
-    chk_count = len(context.application.bot_data.get('check_records', {}))
+    bot_data = context.application.bot_data
+    users = bot_data.get('users', set())
+    groups = bot_data.get('groups', set())
+    chk_count = len(get_check_store(bot_data))
+    week_ago = seen_day() - 7
 
     await update.message.reply_text(
         f"📊 Bot Statistics:\n"
-        f"Total Users (Private Chats): {user_count}\n"
-        f"Total Groups: {group_count}\n"
-        f"Total Unique Numbers Checked (/chk): {chk_count}"
+        f"Total Users (Private Chats): {len(users)} ({active_since(bot_data, week_ago, users)} active in the last 7 days)\n"
+        f"Total Groups: {len(groups)} ({active_since(bot_data, week_ago, groups)} active in the last 7 days)\n"
+        f"Total Unique Numbers Checked (/chk): {chk_count}\n"
+        f"Chats are dropped after {CHAT_INACTIVE_DAYS} days without activity."
     )
 
-def main():
-    if not TOKEN:
+async def perf_command(update: Update, context: CallbackContext) -> None:
+    # --- MODIFICATION: Check if user is in ADMIN_IDS ---
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("Admin only.")
         return
 
-    persistence = PicklePersistence(filepath='bot_data.pickle')
+    args = [arg.lower() for arg in context.args]
+
+    if args[:1] == ['reset']:
+        perf.reset()
+        await update.message.reply_text("Perf counters reset.")
+        return
 
-    application = (
+    if args[:2] == ['profile', 'on']:
+        try:
+            sample_rate = float(args[2]) if len(args) > 2 else perf.PERF_PROFILE_SAMPLE
+        except ValueError:
+            await update.message.reply_text("Usage: /perf profile on [sample rate 0-1]")
+            return
+        perf.PROFILER.start(min(max(sample_rate, 0.0), 1.0))
+        await update.message.reply_text(f"cProfile sampling started ({perf.PROFILER.sample_rate:.0%} of handler calls).")
+        return
+
+    if args[:2] == ['profile', 'off']:
+        path, summary = perf.PROFILER.stop()
+        text = f"Profile written to {path}\n\n{summary}" if path else summary
+        await update.message.reply_text(text[:4000])
+        return
+
+    tables = "\n\n".join(perf.format_table(category) for category in ('handler', 'flush', 'api'))
+    profiling = f"\ncProfile sampling: on ({perf.PROFILER.sampled} calls)" if perf.PROFILER.enabled else ""
+    await update.message.reply_text(
+        f"⏱ Latency in ms (since start or /perf reset){profiling}\n\n<pre>{html.escape(tables)[:3900]}</pre>",
+        parse_mode='HTML'
+    )
+
+async def day_rollover_job(context: CallbackContext) -> None:
+    today_key = get_data_key()
+
+    # The archived days keep their rollups, so /report still covers them.
+    moved = await archive_finished_days(context.application.bot_data, today_key)
+    for chat_id, day_key in moved:
+        note_group_data(context.application.bot_data, chat_id)
+        mark_dirty(context, ('archive_day', chat_id, day_key))
+    if moved:
+        # Persist the move right away rather than at the next write-behind flush, so a
+        # restart does not find the days in group_data again.
+        await context.application.update_persistence()
+
+    await asyncio.to_thread(prune_archive, datetime.strptime(today_key, '%Y-%m-%d').date())
+
+async def chat_prune_job(context: CallbackContext) -> None:
+    # Drops chats not heard from in CHAT_INACTIVE_DAYS, so /broadcast and /listgroups only
+    # touch live chats; a dropped chat registers again with its next message. A shard worker
+    # gets a predicate in job.data and only looks after the chats it owns.
+    bot_data = context.application.bot_data
+    owns = context.job.data
+
+    unseen = unseen_chats(bot_data, owns)
+    if unseen:
+        mark_dirty(context, ('seen', stamp_unseen(bot_data, unseen)))
+
+    inactive = [chat_id for chat_id in inactive_chats(bot_data) if owns is None or owns(chat_id)]
+    for chat_id in inactive:
+        mark_dirty(context, drop_chat(bot_data, chat_id))
+    if inactive:
+        logger.info("Dropped %d chats inactive for %d days", len(inactive), CHAT_INACTIVE_DAYS)
+
+async def rollup_backfill_job(context: CallbackContext) -> None:
+    # One-off: count the reports collected before rollups existed. Live days are recounted
+    # from group_data; archived days are read from the archive on a worker thread.
+    bot_data = context.application.bot_data
+    if bot_data.get(ROLLUPS_BUILT_KEY):
+        return
+
+    day_rollups = []
+    for chat_id, days in list(bot_data.get('group_data', {}).items()):
+        for day in list(days):
+            day_rollups.append((chat_id, day, count_records(get_day_reports(bot_data, chat_id, day))))
+    for chat_id, day, counts in day_rollups:
+        set_day_rollup(bot_data, chat_id, day, counts)
+
+    skip = {chat_id: set(days) for chat_id, days in bot_data.get('rollups', {}).items()}
+    archived = await asyncio.to_thread(list, iter_archived_rollups(skip))
+    for chat_id, day, counts in archived:
+        set_day_rollup(bot_data, chat_id, day, counts)
+
+    # Recorded from the current counters: reports may have come in while the archive was read.
+    bot_data[ROLLUPS_BUILT_KEY] = True
+    counted = ((chat_id, day, day_rollup_counts(bot_data, chat_id, day)) for chat_id, day, _ in day_rollups + archived)
+    mark_dirty(context, ('rollups', tuple(entry for entry in counted if entry[2] is not None)))
+    logger.info("Built report rollups for %d days", len(day_rollups) + len(archived))
+
+def build_application(persistence, polling: bool = True, request=None, shard=None) -> Application:
+    # Bot API calls go through a timed transport so /perf and /metrics can break them down by
+    # method; getUpdates keeps its own connection and is not timed (it is a long poll).
+    # `request` replaces that transport, e.g. with a stub Bot API in benchmarks/load_test.py.
+    # All calls are paced by the Outbox, which also delivers the replies handlers queue.
+    builder = (
         Application.builder()
         .token(TOKEN)
         .persistence(persistence)
-        .build()
+        .request(request or TimedHTTPXRequest(connection_pool_size=256))
+        .rate_limiter(Outbox())
     )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(TELEGRAM_API_URL)
+    update_processor = build_update_processor()
+    if update_processor:
+        builder = builder.concurrent_updates(update_processor)
+    if not polling:
+        # Updates arrive through a webhook or a shard dispatcher; no polling Updater needed.
+        builder = builder.updater(None)
+    application = builder.build()
+
+    application.add_handler(TypeHandler(Update, remember_chat), group=-1)
+    application.add_handler(ChatMemberHandler(chat_member_updated, ChatMemberHandler.MY_CHAT_MEMBER))
+    application.add_handler(MessageHandler(filters.StatusUpdate.MIGRATE, chat_migrated))
 
     application.add_handler(CommandHandler("menu", main_menu_command))
     application.add_handler(CommandHandler("hidemenu", remove_menu))
@@ -699,23 +1289,29 @@ def main():
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("showdata", show_data))
     application.add_handler(CommandHandler("cleardata", clear_data))
+    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(CommandHandler("report", report_command))
+    application.add_handler(CommandHandler("commbatch", commission_batch_command))
     application.add_handler(CommandHandler("chk", check_command))
 
     application.add_handler(CommandHandler("form", report_form_command))
 
     application.add_handler(CommandHandler("settings", admin_settings_command))
     application.add_handler(CommandHandler("stats", stats))
+    application.add_handler(CommandHandler("perf", perf_command))
 
     application.add_handler(CommandHandler("listgroups", list_groups))
 
     application.add_handler(CallbackQueryHandler(clear_group_data_callback, pattern='^admin_clear_-'))
     application.add_handler(CallbackQueryHandler(cancel_group_action, pattern='^admin_cancel$'))
+    application.add_handler(CallbackQueryHandler(list_groups_page, pattern='^listgroups_'))
+    application.add_handler(CallbackQueryHandler(show_data_page, pattern='^showdata_'))
 
     comm_handler = ConversationHandler(
         entry_points=[CommandHandler("comm", commission_start)],
         states={
             COMMISSION_AMOUNT: [
-                CallbackQueryHandler(request_amount, pattern='^comm_(killer|deposit|m1)$'),
+                CallbackQueryHandler(request_amount, pattern=f"^comm_({'|'.join(COMMISSION_RATES)})$"),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, calculate_commission)
             ],
         },
@@ -741,7 +1337,7 @@ def main():
     broadcast_handler = ConversationHandler(
         entry_points=[CommandHandler("broadcast", broadcast_start, filters=filters.User(ADMIN_IDS))],
         states={
-            BROADCAST_SELECT_CHAT: [CallbackQueryHandler(broadcast_select_chat, pattern='^bcast_id_')],
+            BROADCAST_SELECT_CHAT: [CallbackQueryHandler(broadcast_select_chat, pattern='^bcast_(id_|all)')],
             BROADCAST_AWAITING_MESSAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, broadcast_await_message)],
             BROADCAST_CONFIRMATION: [CallbackQueryHandler(broadcast_confirm, pattern='^bcast_confirm$')]
         },
@@ -753,15 +1349,52 @@ def main():
     )
     application.add_handler(broadcast_handler)
 
+    table_documents = filters.Document.FileExtension('txt') | filters.Document.FileExtension('csv')
+    application.add_handler(MessageHandler(table_documents & filters.CaptionRegex(r'^/commbatch'), commission_batch_document))
+    # Only files captioned /chk: other uploads (spreadsheets, /export files) are not checked.
+    application.add_handler(MessageHandler(table_documents & filters.CaptionRegex(r'^/chk\b'), bulk_check_document))
     application.add_handler(MessageHandler((filters.TEXT & ~filters.COMMAND) | filters.CAPTION, extract_and_save_data))
 
-    application.run_polling(poll_interval=1.0)
+    # Archive finished business days at every cut-off, and once at startup for anything left
+    # over from while the bot was down.
+    if application.job_queue:
+        rollover_time = time(DAY_CUT_OFF_TIME.hour, DAY_CUT_OFF_TIME.minute, tzinfo=get_yangon_tz())
+        application.job_queue.run_daily(day_rollover_job, time=rollover_time, name='day_rollover')
+        application.job_queue.run_once(day_rollover_job, when=0, name='day_rollover_startup')
+        application.job_queue.run_once(rollup_backfill_job, when=0, name='rollup_backfill')
+        # `shard` is (index, count) in a shard worker, which only prunes the chats it owns.
+        owns = (lambda chat_id: shard_of(chat_id, shard[1]) == shard[0]) if shard else None
+        application.job_queue.run_daily(chat_prune_job, time=rollover_time, name='chat_prune', data=owns)
+        application.job_queue.run_once(chat_prune_job, when=0, name='chat_prune_startup', data=owns)
+        application.job_queue.run_repeating(
+            chat_cache_refresh_job, interval=CHAT_CACHE_REFRESH_INTERVAL, first=10, name='chat_cache_refresh'
+        )
+    else:
+        logging.warning("JobQueue not available; finished days will not be archived automatically.")
+
+    instrument_handlers(application)
+    return application
 
-if __name__ == '__main__':
-    try:
-        from web_server import keep_alive
-        keep_alive()
-    except ImportError:
-        pass
+def main():
+    if not TOKEN:
+        return
 
+    if SHARD_WORKERS > 1:
+        # Front dispatcher plus SHARD_WORKERS processes, each running build_application().
+        run_sharded(TOKEN, TELEGRAM_API_URL)
+        return
+
+    application = build_application(build_persistence(), polling=BOT_MODE != 'webhook')
+
+    # Keep-alive, /healthz and /metrics are served from the bot's own event loop.
+    server = WebServer()
+    add_monitoring_routes(server, application)
+
+    if BOT_MODE == 'webhook':
+        asyncio.run(run_webhook(application, server))
+    else:
+        attach_to_polling(application, server)
+        application.run_polling(poll_interval=1.0, allowed_updates=Update.ALL_TYPES)
+
+if __name__ == '__main__':
     main()
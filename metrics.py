@@ -0,0 +1,209 @@
+import time
+import functools
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+from telegram.request import HTTPXRequest
+import perf
+
+# A minimal Prometheus text-format registry. The bot only needs counters and histograms with
+# a single label plus a few gauges computed at scrape time, which does not justify another
+# dependency.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, label: str) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.values: Dict[str, float] = {}
+
+    def inc(self, label_value: str, amount: float = 1) -> None:
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_value, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{{{self.label}="{label_value}"}} {value:g}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, label: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = buckets
+        # label value -> [per-bucket counts (last one is +Inf), sum, count]
+        self.series: Dict[str, list] = {}
+
+    def observe(self, label_value: str, value: float) -> None:
+        series = self.series.get(label_value)
+        if series is None:
+            series = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_value, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {count}')
+        return lines
+
+
+class Gauge:
+    """A gauge whose samples are computed by `collect` at scrape time."""
+
+    def __init__(self, name: str, documentation: str, collect: Callable[[], Dict[Optional[str], float]],
+                 label: Optional[str] = None) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+        self.label = label
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for label_value, value in sorted(self.collect().items(), key=lambda item: str(item[0])):
+            labels = f'{{{self.label}="{label_value}"}}' if self.label else ''
+            lines.append(f'{self.name}{labels} {value:g}')
+        return lines
+
+
+UPDATES = Counter('bot_updates_total', 'Updates handled, by handler callback.', 'handler')
+HANDLER_ERRORS = Counter('bot_handler_errors_total', 'Handler callbacks that raised, by handler.', 'handler')
+HANDLER_LATENCY = Histogram('bot_handler_latency_seconds', 'Handler callback run time.', 'handler')
+FLUSH_LATENCY = Histogram('bot_persistence_flush_seconds', 'Time spent writing bot data.', 'backend')
+FLUSH_BYTES = Counter('bot_persistence_flush_bytes_total', 'Bytes written by persistence flushes.', 'backend')
+API_LATENCY = Histogram('bot_api_latency_seconds', 'Outbound Bot API request time, by method.', 'method')
+
+REGISTRY: list = [UPDATES, HANDLER_ERRORS, HANDLER_LATENCY, FLUSH_LATENCY, FLUSH_BYTES, API_LATENCY]
+
+
+class Health:
+    started_at = time.time()
+    last_update_at: Optional[float] = None
+    last_flush_at: Optional[float] = None
+
+
+def observe_flush(backend: str, seconds: float, written: int) -> None:
+    FLUSH_LATENCY.observe(backend, seconds)
+    perf.observe('flush', backend, seconds)
+    FLUSH_BYTES.inc(backend, written)
+    Health.last_flush_at = time.time()
+
+
+def register(metric) -> None:
+    """Add `metric` to REGISTRY, replacing an earlier metric of the same name, so building a
+    second application (tests, shard workers) does not render every series twice."""
+    for index, registered in enumerate(REGISTRY):
+        if registered.name == metric.name:
+            REGISTRY[index] = metric
+            return
+    REGISTRY.append(metric)
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+def timed_callback(callback: Callable) -> Callable:
+    name = getattr(callback, '__name__', repr(callback))
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        profiled = perf.PROFILER.should_sample()
+        if profiled:
+            perf.PROFILER.enter()
+        started = time.perf_counter()
+        try:
+            result = await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            if profiled:
+                perf.PROFILER.exit()
+            HANDLER_LATENCY.observe(name, elapsed)
+            perf.observe('handler', name, elapsed)
+            UPDATES.inc(name)
+        Health.last_update_at = time.time()
+        return result
+
+    wrapper.__wrapped_for_metrics__ = True
+    return wrapper
+
+
+class TimedHTTPXRequest(HTTPXRequest):
+    """The default Bot API transport, timing every request by API method."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            API_LATENCY.observe(api_method, elapsed)
+            perf.observe('api', api_method, elapsed)
+
+
+def instrument_handlers(application) -> None:
+    """Time the callback of every handler registered on `application`, including the ones
+    nested in ConversationHandlers. Call it once all handlers are added."""
+    from telegram.ext import ConversationHandler
+
+    def instrument(handler) -> None:
+        if isinstance(handler, ConversationHandler):
+            nested = list(handler.entry_points) + list(handler.fallbacks)
+            for state_handlers in handler.states.values():
+                nested.extend(state_handlers)
+            for inner in nested:
+                instrument(inner)
+        elif not getattr(handler.callback, '__wrapped_for_metrics__', False):
+            handler.callback = timed_callback(handler.callback)
+
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            instrument(handler)
+
+
+def register_application_gauges(application) -> None:
+    def bot_data_sizes() -> Dict[Optional[str], float]:
+        bot_data = application.bot_data
+        group_data = bot_data.get('group_data', {})
+        return {
+            'users': len(bot_data.get('users', ())),
+            'groups': len(bot_data.get('groups', ())),
+            'check_records': len(bot_data.get('check_records', ())),
+            # Reports currently held in memory, over all chats and days.
+            'group_data': sum(len(day) for days in group_data.values() for day in days.values()),
+        }
+
+    def outbox_counts() -> Dict[Optional[str], float]:
+        outbox = application.bot.rate_limiter
+        if outbox is None:
+            return {}
+        return {
+            'queued': getattr(outbox, 'queued', 0),
+            'coalesced': getattr(outbox, 'coalesced', 0),
+            'retried': getattr(outbox, 'retried', 0),
+        }
+
+    for gauge in (
+        Gauge('bot_update_queue_depth', 'Updates received but not yet picked up.',
+              lambda: {None: application.update_queue.qsize()}),
+        Gauge('bot_update_chats_pending', 'Chats with updates waiting for or in processing.',
+              lambda: {None: getattr(application.update_processor, 'pending_chats', 0)}),
+        Gauge('bot_outbox_messages', 'Queued replies waiting to be sent, replies joined into another and flood-control retries.',
+              outbox_counts, label='state'),
+        Gauge('bot_data_entries', 'Size of the main bot_data collections.', bot_data_sizes, label='key'),
+    ):
+        register(gauge)
@@ -0,0 +1,310 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import deque
+from typing import Any, Callable, Coroutine, Deque, Dict, List, NamedTuple, Optional, Tuple, Union
+from telegram import Bot, Chat, ReplyParameters, Update
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import BaseRateLimiter
+from telegram.constants import MessageLimit
+from broadcast import retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+# Every Bot API call of the application goes through the Outbox (it is the bot's rate
+# limiter). Calls wait for a token of their chat's bucket and of the global bucket; when
+# tokens are short, lower priority classes wait behind higher ones. Telegram allows about
+# 30 messages per second overall, one per second into a private chat and 20 per minute into
+# a group; the defaults stay a little below that and allow short bursts.
+OUTBOX_RATE = float(os.getenv('OUTBOX_RATE', '28'))
+OUTBOX_CHAT_RATE = float(os.getenv('OUTBOX_CHAT_RATE', '1'))
+OUTBOX_CHAT_BURST = float(os.getenv('OUTBOX_CHAT_BURST', '3'))
+OUTBOX_GROUP_RATE = float(os.getenv('OUTBOX_GROUP_RATE', str(19 / 60)))
+OUTBOX_GROUP_BURST = float(os.getenv('OUTBOX_GROUP_BURST', '5'))
+OUTBOX_MAX_RETRIES = int(os.getenv('OUTBOX_MAX_RETRIES', '3'))
+# Flood limits count messages; other calls (getChat, answerCallbackQuery, ...) are not paced.
+PACED_ENDPOINTS = ('send', 'edit', 'copy', 'forward')
+# How long shutdown waits for queued messages to go out.
+OUTBOX_DRAIN_TIMEOUT = float(os.getenv('OUTBOX_DRAIN_TIMEOUT', '10'))
+
+# Priority classes, passed as rate_limit_args. Lower goes first.
+INTERACTIVE = 0
+ADMIN = 1
+BULK = 2
+
+# Messages queued with Outbox.send to the same chat are joined into one while they wait for
+# their turn, as long as they are plain (no keyboard, same parse mode), reply to the same
+# message (or none) and fit in one message.
+COALESCE_SEPARATOR = '\n\n'
+
+
+class PriorityBucket:
+    """A token bucket that hands tokens to the waiting callers in priority order.
+
+    hold() empties the bucket for a while, e.g. for the retry_after of a flood-control error.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return not self._waiting and self.tokens >= self.capacity
+
+    def hold(self, seconds: float) -> None:
+        self._refill()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    async def acquire(self, priority: int = INTERACTIVE) -> None:
+        self._refill()
+        if not self._waiting and self.tokens >= 1:
+            self.tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._order), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self) -> None:
+        while self._waiting:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            _, _, future = heapq.heappop(self._waiting)
+            # A caller that was cancelled while waiting does not use up a token.
+            if not future.done():
+                self.tokens -= 1
+                future.set_result(None)
+
+
+class Outgoing(NamedTuple):
+    chat_id: Union[int, str]
+    text: str
+    priority: int
+    parse_mode: Optional[str]
+    reply_to: Optional[int]
+    reply_markup: Any
+
+    def merge(self, other: 'Outgoing') -> Optional['Outgoing']:
+        if self.reply_markup is not None or other.reply_markup is not None or self.parse_mode != other.parse_mode:
+            return None
+        # A merged message can quote only one message: in a group, replies to different
+        # members stay apart.
+        if self.reply_to != other.reply_to:
+            return None
+        text = self.text + COALESCE_SEPARATOR + other.text
+        if len(text) > MessageLimit.MAX_TEXT_LENGTH:
+            return None
+        return self._replace(text=text, priority=min(self.priority, other.priority))
+
+
+def request_chat_id(data: Dict[str, Any]) -> Optional[Union[int, str]]:
+    chat_id = data.get('chat_id')
+    return chat_id if isinstance(chat_id, (int, str)) else None
+
+
+def is_group_chat(chat_id: Union[int, str]) -> bool:
+    # Group and channel ids are negative; '@name' addresses a public group or channel.
+    return isinstance(chat_id, str) or chat_id < 0
+
+
+class Outbox(BaseRateLimiter):
+    """The central scheduler for outgoing Bot API calls.
+
+    As the bot's rate limiter it paces every message with a global and a per-chat PriorityBucket
+    and retries calls that hit flood control (RetryAfter) after holding the affected bucket
+    for the time Telegram asks for. Handlers that do not need the sent Message use send(),
+    which queues the message and returns at once; a per-chat sender task then delivers the
+    queue in order, joining consecutive short messages into one.
+    """
+
+    __slots__ = ('rate', 'chat_rate', 'chat_burst', 'group_rate', 'group_burst', 'max_retries',
+                 'coalesced', 'retried', '_global', '_chats', '_prune_at', '_queues', '_senders')
+
+    def __init__(self, rate: float = OUTBOX_RATE, chat_rate: float = OUTBOX_CHAT_RATE,
+                 chat_burst: float = OUTBOX_CHAT_BURST, group_rate: float = OUTBOX_GROUP_RATE,
+                 group_burst: float = OUTBOX_GROUP_BURST, max_retries: int = OUTBOX_MAX_RETRIES) -> None:
+        self.rate = rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self.coalesced = 0
+        self.retried = 0
+        self._global = PriorityBucket(rate)
+        self._chats: Dict[Union[int, str], PriorityBucket] = {}
+        self._prune_at = 1024
+        self._queues: Dict[Union[int, str], Deque[Outgoing]] = {}
+        self._senders: Dict[Union[int, str], asyncio.Task] = {}
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def initialize(self) -> None:
+        pass
+
+    async def join(self) -> None:
+        """Wait until every message queued with send() has been delivered (or has failed)."""
+        while self._senders:
+            await asyncio.wait(list(self._senders.values()))
+
+    async def shutdown(self) -> None:
+        senders = list(self._senders.values())
+        if not senders:
+            return
+        done, pending = await asyncio.wait(senders, timeout=OUTBOX_DRAIN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning("Outbox shut down with %d chats' messages unsent", len(pending))
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> PriorityBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self._prune_at:
+                # Buckets that are full again carry no state worth keeping.
+                for key in [key for key, bucket in self._chats.items() if bucket.idle]:
+                    del self._chats[key]
+                self._prune_at = max(1024, 2 * len(self._chats))
+            if is_group_chat(chat_id):
+                bucket = PriorityBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = PriorityBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        priority = INTERACTIVE if rate_limit_args is None else rate_limit_args
+        paced = endpoint.startswith(PACED_ENDPOINTS)
+        chat_id = request_chat_id(data)
+
+        for attempt in range(self.max_retries + 1):
+            chat_bucket = self._chat_bucket(chat_id) if paced and chat_id is not None else None
+            if chat_bucket is not None:
+                # First come, first served within a chat: by priority, a busy conversation
+                # could hold back a broadcast into the same chat indefinitely.
+                await chat_bucket.acquire()
+            if paced:
+                await self._global.acquire(priority)
+
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                seconds = retry_after_seconds(e)
+                logger.info("%s to %s hit flood control; retrying in %.0fs", endpoint, chat_id, seconds)
+                self.retried += 1
+                if paced:
+                    (chat_bucket or self._global).hold(seconds)
+                else:
+                    await asyncio.sleep(seconds)
+
+    def send(self, bot: Bot, chat_id: Union[int, str], text: str, priority: int = INTERACTIVE,
+             parse_mode: Optional[str] = None, reply_to: Optional[int] = None, reply_markup: Any = None) -> None:
+        """Queue a message for `chat_id` and return without waiting for it to be sent."""
+        item = Outgoing(chat_id, text, priority, parse_mode, reply_to, reply_markup)
+        self._queues.setdefault(chat_id, deque()).append(item)
+        if chat_id not in self._senders:
+            self._senders[chat_id] = asyncio.create_task(self._deliver(bot, chat_id))
+
+    async def _deliver(self, bot: Bot, chat_id: Union[int, str]) -> None:
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                # Whatever piled up while the previous message waited for its turn goes
+                # out together.
+                item = queue.popleft()
+                while queue:
+                    merged = item.merge(queue[0])
+                    if merged is None:
+                        break
+                    item = merged
+                    queue.popleft()
+                    self.coalesced += 1
+
+                reply_parameters = (
+                    ReplyParameters(item.reply_to, allow_sending_without_reply=True) if item.reply_to else None
+                )
+                try:
+                    await bot.send_message(
+                        chat_id=item.chat_id, text=item.text, parse_mode=item.parse_mode,
+                        reply_parameters=reply_parameters, reply_markup=item.reply_markup,
+                        rate_limit_args=item.priority,
+                    )
+                except TelegramError as e:
+                    logger.warning("Queued message to %s failed: %s", chat_id, e)
+        finally:
+            del self._queues[chat_id]
+            del self._senders[chat_id]
+
+
+def get_outbox(bot: Bot) -> Optional[Outbox]:
+    rate_limiter = getattr(bot, 'rate_limiter', None)
+    return rate_limiter if isinstance(rate_limiter, Outbox) else None
+
+
+# Background sends of bots built without an Outbox. The event loop only keeps weak references
+# to tasks, so they are held here until done.
+_unqueued_sends = set()
+
+
+def _unqueued_send_done(task: asyncio.Task) -> None:
+    _unqueued_sends.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Background message failed: %s", task.exception())
+
+
+def queue_message(bot: Bot, chat_id: Union[int, str], text: str, priority: int = INTERACTIVE, **kwargs) -> None:
+    outbox = get_outbox(bot)
+    if outbox is not None:
+        outbox.send(bot, chat_id, text, priority, **kwargs)
+        return
+    # No outbox (a bot built without one): send in the background all the same.
+    reply_to = kwargs.pop('reply_to', None)
+    if reply_to:
+        kwargs['reply_parameters'] = ReplyParameters(reply_to, allow_sending_without_reply=True)
+    task = asyncio.create_task(bot.send_message(chat_id=chat_id, text=text, **kwargs))
+    _unqueued_sends.add(task)
+    task.add_done_callback(_unqueued_send_done)
+
+
+async def join_unqueued() -> None:
+    """Wait until the background sends of bots without an Outbox are done."""
+    while _unqueued_sends:
+        await asyncio.wait(list(_unqueued_sends))
+
+
+def queue_reply(update: Update, text: str, priority: int = INTERACTIVE, **kwargs) -> None:
+    """The queued counterpart of update.message.reply_text: quotes the message in groups."""
+    message = update.effective_message
+    reply_to = message.message_id if message.chat.type != Chat.PRIVATE else None
+    queue_message(message.get_bot(), message.chat_id, text, priority, reply_to=reply_to, **kwargs)
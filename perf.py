@@ -0,0 +1,146 @@
+import os
+import io
+import math
+import time
+import pstats
+import random
+import cProfile
+from typing import Dict, List, Optional, Tuple
+
+# Latency tables for /perf. Every series is a fixed array of log-spaced buckets (about 5%
+# apart, from 10 microseconds to ~100 seconds), so memory does not grow with traffic and
+# p50/p95/p99 are exact to within one bucket.
+PERF_MIN_SECONDS = 1e-5
+PERF_BUCKET_GROWTH = 1.05
+PERF_BUCKETS = int(math.log(1e7) / math.log(PERF_BUCKET_GROWTH)) + 2
+PERF_PROFILE_DIR = os.getenv('PERF_PROFILE_DIR', '.')
+PERF_PROFILE_SAMPLE = float(os.getenv('PERF_PROFILE_SAMPLE', '0.1'))
+
+
+class LatencyHistogram:
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self) -> None:
+        self.counts = [0] * PERF_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def bucket(seconds: float) -> int:
+        if seconds <= PERF_MIN_SECONDS:
+            return 0
+        index = int(math.log(seconds / PERF_MIN_SECONDS) / math.log(PERF_BUCKET_GROWTH)) + 1
+        return min(index, PERF_BUCKETS - 1)
+
+    @staticmethod
+    def upper_bound(index: int) -> float:
+        return PERF_MIN_SECONDS * PERF_BUCKET_GROWTH ** index
+
+    def observe(self, seconds: float) -> None:
+        self.counts[self.bucket(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+
+
+# category ('handler', 'flush', 'api') -> name -> histogram
+TABLES: Dict[str, Dict[str, LatencyHistogram]] = {'handler': {}, 'flush': {}, 'api': {}}
+
+
+def observe(category: str, name: str, seconds: float) -> None:
+    table = TABLES[category]
+    histogram = table.get(name)
+    if histogram is None:
+        histogram = table[name] = LatencyHistogram()
+    histogram.observe(seconds)
+
+
+def reset() -> None:
+    for table in TABLES.values():
+        table.clear()
+
+
+def format_table(category: str, limit: int = 25) -> str:
+    rows = sorted(TABLES[category].items(), key=lambda item: item[1].total, reverse=True)[:limit]
+    if not rows:
+        return f"{category}: no samples"
+
+    lines = [f"{category:<24} {'n':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"]
+    for name, histogram in rows:
+        lines.append(
+            f"{name[:24]:<24} {histogram.count:>7} "
+            + " ".join(f"{value * 1000:>8.1f}" for value in (
+                histogram.quantile(0.5), histogram.quantile(0.95), histogram.quantile(0.99), histogram.max
+            ))
+        )
+    return "\n".join(lines)
+
+
+class SamplingProfiler:
+    """cProfile over a random sample of handler calls, switched on and off at runtime.
+
+    Only one call is profiled at a time. Handlers are coroutines, so whatever else the event
+    loop runs while a sampled handler awaits is attributed to the same profile; the dump is a
+    picture of where the loop spends its time around the sampled handlers, not an exact
+    per-handler breakdown.
+    """
+
+    def __init__(self) -> None:
+        self.profile: Optional[cProfile.Profile] = None
+        self.sample_rate = PERF_PROFILE_SAMPLE
+        self.active = False
+        self.sampled = 0
+        self.started_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.profile is not None
+
+    def start(self, sample_rate: float = PERF_PROFILE_SAMPLE) -> None:
+        self.profile = cProfile.Profile()
+        self.sample_rate = sample_rate
+        self.sampled = 0
+        self.started_at = time.time()
+
+    def should_sample(self) -> bool:
+        return self.profile is not None and not self.active and random.random() < self.sample_rate
+
+    def enter(self) -> None:
+        self.active = True
+        self.sampled += 1
+        self.profile.enable()
+
+    def exit(self) -> None:
+        if self.profile is not None:
+            self.profile.disable()
+        self.active = False
+
+    def stop(self, top: int = 15) -> Tuple[Optional[str], str]:
+        """Stop profiling; returns the path of the .prof dump and a short text summary."""
+        profile, self.profile = self.profile, None
+        if profile is None or not self.sampled:
+            return None, "No handler calls were sampled."
+
+        path = os.path.join(PERF_PROFILE_DIR, f"perf_{time.strftime('%Y%m%d_%H%M%S')}.prof")
+        profile.dump_stats(path)
+
+        output = io.StringIO()
+        pstats.Stats(profile, stream=output).sort_stats('cumulative').print_stats(top)
+        lines: List[str] = [line for line in output.getvalue().splitlines() if line.strip()]
+        return path, "\n".join(lines)
+
+
+PROFILER = SamplingProfiler()
@@ -0,0 +1,115 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from check_store import as_number
+from report_parser import MISSING
+from report_store import ReportRecord, get_day_reports
+
+# Duplicate detection: bot_data['report_index'] maps the normalized Gmail and phone of every
+# report of the current business day, in any chat, to where it was first reported. A new
+# report is looked up by its keys before it is stored, one dict lookup per key. The index is
+# derived from group_data: it is not persisted and is rebuilt from the day's reports after a
+# restart, at the first report of a new day, or after reports were cleared.
+EMAIL_PATTERN = re.compile(r'[^\s@]+@[^\s@]+\.[^\s@]+')
+GMAIL_DOMAINS = ('gmail.com', 'googlemail.com')
+
+
+class ReportSighting(NamedTuple):
+    chat_id: str
+    khaifa: str
+    tele_name: str
+    # When the report came in; None for reports indexed again after a restart.
+    submitted: Optional[float]
+
+
+def normalize_email(text: str) -> Optional[str]:
+    match = EMAIL_PATTERN.search(text)
+    if not match:
+        return None
+    local, _, domain = match.group(0).lower().rpartition('@')
+    if domain in GMAIL_DOMAINS:
+        # Gmail ignores dots and anything after '+' in the address.
+        local = local.split('+', 1)[0].replace('.', '')
+        domain = 'gmail.com'
+    return f"{local}@{domain}"
+
+
+def normalize_phone(text: str) -> Optional[str]:
+    number = as_number(text)
+    if number and number.startswith('95') and len(number) > 9:
+        # +95 9... and 09... are the same Myanmar number.
+        number = '0' + number[2:]
+    return number
+
+
+def report_keys(record: ReportRecord) -> List[str]:
+    keys = []
+    for value in (record.contact, record.phone):
+        if not value or value == MISSING:
+            continue
+        email = normalize_email(value)
+        key = f"email:{email}" if email else None
+        if key is None:
+            phone = normalize_phone(value)
+            key = f"phone:{phone}" if phone else None
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def describe_key(key: str) -> str:
+    kind, _, value = key.partition(':')
+    return f"{'Gmail' if kind == 'email' else 'Phone'} {value}"
+
+
+class ReportIndex:
+    __slots__ = ('day', 'entries')
+
+    def __init__(self) -> None:
+        self.day: Optional[str] = None
+        self.entries: Dict[str, ReportSighting] = {}
+
+    def __reduce__(self):
+        # Derived data: pickled (and deep-copied for persistence) empty, rebuilt on first use.
+        return ReportIndex, ()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _rebuild(self, bot_data: dict, day: str) -> None:
+        self.entries = {}
+        for chat_id in list(bot_data.get('group_data', {})):
+            for record in get_day_reports(bot_data, chat_id, day) or ():
+                self._add(chat_id, record, None)
+        self.day = day
+
+    def _add(self, chat_id: str, record: ReportRecord, submitted: Optional[float]) -> List[Tuple[str, ReportSighting]]:
+        duplicates = []
+        for key in report_keys(record):
+            seen = self.entries.get(key)
+            if seen is None:
+                self.entries[key] = ReportSighting(chat_id, record.khaifa, record.tele_name, submitted)
+            else:
+                duplicates.append((key, seen))
+        return duplicates
+
+    def add(self, bot_data: dict, chat_id: str, day: str, record: ReportRecord,
+            submitted: float) -> List[Tuple[str, ReportSighting]]:
+        """Index a report about to be stored; returns the earlier sightings of its keys.
+
+        Must be called before the report is added to group_data.
+        """
+        if self.day != day:
+            self._rebuild(bot_data, day)
+        return self._add(chat_id, record, submitted)
+
+    def discard(self, chat_id: str, day: Optional[str] = None) -> None:
+        # Reports were cleared; rebuilding is cheaper than finding their keys.
+        self.day = None
+
+
+def get_report_index(bot_data: dict) -> ReportIndex:
+    # Shard workers hold a shared_store.SharedReportIndex instead.
+    index = bot_data.get('report_index')
+    if index is None:
+        index = bot_data['report_index'] = ReportIndex()
+    return index
@@ -0,0 +1,96 @@
+import re
+from typing import NamedTuple, Optional
+
+REPORT_TEMPLATE = (
+    "Gmail        - \n"
+    "  \n"
+    "Tele name    - \n"
+    "    \n"
+    "Username    - \n"
+    "    \n"
+    "Date        - \n"
+    "    \n"
+    "Age         - \n"
+    "    \n"
+    "Current work - \n"
+    "    \n"
+    "Phone number      - \n"
+    "\n"
+    "Khaifa - "
+)
+
+# Each field is the first occurrence of its label, followed by an optional dash surrounded by
+# whitespace; as before, blank lines between the label and the value are skipped and the value
+# then runs to the end of its line. Khaifa/Date/Gmail keep the loose substring matching the
+# bot has always used; "Age" must be a whole word so e.g. "message" does not count. The order
+# is that of ParsedReport's fields; the contact is whichever of Gmail / Email / Phone comes
+# first.
+FIELD_LABELS = (
+    r"khaifa|khat",
+    r"date",
+    r"gmail|email|phone number|phone",
+    r"tele\s*name",
+    r"user\s*name",
+    r"\bage\b",
+    r"current\s*work",
+    r"phone number",
+)
+SEPARATOR = r"\s*[\-\–]?\s*"
+
+# The labels are searched for in the lowercased message, where a case-sensitive pattern
+# lets the regex engine jump straight to its literal prefix. re's case-insensitive matching
+# also takes 'ı' and 'İ' for i and 'ſ' for s, which lower() does not (and 'İ' lowercases
+# to two characters), so messages containing them are searched case-insensitively instead.
+FIELD_SEARCHES = tuple(re.compile(f"(?:{label}){SEPARATOR}").search for label in FIELD_LABELS)
+CASELESS_FIELD_SEARCHES = tuple(
+    re.compile(f"(?:{label}){SEPARATOR}", re.IGNORECASE).search for label in FIELD_LABELS
+)
+CASELESS_KHAIFA = re.compile("khaifa", re.IGNORECASE)
+CASELESS_DATE = re.compile("date", re.IGNORECASE)
+
+MISSING = "N/A"
+
+
+class ParsedReport(NamedTuple):
+    khaifa: str
+    date: str
+    contact: str
+    tele_name: str
+    username: str
+    age: str
+    current_work: str
+    phone: str
+
+    @property
+    def summary(self) -> str:
+        return f"{self.date}    {self.khaifa}    {self.contact}"
+
+
+def _values(text: str, haystack: str, searches: tuple) -> ParsedReport:
+    values = []
+    for search in searches:
+        match = search(haystack)
+        if match is None:
+            values.append(MISSING)
+            continue
+        start = match.end()
+        end = text.find('\n', start)
+        values.append(text[start:end].strip() if end >= 0 else text[start:].strip())
+    return ParsedReport(*values)
+
+
+def parse_report(text: str) -> Optional[ParsedReport]:
+    """Parse a REPORT_TEMPLATE-shaped message, or return None if it is not a report.
+
+    A message counts as a report when it mentions both "Khaifa" and "Date"; most messages
+    are turned away by that substring test alone.
+    """
+    lowered = text.lower()
+    if len(lowered) == len(text) and 'ı' not in lowered and 'ſ' not in lowered:
+        if 'khaifa' not in lowered or 'date' not in lowered:
+            return None
+        return _values(text, lowered, FIELD_SEARCHES)
+
+    if not (CASELESS_KHAIFA.search(text) and CASELESS_DATE.search(text)):
+        return None
+    return _values(text, text, CASELESS_FIELD_SEARCHES)
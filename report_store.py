@@ -0,0 +1,161 @@
+from bisect import insort
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+from report_parser import MISSING, ParsedReport
+
+# /showdata pages stay below Telegram's 4096-character message limit.
+PAGE_LIMIT = 4000
+GROUP_SEPARATOR = "------------------------------------"
+
+
+def khaifa_key(khaifa: str) -> str:
+    return khaifa.replace(" ", "").lower()
+
+
+class ReportRecord(NamedTuple):
+    date: str
+    khaifa: str
+    contact: str
+    khaifa_key: str
+    tele_name: str = MISSING
+    username: str = MISSING
+    age: str = MISSING
+    current_work: str = MISSING
+    phone: str = MISSING
+
+    @classmethod
+    def from_parsed(cls, report: ParsedReport) -> 'ReportRecord':
+        return cls(
+            date=report.date,
+            khaifa=report.khaifa,
+            contact=report.contact,
+            khaifa_key=khaifa_key(report.khaifa),
+            tele_name=report.tele_name,
+            username=report.username,
+            age=report.age,
+            current_work=report.current_work,
+            phone=report.phone,
+        )
+
+    @classmethod
+    def from_summary(cls, entry: str) -> 'ReportRecord':
+        # Reports used to be stored as the bare "date    khaifa    contact" line.
+        parts = entry.split('    ', 2)
+        date = parts[0]
+        khaifa = parts[1].strip() if len(parts) >= 2 else MISSING
+        contact = parts[2] if len(parts) >= 3 else MISSING
+        return cls(date=date, khaifa=khaifa, contact=contact, khaifa_key=khaifa_key(khaifa))
+
+    @property
+    def summary(self) -> str:
+        return f"{self.date}    {self.khaifa}    {self.contact}"
+
+
+def as_record(entry) -> ReportRecord:
+    # Data written before reports were structured (group_data lists, journal records) holds
+    # the summary line instead of a ReportRecord.
+    return entry if isinstance(entry, ReportRecord) else ReportRecord.from_summary(entry)
+
+
+class DayReports:
+    """The reports one chat collected on one business day.
+
+    Besides the records in arrival order it keeps them grouped by normalized Khaifa, with the
+    group keys in sorted order, so /showdata can render the day without re-grouping it. The
+    rendered /showdata pages are cached until the next report is added; the cache is not
+    persisted.
+    """
+
+    __slots__ = ('records', 'groups', 'keys', '_pages')
+
+    def __init__(self, records: Tuple[ReportRecord, ...] = ()) -> None:
+        self.records: List[ReportRecord] = []
+        self.groups = {}
+        self.keys: List[str] = []
+        self._pages: Optional[List[str]] = None
+        for record in records:
+            self.add(record)
+
+    def __getstate__(self) -> tuple:
+        return self.records, self.groups, self.keys
+
+    def __setstate__(self, state: tuple) -> None:
+        if state[0] is None:
+            # Pickled before the page cache existed: (None, {slot: value}).
+            state = tuple(state[1][name] for name in ('records', 'groups', 'keys'))
+        self.records, self.groups, self.keys = state
+        self._pages = None
+
+    @classmethod
+    def from_legacy(cls, entries: list) -> 'DayReports':
+        return cls(tuple(as_record(entry) for entry in entries))
+
+    def add(self, record: ReportRecord) -> None:
+        self._pages = None
+        self.records.append(record)
+        group = self.groups.get(record.khaifa_key)
+        if group is None:
+            group = self.groups[record.khaifa_key] = []
+            insort(self.keys, record.khaifa_key)
+        group.append(record)
+
+    def grouped(self) -> Iterator[Tuple[str, List[ReportRecord]]]:
+        for key in self.keys:
+            yield key, self.groups[key]
+
+    def pages(self, limit: int = PAGE_LIMIT) -> List[str]:
+        if self._pages is None:
+            self._pages = self._render_pages(limit)
+        return self._pages
+
+    def _render_pages(self, limit: int) -> List[str]:
+        # Entries of one Khaifa are separated by a blank line and Khaifa groups by a separator
+        # line. Pages break between entries; only an entry longer than a whole page is cut.
+        pages = []
+        parts = []
+        length = 0
+
+        for key, records in self.grouped():
+            for position, record in enumerate(records):
+                text = record.summary
+                joiner = ("\n\n" if position else f"\n{GROUP_SEPARATOR}\n") if parts else ""
+
+                if parts and length + len(joiner) + len(text) > limit:
+                    pages.append("".join(parts))
+                    parts, length, joiner = [], 0, ""
+
+                while len(text) > limit:
+                    pages.append(text[:limit])
+                    text = text[limit:]
+
+                parts.extend((joiner, text))
+                length += len(joiner) + len(text)
+
+        if parts:
+            pages.append("".join(parts))
+        return pages
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[ReportRecord]:
+        return iter(self.records)
+
+
+def get_day_reports(bot_data: dict, chat_id: str, day: str, create: bool = False) -> Optional[DayReports]:
+    if create:
+        days = bot_data.setdefault('group_data', {}).setdefault(chat_id, {})
+    else:
+        days = bot_data.get('group_data', {}).get(chat_id)
+        if days is None:
+            return None
+
+    reports = days.get(day)
+
+    # Days persisted before reports were structured are plain lists of summary strings;
+    # convert them the first time they are touched.
+    if isinstance(reports, list):
+        reports = days[day] = DayReports.from_legacy(reports)
+    elif reports is None and create:
+        reports = days[day] = DayReports()
+
+    return reports
@@ -0,0 +1,90 @@
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+from archive import ARCHIVE_DIR, archived_days, iter_archived_records
+from report_store import ReportRecord
+
+# Per-day report counts per Khaifa, kept next to group_data so /report can total any range
+# without reading the reports themselves:
+#   bot_data['rollups'][chat_id][day] = {khaifa_key: (khaifa, count)}
+# They are updated with every report and outlive the day's move to the archive.
+# ROLLUPS_BUILT_KEY marks bot_data whose rollups have been backfilled from the reports
+# collected before rollups existed.
+ROLLUPS_BUILT_KEY = 'rollups_built'
+REPORT_MAX_DAYS = int(os.getenv('REPORT_MAX_DAYS', '366'))
+
+DayRollup = Dict[str, Tuple[str, int]]
+
+
+def get_chat_rollups(bot_data: dict, chat_id: str, create: bool = False) -> Optional[Dict[str, DayRollup]]:
+    if create:
+        return bot_data.setdefault('rollups', {}).setdefault(chat_id, {})
+    return bot_data.get('rollups', {}).get(chat_id)
+
+
+def add_to_rollup(bot_data: dict, chat_id: str, day: str, record: ReportRecord) -> None:
+    day_rollup = get_chat_rollups(bot_data, chat_id, create=True).setdefault(day, {})
+    khaifa, count = day_rollup.get(record.khaifa_key, (record.khaifa, 0))
+    day_rollup[record.khaifa_key] = (khaifa, count + 1)
+
+
+def set_day_rollup(bot_data: dict, chat_id: str, day: str, counts: Tuple[Tuple[str, str, int], ...]) -> None:
+    get_chat_rollups(bot_data, chat_id, create=True)[day] = {key: (khaifa, count) for key, khaifa, count in counts}
+
+
+def day_rollup_counts(bot_data: dict, chat_id: str, day: str) -> Optional[Tuple[Tuple[str, str, int], ...]]:
+    day_rollup = (get_chat_rollups(bot_data, chat_id) or {}).get(day)
+    if day_rollup is None:
+        return None
+    return tuple((key, khaifa, count) for key, (khaifa, count) in day_rollup.items())
+
+
+def drop_day_rollup(bot_data: dict, chat_id: str, day: str) -> None:
+    days = get_chat_rollups(bot_data, chat_id)
+    if days is not None:
+        days.pop(day, None)
+        if not days:
+            del bot_data['rollups'][chat_id]
+
+
+def drop_chat_rollups(bot_data: dict, chat_id: str) -> None:
+    bot_data.get('rollups', {}).pop(chat_id, None)
+
+
+def count_records(records) -> Tuple[Tuple[str, str, int], ...]:
+    counts = {}
+    for record in records:
+        khaifa, count = counts.get(record.khaifa_key, (record.khaifa, 0))
+        counts[record.khaifa_key] = (khaifa, count + 1)
+    return tuple((key, khaifa, count) for key, (khaifa, count) in counts.items())
+
+
+def iter_archived_rollups(skip: Dict[str, set]) -> Iterator[Tuple[str, str, Tuple[Tuple[str, str, int], ...]]]:
+    """(chat_id, day, counts) for every archived day not listed in `skip`. Reads the archive;
+    meant for a worker thread."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return
+
+    for chat_id in os.listdir(ARCHIVE_DIR):
+        for day in archived_days(chat_id):
+            if day not in skip.get(chat_id, ()):
+                yield chat_id, day, count_records(iter_archived_records(chat_id, day))
+
+
+def summarize(bot_data: dict, chat_id: str, start: str, end: str) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+    """Per-day and per-Khaifa report totals of a chat between start and end (inclusive).
+
+    Touches one counter per day and Khaifa, never the reports.
+    """
+    per_day = []
+    per_khaifa = {}
+
+    days = get_chat_rollups(bot_data, chat_id) or {}
+    for day in sorted(day for day in days if start <= day <= end):
+        day_total = 0
+        for key, (khaifa, count) in days[day].items():
+            day_total += count
+            name, total = per_khaifa.get(key, (khaifa, 0))
+            per_khaifa[key] = (name, total + count)
+        per_day.append((day, day_total))
+
+    return per_day, [per_khaifa[key] for key in sorted(per_khaifa)]
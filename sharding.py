@@ -0,0 +1,267 @@
+import os
+import json
+import signal
+import asyncio
+import logging
+import threading
+import multiprocessing
+from typing import List, Optional
+from telegram import Bot, Update
+from check_store import get_check_store, get_check_window
+from report_store import get_day_reports
+from shared_store import SharedStore, install_shared_store
+from storage import build_persistence, persistence_path, seed_persistence
+from web_server import (
+    BOT_MODE, SECRET_HEADER, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_URL,
+    Request, Response, WebServer, add_monitoring_routes, secret_matches, text_response
+)
+
+logger = logging.getLogger(__name__)
+
+# SHARD_WORKERS > 1 splits the bot over that many worker processes on this machine. The
+# parent process is only a dispatcher: it receives updates (webhook or polling, as per
+# BOT_MODE) and forwards each one to the worker that owns its chat, chat_id % SHARD_WORKERS,
+# over a multiprocessing queue. Each worker runs the full Application with its own
+# persistence files (suffix .shard<N>) holding its chats' group_data; the /chk counters and
+# the users/groups registry with their last-seen days live in the shared store
+# (shared_store.py) so they stay global.
+# Admin buttons that act on one group's data (admin_clear_<group id>) are routed to the
+# worker that owns that group rather than the admin's chat.
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '1'))
+# When set, worker N serves /healthz and /metrics on SHARD_METRICS_PORT + N.
+SHARD_METRICS_PORT = int(os.getenv('SHARD_METRICS_PORT', '0'))
+SHARD_STOP_TIMEOUT = 30
+
+
+def shard_of(chat_id: int, shard_count: int) -> int:
+    return chat_id % shard_count
+
+
+def shard_suffix(shard: int) -> str:
+    return f'.shard{shard}'
+
+
+def callback_route_key(callback_data: str) -> Optional[int]:
+    # admin_clear_<group id>[_...]: the group's data lives with the group's worker.
+    if callback_data.startswith('admin_clear_'):
+        try:
+            return int(callback_data.split('_')[2])
+        except (IndexError, ValueError):
+            return None
+    return None
+
+
+def update_route_key(data: dict) -> Optional[int]:
+    """The chat id of a raw update (or the sender's id for chat-less updates)."""
+    route_key = callback_route_key((data.get('callback_query') or {}).get('data') or '')
+    if route_key is not None:
+        return route_key
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        user = value.get('from') or value.get('user')
+        if user:
+            return user['id']
+    return None
+
+
+async def prepare_shards(shard_count: int) -> None:
+    """Seed the shared store and any new shard's persistence from the unsharded bot data.
+
+    Runs in the dispatcher before the workers start, so switching an existing deployment to
+    sharded mode keeps its registry, /chk counters and the reports collected so far.
+    """
+    fresh_shards = [shard for shard in range(shard_count) if not os.path.exists(persistence_path(shard_suffix(shard)))]
+    store = SharedStore()
+    try:
+        seed_shared = store.is_empty()
+        if not (fresh_shards or seed_shared) or not os.path.exists(persistence_path()):
+            return
+
+        bot_data = await build_persistence().get_bot_data()
+
+        if seed_shared:
+            store.import_chats('users', bot_data.get('users', ()))
+            store.import_chats('groups', bot_data.get('groups', ()))
+            store.import_chat_seen(bot_data.get('chat_seen', {}).items())
+            store.import_checks(get_check_store(bot_data).items())
+            store.import_check_days(get_check_window(bot_data).items())
+
+        for shard in fresh_shards:
+            changes = [
+                ('report', chat_id, day, record)
+                for chat_id, days in bot_data.get('group_data', {}).items()
+                if shard_of(int(chat_id), shard_count) == shard
+                for day in list(days)
+                for record in get_day_reports(bot_data, chat_id, day)
+            ]
+            changes.append(('seen', tuple(
+                (chat_id, day) for chat_id, day in bot_data.get('chat_seen', {}).items()
+                if shard_of(chat_id, shard_count) == shard
+            )))
+            changes.append(('rollups', tuple(
+                (chat_id, day, tuple((key, khaifa, count) for key, (khaifa, count) in counts.items()))
+                for chat_id, days in bot_data.get('rollups', {}).items()
+                if shard_of(int(chat_id), shard_count) == shard
+                for day, counts in days.items()
+            )))
+            await seed_persistence(build_persistence(shard_suffix(shard)), changes)
+            logger.info("Seeded shard %d with %d reports", shard, len(changes))
+    finally:
+        store.close()
+
+
+# --- Worker side ---
+
+def run_worker(shard: int, shard_count: int, queue) -> None:
+    # Ctrl+C reaches the whole process group; the dispatcher decides when workers stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import main
+    application = main.build_application(build_persistence(shard_suffix(shard)), polling=False, shard=(shard, shard_count))
+    asyncio.run(serve_worker(application, shard, shard_count, queue))
+
+
+async def serve_worker(application, shard: int, shard_count: int, queue) -> None:
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+
+    async def enqueue(payload: bytes) -> None:
+        await application.update_queue.put(Update.de_json(json.loads(payload), application.bot))
+
+    def read_queue() -> None:
+        # multiprocessing queues block, so they are read on a thread and handed to the loop.
+        while True:
+            payload = queue.get()
+            if payload is None:
+                loop.call_soon_threadsafe(stop.set)
+                return
+            asyncio.run_coroutine_threadsafe(enqueue(payload), loop)
+
+    async with application:
+        install_shared_store(application.bot_data, owns=lambda chat_id: shard_of(chat_id, shard_count) == shard)
+        await application.start()
+
+        server = None
+        if SHARD_METRICS_PORT:
+            server = WebServer(port=SHARD_METRICS_PORT + shard)
+            add_monitoring_routes(server, application)
+            await server.start()
+
+        threading.Thread(target=read_queue, name=f'shard-{shard}-reader', daemon=True).start()
+        logger.info("Shard worker %d ready", shard)
+        try:
+            await stop.wait()
+        finally:
+            if server:
+                await server.stop()
+            await application.stop()
+
+
+# --- Dispatcher side ---
+
+def forward(queues: List, payload: bytes, data: dict) -> None:
+    chat_id = update_route_key(data)
+    shard = shard_of(chat_id, len(queues)) if chat_id is not None else 0
+    queues[shard].put(payload)
+
+
+async def dispatch(token: str, base_url: Optional[str], queues: List, workers: List) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    server = WebServer()
+
+    async def healthz(request: Request) -> Response:
+        alive = [worker.is_alive() for worker in workers]
+        body = {'status': 'ok' if all(alive) else 'degraded', 'mode': BOT_MODE, 'workers': alive}
+        return text_response(json.dumps(body), 200 if all(alive) else 503, 'application/json')
+
+    async def webhook(request: Request) -> Response:
+        if not secret_matches(request.headers.get(SECRET_HEADER, ''), WEBHOOK_SECRET):
+            return text_response("Forbidden", 403)
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return text_response("Bad Request", 400)
+        if not isinstance(data, dict):
+            return text_response("Bad Request", 400)
+        forward(queues, request.body, data)
+        return text_response("OK")
+
+    server.add_route('GET', '/healthz', healthz)
+
+    bot = Bot(token, base_url=base_url) if base_url else Bot(token)
+    async with bot:
+        if BOT_MODE == 'webhook':
+            if not WEBHOOK_URL:
+                raise RuntimeError("BOT_MODE=webhook needs WEBHOOK_URL (the public https base URL)")
+            server.add_route('POST', WEBHOOK_PATH, webhook)
+            await server.start()
+            await bot.set_webhook(
+                url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            await stop.wait()
+        else:
+            await server.start()
+            await bot.delete_webhook()
+            poller = asyncio.ensure_future(poll(bot, queues))
+            await stop.wait()
+            poller.cancel()
+            await asyncio.gather(poller, return_exceptions=True)
+        await server.stop()
+
+
+async def poll(bot: Bot, queues: List) -> None:
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("getUpdates failed: %s", e)
+            await asyncio.sleep(1)
+            continue
+
+        for update in updates:
+            data = update.to_dict()
+            forward(queues, json.dumps(data).encode('utf-8'), data)
+            offset = update.update_id + 1
+
+
+def run_sharded(token: str, base_url: Optional[str] = None, shard_count: int = SHARD_WORKERS) -> None:
+    asyncio.run(prepare_shards(shard_count))
+
+    # spawn rather than fork: each worker starts from a clean interpreter instead of a copy
+    # of the dispatcher's state.
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue() for _ in range(shard_count)]
+    workers = [
+        context.Process(target=run_worker, args=(shard, shard_count, queues[shard]), name=f'bot-shard-{shard}')
+        for shard in range(shard_count)
+    ]
+    for worker in workers:
+        worker.start()
+    print(f"✅ Sharded mode: {shard_count} workers, dispatching by {BOT_MODE}")
+
+    try:
+        asyncio.run(dispatch(token, base_url, queues, workers))
+    finally:
+        for queue in queues:
+            queue.put(None)
+        for worker in workers:
+            worker.join(SHARD_STOP_TIMEOUT)
+            if worker.is_alive():
+                logger.warning("Shard worker %s did not stop in time; terminating", worker.name)
+                worker.terminate()
@@ -0,0 +1,539 @@
+import os
+import sqlite3
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from check_store import CHECK_WINDOW_DAYS, check_window_cutoff
+from report_index import ReportSighting, report_keys
+from report_store import ReportRecord, get_day_reports
+
+logger = logging.getLogger(__name__)
+
+# With sharded workers, the state every worker must agree on lives in one SQLite database:
+# the /chk counters (lifetime and per day), the users/groups registry with the day each chat
+# was last seen, the duplicate-report index of the day and which groups have reports (for
+# /listgroups). Everything else (group_data, the chat cache, conversations) stays in each
+# worker's own persistence.
+SHARED_STORE_FILE = os.getenv('SHARED_STORE_FILE', 'bot_shared.sqlite3')
+# The store is used from the workers' event loops, so a statement waits at most this many
+# seconds for another worker's write lock (and then fails) rather than freezing the worker.
+# Write transactions are a few milliseconds, so waiting longer only hides a stuck writer.
+SHARED_STORE_BUSY_TIMEOUT = float(os.getenv('SHARED_STORE_BUSY_TIMEOUT', '1'))
+# The imports at worker start run before the worker handles updates and may wait longer.
+SHARED_STORE_IMPORT_TIMEOUT = 30
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS chats (chat_id INTEGER PRIMARY KEY, kind TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS check_records (number TEXT PRIMARY KEY, count INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS check_days ("
+    "day TEXT NOT NULL, number TEXT NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (day, number))",
+    "CREATE INDEX IF NOT EXISTS check_days_number ON check_days (number, day)",
+    "CREATE TABLE IF NOT EXISTS report_keys ("
+    "day TEXT NOT NULL, key TEXT NOT NULL, chat_id TEXT NOT NULL, khaifa TEXT NOT NULL, "
+    "tele_name TEXT NOT NULL, submitted REAL, PRIMARY KEY (day, key))",
+    "CREATE TABLE IF NOT EXISTS data_chats (chat_id INTEGER PRIMARY KEY)",
+    "CREATE TABLE IF NOT EXISTS chat_seen (chat_id INTEGER PRIMARY KEY, day INTEGER NOT NULL)",
+)
+
+
+class SharedStore:
+    def __init__(self, filepath: str = SHARED_STORE_FILE) -> None:
+        self.filepath = filepath
+        # Every statement commits on its own; the few multi-statement updates use explicit
+        # BEGIN IMMEDIATE transactions so concurrent workers serialize on them.
+        self.db = sqlite3.connect(filepath, isolation_level=None, timeout=SHARED_STORE_BUSY_TIMEOUT)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self.db.execute(statement)
+
+    def close(self) -> None:
+        self.db.close()
+
+    @contextmanager
+    def busy_timeout(self, seconds: float) -> Iterator[None]:
+        self.db.execute(f"PRAGMA busy_timeout = {int(seconds * 1000)}")
+        try:
+            yield
+        finally:
+            self.db.execute(f"PRAGMA busy_timeout = {int(SHARED_STORE_BUSY_TIMEOUT * 1000)}")
+
+    def is_empty(self) -> bool:
+        return not any(
+            self.db.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+            for table in ('chats', 'check_records')
+        )
+
+    def import_chats(self, kind: str, chat_ids: Iterable[int]) -> None:
+        self.db.executemany(
+            "INSERT OR IGNORE INTO chats (chat_id, kind) VALUES (?, ?)", ((chat_id, kind) for chat_id in chat_ids)
+        )
+
+    def import_checks(self, items: Iterable[Tuple[str, int]]) -> None:
+        # MAX keeps the import idempotent: importing the same counters twice changes nothing.
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.executemany(
+                "INSERT INTO check_records (number, count) VALUES (?, ?) "
+                "ON CONFLICT (number) DO UPDATE SET count = MAX(count, excluded.count)",
+                items
+            )
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def import_chat_seen(self, items: Iterable[Tuple[int, int]]) -> None:
+        self.db.executemany(
+            "INSERT INTO chat_seen (chat_id, day) VALUES (?, ?) "
+            "ON CONFLICT (chat_id) DO UPDATE SET day = MAX(day, excluded.day)",
+            items
+        )
+
+    def import_check_days(self, items: Iterable[Tuple[str, str, int]]) -> None:
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.executemany(
+                "INSERT INTO check_days (day, number, count) VALUES (?, ?, ?) "
+                "ON CONFLICT (day, number) DO UPDATE SET count = MAX(count, excluded.count)",
+                items
+            )
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+
+class SharedChatSet:
+    """The users or groups registry as a set backed by the shared store.
+
+    Membership tests are answered from a local set of ids already known to be present, so
+    the registration check done for every update only reaches SQLite for chats this worker
+    has not seen yet. Chats another worker drops stay in that local set until restart, which
+    only means they are not re-registered by this worker.
+    """
+
+    def __init__(self, store: SharedStore, kind: str) -> None:
+        self.store = store
+        self.kind = kind
+        self.known = set()
+
+    def __contains__(self, chat_id: int) -> bool:
+        if chat_id in self.known:
+            return True
+        row = self.store.db.execute(
+            "SELECT 1 FROM chats WHERE chat_id = ? AND kind = ?", (chat_id, self.kind)
+        ).fetchone()
+        if row:
+            self.known.add(chat_id)
+        return row is not None
+
+    def add(self, chat_id: int) -> None:
+        self.store.db.execute(
+            "INSERT OR IGNORE INTO chats (chat_id, kind) VALUES (?, ?)", (chat_id, self.kind)
+        )
+        self.known.add(chat_id)
+
+    def discard(self, chat_id: int) -> None:
+        self.store.db.execute("DELETE FROM chats WHERE chat_id = ? AND kind = ?", (chat_id, self.kind))
+        self.known.discard(chat_id)
+
+    def __iter__(self) -> Iterator[int]:
+        return (row[0] for row in self.store.db.execute("SELECT chat_id FROM chats WHERE kind = ?", (self.kind,)))
+
+    def __len__(self) -> int:
+        return self.store.db.execute("SELECT COUNT(*) FROM chats WHERE kind = ?", (self.kind,)).fetchone()[0]
+
+    def __deepcopy__(self, memo) -> 'SharedChatSet':
+        # The application deep-copies bot_data before every persistence update; this is a
+        # handle to shared state, not data of its own.
+        return self
+
+    def __reduce__(self):
+        return open_shared_view, (self.store.filepath, self.kind)
+
+
+class SharedChatSeen:
+    """The last-seen day of every chat (chat_registry's bot_data['chat_seen']) in the shared
+    store, so /stats on any worker counts the active chats of all shards.
+
+    Like SharedChatSet, the days this worker wrote or read are kept locally, so noting a
+    chat as seen (done for every update) only reaches SQLite on its first update of the day.
+    """
+
+    def __init__(self, store: SharedStore) -> None:
+        self.store = store
+        self.known: Dict[int, int] = {}
+
+    def get(self, chat_id: int, default: Optional[int] = None) -> Optional[int]:
+        day = self.known.get(chat_id)
+        if day is None:
+            row = self.store.db.execute("SELECT day FROM chat_seen WHERE chat_id = ?", (chat_id,)).fetchone()
+            if row is None:
+                return default
+            day = self.known[chat_id] = row[0]
+        return day
+
+    def __contains__(self, chat_id: int) -> bool:
+        return self.get(chat_id) is not None
+
+    def __setitem__(self, chat_id: int, day: int) -> None:
+        # Days only move forward: another worker may have seen the chat later.
+        self.store.db.execute(
+            "INSERT INTO chat_seen (chat_id, day) VALUES (?, ?) "
+            "ON CONFLICT (chat_id) DO UPDATE SET day = MAX(day, excluded.day)",
+            (chat_id, day)
+        )
+        self.known[chat_id] = day
+
+    def update(self, items) -> None:
+        for chat_id, day in (items.items() if isinstance(items, dict) else items):
+            self[chat_id] = day
+
+    def pop(self, chat_id: int, default: Optional[int] = None) -> Optional[int]:
+        day = self.get(chat_id, default)
+        self.store.db.execute("DELETE FROM chat_seen WHERE chat_id = ?", (chat_id,))
+        self.known.pop(chat_id, None)
+        return day
+
+    def items(self) -> Iterator[Tuple[int, int]]:
+        return iter(self.store.db.execute("SELECT chat_id, day FROM chat_seen"))
+
+    def __iter__(self) -> Iterator[int]:
+        return (row[0] for row in self.store.db.execute("SELECT chat_id FROM chat_seen"))
+
+    def __len__(self) -> int:
+        return self.store.db.execute("SELECT COUNT(*) FROM chat_seen").fetchone()[0]
+
+    def __deepcopy__(self, memo) -> 'SharedChatSeen':
+        return self
+
+    def __reduce__(self):
+        return open_shared_view, (self.store.filepath, 'chat_seen')
+
+
+class SharedCheckStore:
+    """The /chk counters in the shared store, with the part of the CheckStore interface the
+    handlers use."""
+
+    def __init__(self, store: SharedStore) -> None:
+        self.store = store
+
+    def get(self, number: str, default: int = 0) -> int:
+        row = self.store.db.execute("SELECT count FROM check_records WHERE number = ?", (number,)).fetchone()
+        return row[0] if row else default
+
+    def __getitem__(self, number: str) -> int:
+        count = self.get(number, 0)
+        if not count:
+            raise KeyError(number)
+        return count
+
+    def __setitem__(self, number: str, count: int) -> None:
+        # Counters only ever grow. A worker replaying its own journal must not wind back a
+        # count another worker has raised since.
+        self.store.db.execute(
+            "INSERT INTO check_records (number, count) VALUES (?, ?) "
+            "ON CONFLICT (number) DO UPDATE SET count = MAX(count, excluded.count)",
+            (number, count)
+        )
+
+    def increment(self, number: str) -> int:
+        # The write lock is taken up front, so two workers incrementing the same number are
+        # serialized and each reads back its own result.
+        db = self.store.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                "INSERT INTO check_records (number, count) VALUES (?, 1) "
+                "ON CONFLICT (number) DO UPDATE SET count = count + 1",
+                (number,)
+            )
+            count = db.execute("SELECT count FROM check_records WHERE number = ?", (number,)).fetchone()[0]
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return count
+
+    def increment_many(self, numbers: Iterable[str]) -> List[int]:
+        # One transaction for the whole batch: a bulk check takes the write lock once.
+        db = self.store.db
+        counts = []
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for number in numbers:
+                db.execute(
+                    "INSERT INTO check_records (number, count) VALUES (?, 1) "
+                    "ON CONFLICT (number) DO UPDATE SET count = count + 1",
+                    (number,)
+                )
+                counts.append(db.execute("SELECT count FROM check_records WHERE number = ?", (number,)).fetchone()[0])
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return counts
+
+    def __len__(self) -> int:
+        # Rows are never deleted, so the largest rowid is the row count without a full scan.
+        return self.store.db.execute("SELECT COALESCE(MAX(rowid), 0) FROM check_records").fetchone()[0]
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        return iter(self.store.db.execute("SELECT number, count FROM check_records ORDER BY number"))
+
+    def __deepcopy__(self, memo) -> 'SharedCheckStore':
+        return self
+
+    def __reduce__(self):
+        return open_shared_view, (self.store.filepath, 'check_records')
+
+
+class SharedCheckWindow:
+    """The per-day /chk counts in the shared store, with the CheckWindow interface."""
+
+    def __init__(self, store: SharedStore, days: int = CHECK_WINDOW_DAYS) -> None:
+        self.store = store
+        self.days = days
+        self._day = None
+
+    def add_many(self, numbers: Iterable[str], day: str) -> List[Tuple[int, int]]:
+        db = self.store.db
+        cutoff = check_window_cutoff(day, self.days)
+        results = []
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if day != self._day:
+                db.execute("DELETE FROM check_days WHERE day <= ?", (cutoff,))
+            for number in numbers:
+                db.execute(
+                    "INSERT INTO check_days (day, number, count) VALUES (?, ?, 1) "
+                    "ON CONFLICT (day, number) DO UPDATE SET count = count + 1",
+                    (day, number)
+                )
+                results.append(db.execute(
+                    "SELECT SUM(CASE WHEN day = ? THEN count ELSE 0 END), SUM(count) "
+                    "FROM check_days WHERE number = ? AND day > ?",
+                    (day, number, cutoff)
+                ).fetchone())
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self._day = day
+        return results
+
+    def add(self, number: str, day: str) -> Tuple[int, int]:
+        return self.add_many((number,), day)[0]
+
+    def set(self, day: str, number: str, count: int) -> None:
+        # As with the totals, a replay never winds back a count another worker raised.
+        self.store.db.execute(
+            "INSERT INTO check_days (day, number, count) VALUES (?, ?, ?) "
+            "ON CONFLICT (day, number) DO UPDATE SET count = MAX(count, excluded.count)",
+            (day, number, count)
+        )
+
+    def recent(self, number: str, day: str) -> int:
+        return self.store.db.execute(
+            "SELECT COALESCE(SUM(count), 0) FROM check_days WHERE number = ? AND day > ?",
+            (number, check_window_cutoff(day, self.days))
+        ).fetchone()[0]
+
+    def __len__(self) -> int:
+        return self.store.db.execute("SELECT COUNT(*) FROM check_days").fetchone()[0]
+
+    def items(self) -> Iterator[Tuple[str, str, int]]:
+        return iter(self.store.db.execute("SELECT day, number, count FROM check_days ORDER BY day"))
+
+    def __deepcopy__(self, memo) -> 'SharedCheckWindow':
+        return self
+
+    def __reduce__(self):
+        return open_shared_view, (self.store.filepath, 'check_window')
+
+
+class SharedDataChats:
+    """The groups whose group_data (held by their own worker) has reports.
+
+    Lets /listgroups on any worker list the groups with data of all shards. As with
+    SharedChatSet, a local set of the ids this worker knows to be present keeps the update
+    done for every report from reaching SQLite.
+    """
+
+    def __init__(self, store: SharedStore) -> None:
+        self.store = store
+        self.known = set()
+
+    def set(self, chat_id: int, has_data: bool) -> None:
+        if has_data:
+            if chat_id not in self.known:
+                self.store.db.execute("INSERT OR IGNORE INTO data_chats (chat_id) VALUES (?)", (chat_id,))
+                self.known.add(chat_id)
+        else:
+            self.store.db.execute("DELETE FROM data_chats WHERE chat_id = ?", (chat_id,))
+            self.known.discard(chat_id)
+
+    def sync(self, group_data: dict, owns: Optional[Callable[[int], bool]] = None) -> None:
+        # At worker start: the worker's own group_data is the truth for the chats it owns.
+        with_data = {int(chat_id) for chat_id, days in group_data.items() if days}
+        db = self.store.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            stale = [
+                chat_id for (chat_id,) in db.execute("SELECT chat_id FROM data_chats").fetchall()
+                if chat_id not in with_data and (owns is None or owns(chat_id))
+            ]
+            db.executemany("DELETE FROM data_chats WHERE chat_id = ?", ((chat_id,) for chat_id in stale))
+            db.executemany("INSERT OR IGNORE INTO data_chats (chat_id) VALUES (?)", ((chat_id,) for chat_id in with_data))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self.known = with_data
+
+    def __contains__(self, chat_id: int) -> bool:
+        return self.store.db.execute("SELECT 1 FROM data_chats WHERE chat_id = ?", (chat_id,)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[int]:
+        return (row[0] for row in self.store.db.execute("SELECT chat_id FROM data_chats"))
+
+    def __deepcopy__(self, memo) -> 'SharedDataChats':
+        return self
+
+    def __reduce__(self):
+        return open_shared_view, (self.store.filepath, 'data_chats')
+
+
+class SharedReportIndex:
+    """The duplicate-report index in the shared store, with the ReportIndex interface.
+
+    Each worker adds its own reports of the day the first time it indexes a report that day,
+    so reports from before a restart or before sharding was enabled are found as well.
+    """
+
+    def __init__(self, store: SharedStore) -> None:
+        self.store = store
+        self.day = None
+
+    def _insert(self, day: str, key: str, chat_id: str, record: ReportRecord, submitted: Optional[float]) -> bool:
+        cursor = self.store.db.execute(
+            "INSERT OR IGNORE INTO report_keys (day, key, chat_id, khaifa, tele_name, submitted) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (day, key, chat_id, record.khaifa, record.tele_name, submitted)
+        )
+        return cursor.rowcount > 0
+
+    def add(self, bot_data: dict, chat_id: str, day: str, record: ReportRecord,
+            submitted: float) -> List[Tuple[str, ReportSighting]]:
+        db = self.store.db
+        duplicates = []
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if day != self.day:
+                db.execute("DELETE FROM report_keys WHERE day < ?", (day,))
+                for own_chat in list(bot_data.get('group_data', {})):
+                    for own in get_day_reports(bot_data, own_chat, day) or ():
+                        for key in report_keys(own):
+                            self._insert(day, key, own_chat, own, None)
+            for key in report_keys(record):
+                if not self._insert(day, key, chat_id, record, submitted):
+                    row = db.execute(
+                        "SELECT chat_id, khaifa, tele_name, submitted FROM report_keys WHERE day = ? AND key = ?",
+                        (day, key)
+                    ).fetchone()
+                    duplicates.append((key, ReportSighting(*row)))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self.day = day
+        return duplicates
+
+    def discard(self, chat_id: str, day: Optional[str] = None) -> None:
+        if day is None:
+            self.store.db.execute("DELETE FROM report_keys WHERE chat_id = ?", (chat_id,))
+        else:
+            self.store.db.execute("DELETE FROM report_keys WHERE chat_id = ? AND day = ?", (chat_id, day))
+        # Reports of other chats that repeated the cleared keys come back on the next add.
+        self.day = None
+
+    def __len__(self) -> int:
+        return self.store.db.execute("SELECT COUNT(*) FROM report_keys").fetchone()[0]
+
+    def __deepcopy__(self, memo) -> 'SharedReportIndex':
+        return self
+
+    def __reduce__(self):
+        return open_shared_view, (self.store.filepath, 'report_index')
+
+
+_stores = {}
+
+
+def get_shared_store(filepath: str = SHARED_STORE_FILE) -> SharedStore:
+    store = _stores.get(filepath)
+    if store is None:
+        store = _stores[filepath] = SharedStore(filepath)
+    return store
+
+
+def open_shared_view(filepath: str, kind: str):
+    store = get_shared_store(filepath)
+    if kind == 'check_records':
+        return SharedCheckStore(store)
+    if kind == 'check_window':
+        return SharedCheckWindow(store)
+    if kind == 'report_index':
+        return SharedReportIndex(store)
+    if kind == 'data_chats':
+        return SharedDataChats(store)
+    if kind == 'chat_seen':
+        return SharedChatSeen(store)
+    return SharedChatSet(store, kind)
+
+
+def install_shared_store(bot_data: dict, store: Optional[SharedStore] = None,
+                         owns: Optional[Callable[[int], bool]] = None) -> SharedStore:
+    """Point users/groups/chat_seen/check_records/check_window/report_index of a worker's
+    bot_data at the shared store, and publish which of its chats (those `owns` accepts) have
+    reports as bot_data['data_chats'].
+
+    Whatever the worker's own persistence still holds for those keys is merged in first, so
+    nothing recorded before sharding was enabled is lost.
+    """
+    store = store or get_shared_store()
+    # All workers import at once when they start; let them wait for each other.
+    with store.busy_timeout(SHARED_STORE_IMPORT_TIMEOUT):
+        _install(bot_data, store, owns)
+    return store
+
+
+def _install(bot_data: dict, store: SharedStore, owns: Optional[Callable[[int], bool]]) -> None:
+    for key, kind in (('users', 'users'), ('groups', 'groups')):
+        local = bot_data.get(key)
+        if local and not isinstance(local, SharedChatSet):
+            store.import_chats(kind, local)
+        bot_data[key] = SharedChatSet(store, kind)
+
+    local = bot_data.get('chat_seen')
+    if local and not isinstance(local, SharedChatSeen):
+        store.import_chat_seen(local.items())
+    bot_data['chat_seen'] = SharedChatSeen(store)
+
+    local = bot_data.get('check_records')
+    if local and not isinstance(local, SharedCheckStore):
+        store.import_checks(local.items())
+    bot_data['check_records'] = SharedCheckStore(store)
+
+    local = bot_data.get('check_window')
+    if local and not isinstance(local, SharedCheckWindow):
+        store.import_check_days(local.items())
+    bot_data['check_window'] = SharedCheckWindow(store)
+
+    # A local index holds nothing that is not rebuilt from group_data.
+    bot_data['report_index'] = SharedReportIndex(store)
+
+    data_chats = SharedDataChats(store)
+    data_chats.sync(bot_data.get('group_data', {}), owns)
+    bot_data['data_chats'] = data_chats
@@ -0,0 +1,662 @@
+import asyncio
+import os
+import pickle
+import sqlite3
+import time
+import struct
+import logging
+from typing import Optional
+from telegram.ext import BasePersistence, PersistenceInput, PicklePersistence, CallbackContext
+from check_store import CheckStore, CheckWindow, check_window_cutoff, get_check_store, get_check_window
+from report_store import DayReports, ReportRecord, as_record, get_day_reports
+from rollups import add_to_rollup, drop_chat_rollups, drop_day_rollup, set_day_rollup
+from metrics import observe_flush
+
+logger = logging.getLogger(__name__)
+
+# PERSISTENCE_BACKEND selects where bot_data lives: 'pickle' (write-behind pickle file),
+# 'sqlite' (row-level writes to a WAL-mode database) or 'journal' (pickle snapshot plus an
+# fsync'd append-only journal of changes).
+PERSISTENCE_BACKEND = os.getenv('PERSISTENCE_BACKEND', 'pickle')
+PERSISTENCE_FILE = os.getenv('PERSISTENCE_FILE', 'bot_data.pickle')
+SQLITE_FILE = os.getenv('SQLITE_FILE', 'bot_data.sqlite3')
+JOURNAL_FILE = os.getenv('JOURNAL_FILE', 'bot_data.journal')
+
+# Write-behind settings. Handlers only mark the bot data as dirty; the application's
+# persistence loop writes it out every PERSISTENCE_FLUSH_INTERVAL seconds, or earlier once
+# PERSISTENCE_FLUSH_MAX_DIRTY mutations have piled up. PERSISTENCE_FLUSH_INTERVAL is
+# therefore the maximum window of data that can be lost on a hard crash.
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv('PERSISTENCE_FLUSH_INTERVAL', '30'))
+PERSISTENCE_FLUSH_MAX_DIRTY = int(os.getenv('PERSISTENCE_FLUSH_MAX_DIRTY', '100'))
+
+# Journal settings. The journal is folded into the snapshot every JOURNAL_COMPACT_INTERVAL
+# seconds, or earlier once it grows past JOURNAL_COMPACT_BYTES.
+JOURNAL_COMPACT_INTERVAL = float(os.getenv('JOURNAL_COMPACT_INTERVAL', '300'))
+JOURNAL_COMPACT_BYTES = int(os.getenv('JOURNAL_COMPACT_BYTES', str(1024 * 1024)))
+JOURNAL_SEQ_KEY = 'journal_seq'
+
+# bot_data keys the SQLite backend keeps in their own tables. Everything else in bot_data
+# is stored as one pickled row per key in the kv table.
+TABLE_KEYS = ('users', 'groups', 'chat_seen', 'check_records', 'check_window', 'group_data', 'rollups')
+
+# A change is a tuple describing one mutation of bot_data with absolute values, so applying
+# it twice is harmless:
+#   ('chat', chat_id, chat_type)
+#   ('drop_chat', chat_id)                 also forgets the chat's last-seen day
+#   ('seen', ((chat_id, day), ...))        last-seen days, see chat_registry.py
+#   ('check', number, count)
+#   ('checks', ((number, count), ...))      a bulk /chk, recorded as one change
+#   ('checked', day, ((number, total, day_count), ...))   /chk totals and the day's counts
+#   ('report', chat_id, day, record)        also counted in the day's rollup; older journals
+#                                           hold the summary line instead of a ReportRecord
+#   ('rollups', ((chat_id, day, ((khaifa_key, khaifa, count), ...)), ...))   whole-day rollups
+#   ('clear_day', chat_id, day)             the day's reports and rollup
+#   ('archive_day', chat_id, day)           the day's reports only; the rollup stays
+#   ('clear_group', chat_id)
+
+
+def apply_change(bot_data: dict, change: tuple) -> None:
+    kind = change[0]
+
+    if kind == 'chat':
+        _, chat_id, chat_type = change
+        bot_data.setdefault('users' if chat_type == 'private' else 'groups', set()).add(chat_id)
+    elif kind == 'drop_chat':
+        _, chat_id = change
+        bot_data.get('users', set()).discard(chat_id)
+        bot_data.get('groups', set()).discard(chat_id)
+        bot_data.get('chat_seen', {}).pop(chat_id, None)
+    elif kind == 'seen':
+        _, days = change
+        bot_data.setdefault('chat_seen', {}).update(days)
+    elif kind == 'check':
+        _, number, count = change
+        get_check_store(bot_data)[number] = count
+    elif kind == 'checks':
+        _, counts = change
+        store = get_check_store(bot_data)
+        for number, count in counts:
+            store[number] = count
+    elif kind == 'checked':
+        _, day, counts = change
+        store = get_check_store(bot_data)
+        window = get_check_window(bot_data)
+        for number, total, day_count in counts:
+            store[number] = total
+            window.set(day, number, day_count)
+    elif kind == 'report':
+        _, chat_id, day, record = change
+        record = as_record(record)
+        get_day_reports(bot_data, chat_id, day, create=True).add(record)
+        add_to_rollup(bot_data, chat_id, day, record)
+    elif kind == 'rollups':
+        _, day_rollups = change
+        for chat_id, day, counts in day_rollups:
+            set_day_rollup(bot_data, chat_id, day, counts)
+    elif kind in ('clear_day', 'archive_day'):
+        _, chat_id, day = change
+        bot_data.get('group_data', {}).get(chat_id, {}).pop(day, None)
+        if kind == 'clear_day':
+            drop_day_rollup(bot_data, chat_id, day)
+    elif kind == 'clear_group':
+        _, chat_id = change
+        bot_data.get('group_data', {}).pop(chat_id, None)
+        drop_chat_rollups(bot_data, chat_id)
+    else:
+        raise ValueError(f"Unknown change: {kind}")
+
+
+class LiveBotData(dict):
+    """The bot_data the backends below hand to the Application.
+
+    Application.update_persistence deep-copies bot_data before every update_bot_data call, an
+    O(state) copy each interval whether or not anything changed. None of these backends needs
+    that snapshot: SQLite and the journal write change by change, and the pickle backend dumps
+    the live object synchronously, which no handler can interleave with. Deep-copying it
+    therefore returns the object itself; it pickles as a plain dict.
+    """
+
+    def __deepcopy__(self, memo) -> 'LiveBotData':
+        return self
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class WriteBehindPersistence(PicklePersistence):
+    def __init__(self, filepath: str = PERSISTENCE_FILE,
+                 flush_interval: float = PERSISTENCE_FLUSH_INTERVAL,
+                 max_dirty: int = PERSISTENCE_FLUSH_MAX_DIRTY) -> None:
+        # on_flush=True: nothing is written by the update_* hooks themselves, only by flush().
+        super().__init__(filepath=filepath, on_flush=True, update_interval=flush_interval)
+        self.max_dirty = max_dirty
+        self.dirty = 0
+        self.flush_pending = False
+
+    @property
+    def max_loss_window(self) -> float:
+        return self.update_interval
+
+    def record(self, application, change: Optional[tuple]) -> None:
+        self.dirty += 1
+
+        if self.dirty >= self.max_dirty and not self.flush_pending:
+            self.flush_pending = True
+            application.create_task(_flush_now(application))
+
+    async def get_bot_data(self) -> LiveBotData:
+        if not isinstance(self.bot_data, LiveBotData):
+            self.bot_data = LiveBotData(await super().get_bot_data())
+        return self.bot_data
+
+    async def update_bot_data(self, data) -> None:
+        # Called by the application's persistence loop with the live bot_data, gathered with
+        # the user/chat data and conversation updates of the same run. Those finish without
+        # awaiting, so after one yield they have all been counted. Skip the pickle when no
+        # kind of data changed.
+        await asyncio.sleep(0)
+        if not self.dirty:
+            return
+        self.dirty = 0
+        self.bot_data = data
+        await self.flush()
+
+    # PTB hands over the user/chat data of every chat that had an update; only actual changes
+    # count as dirty, and they are written by the next flush like bot_data changes.
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        if (self.user_data or {}).get(user_id) != data:
+            self.dirty += 1
+        await super().update_user_data(user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        if (self.chat_data or {}).get(chat_id) != data:
+            self.dirty += 1
+        await super().update_chat_data(chat_id, data)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self.dirty += 1
+        await super().drop_user_data(user_id)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self.dirty += 1
+        await super().drop_chat_data(chat_id)
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        if (self.conversations or {}).get(name, {}).get(key) != new_state:
+            self.dirty += 1
+        await super().update_conversation(name, key, new_state)
+
+    async def flush(self) -> None:
+        started = time.perf_counter()
+        await super().flush()
+        written = os.path.getsize(self.filepath) if os.path.exists(self.filepath) else 0
+        observe_flush('pickle', time.perf_counter() - started, written)
+
+
+REPORT_COLUMNS = ', '.join(ReportRecord._fields)
+REPORT_PLACEHOLDERS = ', '.join('?' for _ in ReportRecord._fields)
+
+
+class SqlitePersistence(BasePersistence):
+    # user_version 1: reports stored the "date    khaifa    contact" line in one entry column.
+    # user_version 2: one column per ReportRecord field.
+    SCHEMA_VERSION = 2
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS chats (chat_id INTEGER PRIMARY KEY, chat_type TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS chat_seen (chat_id INTEGER PRIMARY KEY, day INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS check_records (number TEXT PRIMARY KEY, count INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS check_days ("
+        "day TEXT NOT NULL, number TEXT NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (day, number))",
+        "CREATE TABLE IF NOT EXISTS reports ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id TEXT NOT NULL, day TEXT NOT NULL, "
+        + ', '.join(f"{column} TEXT NOT NULL" for column in ReportRecord._fields) + ")",
+        "CREATE INDEX IF NOT EXISTS reports_chat_day ON reports (chat_id, day)",
+        "CREATE TABLE IF NOT EXISTS rollups ("
+        " chat_id TEXT NOT NULL, day TEXT NOT NULL, khaifa_key TEXT NOT NULL, khaifa TEXT NOT NULL,"
+        " count INTEGER NOT NULL, PRIMARY KEY (chat_id, day, khaifa_key))",
+        "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data BLOB NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS chat_data (chat_id INTEGER PRIMARY KEY, data BLOB NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS conversations ("
+        " name TEXT NOT NULL, key BLOB NOT NULL, state BLOB NOT NULL, PRIMARY KEY (name, key))",
+    )
+
+    def __init__(self, filepath: str = SQLITE_FILE, migrate_from: Optional[str] = PERSISTENCE_FILE,
+                 update_interval: float = PERSISTENCE_FLUSH_INTERVAL) -> None:
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self.filepath = filepath
+        self.migrate_from = migrate_from
+        self._kv_cache = {}
+        self._check_day = None
+
+        # isolation_level=None: every statement commits on its own, so a single change is a
+        # single small WAL append rather than a rewrite of the whole state.
+        self.db = sqlite3.connect(filepath, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            self.db.execute(statement)
+
+        if self.db.execute("PRAGMA user_version").fetchone()[0] == 1:
+            self._upgrade_reports()
+
+    def _upgrade_reports(self) -> None:
+        rows = self.db.execute("SELECT chat_id, day, entry FROM reports ORDER BY id").fetchall()
+
+        self.db.execute("BEGIN")
+        self.db.execute("DROP TABLE reports")
+        for statement in self.SCHEMA:
+            self.db.execute(statement)
+        self.db.executemany(
+            f"INSERT INTO reports (chat_id, day, {REPORT_COLUMNS}) VALUES (?, ?, {REPORT_PLACEHOLDERS})",
+            ((chat_id, day) + ReportRecord.from_summary(entry) for chat_id, day, entry in rows)
+        )
+        self.db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.db.execute("COMMIT")
+
+    async def _migrate_pickle(self) -> None:
+        # One-shot import of an existing PicklePersistence file. user_version marks the
+        # database as initialised so this only ever runs once.
+        if self.db.execute("PRAGMA user_version").fetchone()[0]:
+            return
+
+        if self.migrate_from and os.path.exists(self.migrate_from):
+            legacy = PicklePersistence(filepath=self.migrate_from)
+            legacy.set_bot(self.bot)
+
+            self.db.execute("BEGIN")
+            self._write_bot_data(await legacy.get_bot_data())
+            for user_id, data in (await legacy.get_user_data()).items():
+                await self.update_user_data(user_id, data)
+            for chat_id, data in (await legacy.get_chat_data()).items():
+                await self.update_chat_data(chat_id, data)
+            for name, conversations in legacy.conversations.items():
+                for key, state in conversations.items():
+                    await self.update_conversation(name, key, state)
+            self.db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self.db.execute("COMMIT")
+
+            os.replace(self.migrate_from, self.migrate_from + '.migrated')
+            logger.info("Migrated %s into %s", self.migrate_from, self.filepath)
+        else:
+            self.db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def _write_bot_data(self, bot_data: dict) -> None:
+        for chat_id in bot_data.get('users', ()):
+            self.apply(('chat', chat_id, 'private'))
+        for chat_id in bot_data.get('groups', ()):
+            self.apply(('chat', chat_id, 'group'))
+        self.db.executemany(
+            "INSERT OR REPLACE INTO chat_seen (chat_id, day) VALUES (?, ?)", bot_data.get('chat_seen', {}).items()
+        )
+        self.db.executemany(
+            "INSERT OR REPLACE INTO check_records (number, count) VALUES (?, ?)",
+            get_check_store(bot_data).items()
+        )
+        self.db.executemany(
+            "INSERT OR REPLACE INTO check_days (day, number, count) VALUES (?, ?, ?)",
+            get_check_window(bot_data).items()
+        )
+        for chat_id, days in bot_data.get('group_data', {}).items():
+            for day in list(days):
+                self.db.executemany(
+                    f"INSERT INTO reports (chat_id, day, {REPORT_COLUMNS}) VALUES (?, ?, {REPORT_PLACEHOLDERS})",
+                    ((chat_id, day) + record for record in get_day_reports(bot_data, chat_id, day))
+                )
+        self.db.executemany(
+            "INSERT OR REPLACE INTO rollups (chat_id, day, khaifa_key, khaifa, count) VALUES (?, ?, ?, ?, ?)",
+            (
+                (chat_id, day, key, khaifa, count)
+                for chat_id, days in bot_data.get('rollups', {}).items()
+                for day, counts in days.items()
+                for key, (khaifa, count) in counts.items()
+            )
+        )
+        for key, value in bot_data.items():
+            if key not in TABLE_KEYS:
+                self._write_kv(key, pickle.dumps(value))
+
+    def _write_kv(self, key: str, blob: bytes) -> None:
+        self._kv_cache[key] = blob
+        self.db.execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, blob))
+
+    def apply(self, change: tuple) -> None:
+        kind = change[0]
+
+        if kind == 'chat':
+            _, chat_id, chat_type = change
+            self.db.execute(
+                "INSERT OR REPLACE INTO chats (chat_id, chat_type) VALUES (?, ?)", (chat_id, chat_type)
+            )
+        elif kind == 'drop_chat':
+            _, chat_id = change
+            self.db.execute("DELETE FROM chats WHERE chat_id = ?", (chat_id,))
+            self.db.execute("DELETE FROM chat_seen WHERE chat_id = ?", (chat_id,))
+        elif kind == 'seen':
+            _, days = change
+            self.db.execute("BEGIN")
+            self.db.executemany("INSERT OR REPLACE INTO chat_seen (chat_id, day) VALUES (?, ?)", days)
+            self.db.execute("COMMIT")
+        elif kind == 'check':
+            _, number, count = change
+            self.db.execute(
+                "INSERT INTO check_records (number, count) VALUES (?, ?) "
+                "ON CONFLICT (number) DO UPDATE SET count = excluded.count",
+                (number, count)
+            )
+        elif kind == 'checks':
+            _, counts = change
+            # One transaction, so the batch is one WAL commit rather than one per number.
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT INTO check_records (number, count) VALUES (?, ?) "
+                "ON CONFLICT (number) DO UPDATE SET count = excluded.count",
+                counts
+            )
+            self.db.execute("COMMIT")
+        elif kind == 'checked':
+            _, day, counts = change
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT INTO check_records (number, count) VALUES (?, ?) "
+                "ON CONFLICT (number) DO UPDATE SET count = excluded.count",
+                ((number, total) for number, total, _ in counts)
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO check_days (day, number, count) VALUES (?, ?, ?)",
+                ((day, number, day_count) for number, _, day_count in counts)
+            )
+            if day != self._check_day:
+                # First check of a new day: the days that left the window go, in one range delete.
+                self.db.execute("DELETE FROM check_days WHERE day <= ?", (check_window_cutoff(day),))
+                self._check_day = day
+            self.db.execute("COMMIT")
+        elif kind == 'report':
+            _, chat_id, day, record = change
+            record = as_record(record)
+            self.db.execute(
+                f"INSERT INTO reports (chat_id, day, {REPORT_COLUMNS}) VALUES (?, ?, {REPORT_PLACEHOLDERS})",
+                (chat_id, day) + record
+            )
+            self.db.execute(
+                "INSERT INTO rollups (chat_id, day, khaifa_key, khaifa, count) VALUES (?, ?, ?, ?, 1) "
+                "ON CONFLICT (chat_id, day, khaifa_key) DO UPDATE SET count = count + 1",
+                (chat_id, day, record.khaifa_key, record.khaifa)
+            )
+        elif kind == 'rollups':
+            _, day_rollups = change
+            self.db.execute("BEGIN")
+            for chat_id, day, counts in day_rollups:
+                self.db.execute("DELETE FROM rollups WHERE chat_id = ? AND day = ?", (chat_id, day))
+                self.db.executemany(
+                    "INSERT INTO rollups (chat_id, day, khaifa_key, khaifa, count) VALUES (?, ?, ?, ?, ?)",
+                    ((chat_id, day) + tuple(entry) for entry in counts)
+                )
+            self.db.execute("COMMIT")
+        elif kind in ('clear_day', 'archive_day'):
+            _, chat_id, day = change
+            self.db.execute("DELETE FROM reports WHERE chat_id = ? AND day = ?", (chat_id, day))
+            if kind == 'clear_day':
+                self.db.execute("DELETE FROM rollups WHERE chat_id = ? AND day = ?", (chat_id, day))
+        elif kind == 'clear_group':
+            _, chat_id = change
+            self.db.execute("DELETE FROM reports WHERE chat_id = ?", (chat_id,))
+            self.db.execute("DELETE FROM rollups WHERE chat_id = ?", (chat_id,))
+        else:
+            raise ValueError(f"Unknown change: {kind}")
+
+    def record(self, application, change: Optional[tuple]) -> None:
+        if change:
+            self.apply(change)
+
+    async def get_bot_data(self) -> LiveBotData:
+        await self._migrate_pickle()
+        bot_data = LiveBotData(users=set(), groups=set(), chat_seen={}, check_records={}, group_data={}, rollups={})
+
+        for chat_id, chat_type in self.db.execute("SELECT chat_id, chat_type FROM chats"):
+            if chat_type == 'private':
+                bot_data['users'].add(chat_id)
+            else:
+                bot_data['groups'].add(chat_id)
+        bot_data['chat_seen'] = dict(self.db.execute("SELECT chat_id, day FROM chat_seen"))
+
+        bot_data['check_records'] = CheckStore.from_items(self.db.execute("SELECT number, count FROM check_records"))
+        window = bot_data['check_window'] = CheckWindow()
+        for day, number, count in self.db.execute("SELECT day, number, count FROM check_days ORDER BY day"):
+            window.set(day, number, count)
+
+        for row in self.db.execute(f"SELECT chat_id, day, {REPORT_COLUMNS} FROM reports ORDER BY id"):
+            days = bot_data['group_data'].setdefault(row[0], {})
+            days.setdefault(row[1], DayReports()).add(ReportRecord(*row[2:]))
+
+        for chat_id, day, key, khaifa, count in self.db.execute(
+            "SELECT chat_id, day, khaifa_key, khaifa, count FROM rollups"
+        ):
+            bot_data['rollups'].setdefault(chat_id, {}).setdefault(day, {})[key] = (khaifa, count)
+
+        for key, value in self.db.execute("SELECT key, value FROM kv"):
+            self._kv_cache[key] = value
+            bot_data[key] = pickle.loads(value)
+
+        return bot_data
+
+    async def update_bot_data(self, data) -> None:
+        # Called with the live bot_data (see LiveBotData). The table-backed keys are already
+        # written change by change via record(); only the remaining keys (bounded caches and
+        # derived data) are stored here, and only when their pickled value actually changed.
+        started = time.perf_counter()
+        written = 0
+        for key, value in data.items():
+            if key in TABLE_KEYS:
+                continue
+            blob = pickle.dumps(value)
+            if self._kv_cache.get(key) != blob:
+                self._write_kv(key, blob)
+                written += len(blob)
+        observe_flush('sqlite', time.perf_counter() - started, written)
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    async def get_user_data(self) -> dict:
+        await self._migrate_pickle()
+        return {user_id: pickle.loads(data) for user_id, data in self.db.execute("SELECT user_id, data FROM user_data")}
+
+    async def get_chat_data(self) -> dict:
+        await self._migrate_pickle()
+        return {chat_id: pickle.loads(data) for chat_id, data in self.db.execute("SELECT chat_id, data FROM chat_data")}
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self.db.execute(
+            "INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)", (user_id, pickle.dumps(data))
+        )
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self.db.execute(
+            "INSERT OR REPLACE INTO chat_data (chat_id, data) VALUES (?, ?)", (chat_id, pickle.dumps(data))
+        )
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self.db.execute("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self.db.execute("DELETE FROM chat_data WHERE chat_id = ?", (chat_id,))
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def get_conversations(self, name: str) -> dict:
+        return {
+            pickle.loads(key): pickle.loads(state)
+            for key, state in self.db.execute("SELECT key, state FROM conversations WHERE name = ?", (name,))
+        }
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        if new_state is None:
+            self.db.execute(
+                "DELETE FROM conversations WHERE name = ? AND key = ?", (name, pickle.dumps(key))
+            )
+        else:
+            self.db.execute(
+                "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                (name, pickle.dumps(key), pickle.dumps(new_state))
+            )
+
+    async def flush(self) -> None:
+        self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+class JournalPersistence(PicklePersistence):
+    # Every change is appended to the journal as one length-prefixed, fsync'd record tagged
+    # with a sequence number. Compaction pickles the live bot_data into the snapshot together
+    # with the last sequence number it contains and then truncates the journal; on startup the
+    # snapshot is loaded and only journal records newer than that number are replayed, so a
+    # crash between the two steps cannot apply a report twice.
+    RECORD_HEADER = struct.Struct('>I')
+
+    def __init__(self, filepath: str = PERSISTENCE_FILE, journal_path: str = JOURNAL_FILE,
+                 compact_interval: float = JOURNAL_COMPACT_INTERVAL,
+                 compact_bytes: int = JOURNAL_COMPACT_BYTES) -> None:
+        super().__init__(filepath=filepath, on_flush=True, update_interval=compact_interval)
+        self.journal_path = journal_path
+        self.compact_bytes = compact_bytes
+        self.seq = 0
+        self.flush_pending = False
+        self._live_bot_data = None
+        self._journal = None
+
+    async def get_bot_data(self) -> LiveBotData:
+        if self._live_bot_data is None:
+            bot_data = await super().get_bot_data()
+            self.seq = bot_data.pop(JOURNAL_SEQ_KEY, 0)
+            self._replay(bot_data)
+            # The application keeps using this very object, which lets compaction snapshot the
+            # live state synchronously instead of a copy that may already be stale.
+            self._live_bot_data = LiveBotData(bot_data)
+            self._journal = open(self.journal_path, 'ab')
+        return self._live_bot_data
+
+    def _replay(self, bot_data: dict) -> None:
+        if not os.path.exists(self.journal_path):
+            return
+
+        replayed = 0
+        with open(self.journal_path, 'r+b') as journal:
+            good_offset = 0
+            while True:
+                header = journal.read(self.RECORD_HEADER.size)
+                if len(header) < self.RECORD_HEADER.size:
+                    break
+                (length,) = self.RECORD_HEADER.unpack(header)
+                payload = journal.read(length)
+                if len(payload) < length:
+                    break
+                seq, change = pickle.loads(payload)
+                if seq > self.seq:
+                    apply_change(bot_data, change)
+                    self.seq = seq
+                    replayed += 1
+                good_offset = journal.tell()
+
+            # Drop a record torn by a crash mid-write so new records append cleanly.
+            journal.truncate(good_offset)
+
+        if replayed:
+            logger.info("Replayed %d journal records from %s", replayed, self.journal_path)
+
+    def record(self, application, change: Optional[tuple]) -> None:
+        if not change or self._journal is None:
+            return
+
+        self.seq += 1
+        payload = pickle.dumps((self.seq, change))
+        self._journal.write(self.RECORD_HEADER.pack(len(payload)) + payload)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+        if self._journal.tell() >= self.compact_bytes and not self.flush_pending:
+            self.flush_pending = True
+            application.create_task(_flush_now(application))
+
+    def compact(self, force: bool = False) -> None:
+        if self._live_bot_data is None or not (force or self._journal.tell()):
+            return
+
+        started = time.perf_counter()
+        data = {
+            'conversations': self.conversations,
+            'user_data': self.user_data,
+            'chat_data': self.chat_data,
+            'bot_data': dict(self._live_bot_data, **{JOURNAL_SEQ_KEY: self.seq}),
+            'callback_data': self.callback_data,
+        }
+        tmp_path = f"{self.filepath}.tmp"
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.filepath)
+
+        self._journal.truncate(0)
+        self._journal.seek(0)
+        observe_flush('journal', time.perf_counter() - started, os.path.getsize(self.filepath))
+
+    async def update_bot_data(self, data) -> None:
+        # Called by the application's persistence loop with the live bot_data (see LiveBotData),
+        # which compaction snapshots.
+        self.compact()
+
+    async def flush(self) -> None:
+        self.compact(force=True)
+
+
+def persistence_path(suffix: str = '') -> str:
+    """The file that exists once the configured backend has stored anything."""
+    return (SQLITE_FILE if PERSISTENCE_BACKEND == 'sqlite' else PERSISTENCE_FILE) + suffix
+
+
+def build_persistence(suffix: str = '') -> BasePersistence:
+    # A suffix gives a separate set of files, e.g. one per shard worker.
+    if PERSISTENCE_BACKEND == 'sqlite':
+        return SqlitePersistence(SQLITE_FILE + suffix, migrate_from=None if suffix else PERSISTENCE_FILE)
+    if PERSISTENCE_BACKEND == 'journal':
+        return JournalPersistence(PERSISTENCE_FILE + suffix, JOURNAL_FILE + suffix)
+    return WriteBehindPersistence(PERSISTENCE_FILE + suffix)
+
+
+async def seed_persistence(persistence: BasePersistence, changes) -> None:
+    """Write `changes` into a fresh persistence and flush it, outside of any Application."""
+    bot_data = await persistence.get_bot_data()
+    for change in changes:
+        apply_change(bot_data, change)
+        if isinstance(persistence, SqlitePersistence):
+            persistence.apply(change)
+
+    if isinstance(persistence, WriteBehindPersistence):
+        persistence.dirty += 1
+    await persistence.update_bot_data(bot_data)
+    await persistence.flush()
+
+
+def mark_dirty(context: CallbackContext, change: Optional[tuple] = None) -> None:
+    application = context.application
+    persistence = application.persistence
+
+    if isinstance(persistence, (WriteBehindPersistence, SqlitePersistence, JournalPersistence)):
+        persistence.record(application, change)
+
+
+async def _flush_now(application) -> None:
+    try:
+        await application.update_persistence()
+    finally:
+        application.persistence.flush_pending = False
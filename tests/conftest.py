@@ -0,0 +1,41 @@
+import os
+import sys
+
+import httpx
+import pytest
+
+# The bot's modules live at the top level of the repository.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stub_api import StubBotApi  # noqa: E402
+
+
+@pytest.fixture
+def bot_api() -> StubBotApi:
+    return StubBotApi()
+
+
+@pytest.fixture
+def make_application(tmp_path, monkeypatch, bot_api):
+    """Build main.build_application() against bot_api, with its files in tmp_path.
+
+    The Outbox paces nothing, so tests do not wait out Telegram's per-chat limits.
+    """
+    import main
+    from metrics import TimedHTTPXRequest
+    from outbox import Outbox
+    from storage import WriteBehindPersistence
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, 'TOKEN', '123:abc')
+    monkeypatch.setattr(main, 'TELEGRAM_API_URL', None)
+    monkeypatch.setattr(main, 'Outbox', lambda: Outbox(rate=1e6, chat_rate=1e6, chat_burst=1e6,
+                                                       group_rate=1e6, group_burst=1e6))
+
+    def make(persistence=None):
+        request = TimedHTTPXRequest(httpx_kwargs={'transport': httpx.MockTransport(bot_api)})
+        if persistence is None:
+            persistence = WriteBehindPersistence(str(tmp_path / 'bot_data.pickle'))
+        return main.build_application(persistence, polling=False, request=request)
+
+    return make
@@ -0,0 +1,136 @@
+"""An in-process Bot API for tests: main.build_application() with every call answered here."""
+import asyncio
+import itertools
+import json
+import urllib.parse
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from telegram import Update
+
+from outbox import get_outbox
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'bot', 'username': 'bot'}
+
+
+class StubBotApi:
+    """An httpx transport handler answering Bot API calls the way Telegram would.
+
+    Calls other than getMe are answered after `latency` seconds. Files served for getFile
+    are taken from `files`, keyed by file_id.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls: List[Tuple[str, dict]] = []
+        self.files: Dict[str, bytes] = {}
+        self.message_ids = itertools.count(1000)
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if '/file/' in path:
+            return httpx.Response(200, content=self.files[path.rsplit('/', 1)[-1]])
+
+        method = path.rsplit('/', 1)[-1]
+        if 'json' in request.headers.get('content-type', ''):
+            params = json.loads(request.content or b'{}')
+        elif 'multipart' in request.headers.get('content-type', ''):
+            params = {'multipart': request.content}
+        else:
+            params = {key: values[0] for key, values in urllib.parse.parse_qs(request.content.decode()).items()}
+        self.calls.append((method, params))
+
+        if method != 'getMe' and self.latency:
+            await asyncio.sleep(self.latency)
+        return httpx.Response(200, json={'ok': True, 'result': self.result(method, params)})
+
+    def result(self, method: str, params: dict):
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('sendMessage', 'editMessageText', 'sendDocument'):
+            chat_id = int(params.get('chat_id', 1))
+            return {'message_id': int(params.get('message_id', 0)) or next(self.message_ids), 'date': 0,
+                    'chat': chat_json(chat_id), 'from': BOT_USER, 'text': params.get('text', '')}
+        if method == 'getChat':
+            return dict(chat_json(int(params['chat_id'])), accent_color_id=0, max_reaction_count=0)
+        if method == 'getFile':
+            return {'file_id': params['file_id'], 'file_unique_id': params['file_id'], 'file_path': params['file_id']}
+        return True
+
+    def texts(self, chat_id: Optional[int] = None, methods=('sendMessage',)) -> List[str]:
+        return [params.get('text', '') for method, params in self.calls
+                if method in methods and (chat_id is None or int(params['chat_id']) == chat_id)]
+
+
+def chat_json(chat_id: int) -> dict:
+    if chat_id < 0:
+        return {'id': chat_id, 'type': 'group', 'title': f"Group {-chat_id}"}
+    return {'id': chat_id, 'type': 'private', 'first_name': f"User {chat_id}"}
+
+
+_update_ids = itertools.count(1)
+
+
+def message(chat_id: int, text: Optional[str] = None, sender: Optional[int] = None, **fields) -> dict:
+    update_id = next(_update_ids)
+    body = {
+        'message_id': update_id, 'date': 0, 'chat': chat_json(chat_id),
+        'from': {'id': sender or abs(chat_id), 'is_bot': False, 'first_name': 'u'},
+    }
+    if text is not None:
+        body['text'] = text
+        if text.startswith('/'):
+            body['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    body.update(fields)
+    return {'update_id': update_id, 'message': body}
+
+
+def document(chat_id: int, file_name: str, caption: Optional[str] = None, sender: Optional[int] = None) -> dict:
+    fields = {'document': {'file_id': file_name, 'file_unique_id': file_name, 'file_name': file_name}}
+    if caption is not None:
+        fields['caption'] = caption
+    return message(chat_id, sender=sender, **fields)
+
+
+def callback(chat_id: int, data: str, message_id: int = 1, sender: Optional[int] = None) -> dict:
+    update_id = next(_update_ids)
+    return {'update_id': update_id, 'callback_query': {
+        'id': str(update_id), 'chat_instance': 'test', 'data': data,
+        'from': {'id': sender or abs(chat_id), 'is_bot': False, 'first_name': 'u'},
+        'message': {'message_id': message_id, 'date': 0, 'chat': chat_json(chat_id), 'from': BOT_USER, 'text': '.'},
+    }}
+
+
+ADMINISTRATOR_RIGHTS = (
+    'can_be_edited', 'is_anonymous', 'can_manage_chat', 'can_delete_messages', 'can_manage_video_chats',
+    'can_restrict_members', 'can_promote_members', 'can_change_info', 'can_invite_users', 'can_post_stories',
+    'can_edit_stories', 'can_delete_stories',
+)
+
+
+def chat_member(status: str) -> dict:
+    member = {'user': BOT_USER, 'status': status}
+    if status == 'restricted':
+        member.update(is_member=False, can_send_messages=False)
+    elif status == 'administrator':
+        member.update(dict.fromkeys(ADMINISTRATOR_RIGHTS, False))
+    elif status == 'kicked':
+        member.update(until_date=0)
+    return member
+
+
+def my_chat_member(chat_id: int, status: str, old_status: str = 'member', sender: int = 77) -> dict:
+    update_id = next(_update_ids)
+    return {'update_id': update_id, 'my_chat_member': {
+        'chat': chat_json(chat_id), 'from': {'id': sender, 'is_bot': False, 'first_name': 'u'}, 'date': 0,
+        'old_chat_member': chat_member(old_status), 'new_chat_member': chat_member(status),
+    }}
+
+
+async def process(application, *updates: dict) -> None:
+    """Handle `updates` one after another and wait until every queued reply was sent."""
+    for data in updates:
+        await application.process_update(Update.de_json(data, application.bot))
+    outbox = get_outbox(application.bot)
+    if outbox is not None:
+        await outbox.join()
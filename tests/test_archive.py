@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+import archive
+from report_store import DayReports, ReportRecord, get_day_reports
+
+
+def test_archiving_a_day_twice_keeps_one_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, 'ARCHIVE_DIR', str(tmp_path))
+    records = (ReportRecord('17.10', 'Aung', 'a@gmail.com', 'aung'), ReportRecord('17.10', 'Ko', 'b@gmail.com', 'ko'))
+
+    def snapshot():
+        return {'group_data': {'-5': {'2026-10-17': DayReports(records), '2026-10-18': DayReports()}}}
+
+    # A restart before the 'archive_day' changes were persisted archives the day again.
+    for _ in range(2):
+        bot_data = snapshot()
+        assert asyncio.run(archive.archive_finished_days(bot_data, '2026-10-18')) == [('-5', '2026-10-17')]
+        assert get_day_reports(bot_data, '-5', '2026-10-17') is None
+
+    assert list(archive.iter_archived_records('-5', '2026-10-17')) == list(records)
+    assert not list(tmp_path.glob('*/*.tmp'))
+
+
+def test_archive_files_are_written_off_the_event_loop(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, 'ARCHIVE_DIR', str(tmp_path))
+    write_archived_day = archive.write_archived_day
+
+    def slow_write(chat_id, day, day_reports):
+        time.sleep(0.1)
+        write_archived_day(chat_id, day, day_reports)
+
+    monkeypatch.setattr(archive, 'write_archived_day', slow_write)
+    records = (ReportRecord('17.10', 'Aung', 'a@gmail.com', 'aung'),)
+    bot_data = {'group_data': {
+        '-5': {'2026-10-16': DayReports(records), '2026-10-17': DayReports(records)},
+        '-6': {'2026-10-17': DayReports(records), '2026-10-18': DayReports(records)},
+    }}
+
+    async def scenario():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        archiving = asyncio.create_task(archive.archive_finished_days(bot_data, '2026-10-18'))
+        await asyncio.sleep(0.05)
+        # Days are only taken out of group_data once written; one is cleared meanwhile.
+        assert '2026-10-16' in bot_data['group_data']['-5']
+        del bot_data['group_data']['-6']['2026-10-17']
+        moved = await archiving
+        ticker.cancel()
+        return moved, ticks
+
+    moved, ticks = asyncio.run(scenario())
+    assert ticks >= 10
+    assert moved == [('-5', '2026-10-16'), ('-5', '2026-10-17')]
+    assert {chat_id: list(days) for chat_id, days in bot_data['group_data'].items()} == {'-6': ['2026-10-18']}
+    assert archive.archived_days('-5') == ['2026-10-16', '2026-10-17']
+    assert archive.archived_days('-6') == []
@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+from telegram.error import BadRequest, ChatMigrated, Conflict, EndPointNotFound, Forbidden, InvalidToken
+
+from broadcast import FanOut
+
+ERRORS = {
+    2: Forbidden('bot was blocked by the user'),
+    3: BadRequest('Chat not found'),
+    4: BadRequest('Message text is empty'),
+    5: Conflict('terminated by other getUpdates request'),
+    6: InvalidToken(),
+    7: EndPointNotFound('Not Found'),
+}
+
+
+class FlakyBot:
+    def __init__(self) -> None:
+        self.delivered = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(0)
+        if chat_id == -8:
+            raise ChatMigrated(-1008)
+        if chat_id in ERRORS:
+            raise ERRORS[chat_id]
+        self.delivered.append(chat_id)
+
+
+def test_fan_out_counts_every_telegram_error_and_finishes():
+    bot = FlakyBot()
+    chat_ids = [1, 2, 3, 4, 5, 6, 7, -8] + list(range(100, 160))
+
+    started = time.monotonic()
+    fan_out = asyncio.run(FanOut(bot, chat_ids, 'hello').run())
+
+    assert fan_out.done == fan_out.total == len(chat_ids)
+    assert fan_out.failed == 6
+    assert fan_out.sent == 62
+    assert sorted(fan_out.unreachable) == [2, 3]
+    assert fan_out.migrated == {-8: -1008}
+    assert sorted(bot.delivered) == sorted([-1008, 1] + list(range(100, 160)))
+    # Pacing is left to the bot's rate limiter; FanOut itself does not throttle. Only the
+    # migrated chat waits out BROADCAST_PER_CHAT_INTERVAL before its retry.
+    assert time.monotonic() - started < 2
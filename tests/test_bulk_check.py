@@ -0,0 +1,42 @@
+import asyncio
+
+from check_store import get_check_store
+from stub_api import document, message, process
+
+NUMBERS = ['09111111111', '09222222222', '09333333333', '09111111111']
+
+
+def run(make_application, *updates):
+    async def scenario():
+        application = make_application()
+        async with application:
+            await process(application, *updates)
+            return get_check_store(application.bot_data)
+
+    return asyncio.run(scenario())
+
+
+def test_uncaptioned_document_is_not_checked(make_application, bot_api):
+    bot_api.files['numbers.txt'] = "\n".join(NUMBERS).encode()
+
+    store = run(make_application, document(-5, 'numbers.txt'), document(-5, 'numbers.txt', caption='sales list'))
+
+    assert len(store) == 0
+    assert [method for method, _ in bot_api.calls if method != 'getMe'] == []
+
+
+def test_chk_captioned_document_checks_every_number(make_application, bot_api):
+    bot_api.files['numbers.csv'] = ("phone,name\n" + "\n".join(f"{n},Ko" for n in NUMBERS)).encode('utf-8-sig')
+
+    store = run(make_application, document(-5, 'numbers.csv', caption='/chk'))
+
+    assert dict(store.items()) == {'09111111111': 1, '09222222222': 1, '09333333333': 1}
+    (reply,) = bot_api.texts(-5)
+    assert reply.startswith("🔍 Bulk check: 3 numbers\n✅ New: 3")
+    assert "Repeated in the list, counted once: 1" in reply
+
+
+def test_spaced_single_number_is_recorded_whole(make_application, bot_api):
+    store = run(make_application, message(-5, '/chk 09 123 456 789'))
+
+    assert dict(store.items()) == {'09123456789': 1}
@@ -0,0 +1,54 @@
+import asyncio
+import pickle
+from types import SimpleNamespace
+
+import main
+from chat_cache import ChatCache, ChatInfo, get_chat_cache
+
+
+def test_chat_cache_evicts_the_least_recently_used():
+    cache = ChatCache(max_size=3)
+    for chat_id in (1, 2, 3):
+        cache.put(chat_id, 'group', f"Group {chat_id}")
+    assert cache.name(1) == "Group 1"
+
+    cache.put(4, 'group', "Group 4")
+    # 2 was the least recently used after 1 was read.
+    assert list(cache.entries) == [3, 1, 4]
+    assert cache.name(2, "gone") == "gone"
+
+    assert cache.put(3, 'group', "Group 3") is False
+    assert cache.put(3, 'supergroup', "Group 3") is True
+    cache.put(5, 'group', "Group 5")
+    assert list(cache.entries) == [4, 3, 5]
+
+    restored = pickle.loads(pickle.dumps(cache))
+    assert restored.entries == cache.entries and restored.max_size == 3
+
+
+def test_refresh_chat_cache_fetches_only_stale_chats(make_application, bot_api):
+    async def scenario():
+        application = make_application()
+        async with application:
+            cache = get_chat_cache(application.bot_data)
+            cache.ttl = 3600
+            cache.put(-1, 'group', "Fresh name")
+            cache.entries[-2] = ChatInfo('group', "Old name", 0.0)
+            persistence = application.persistence
+
+            async def refresh():
+                calls, dirty = len(bot_api.calls), persistence.dirty
+                await main.refresh_chat_cache(SimpleNamespace(application=application), [-1, -2, -3])
+                fetched = [int(params['chat_id']) for method, params in bot_api.calls[calls:] if method == 'getChat']
+                return fetched, persistence.dirty - dirty
+
+            # Everything is fresh after the first refresh: the second makes no calls.
+            return cache, await refresh(), await refresh()
+
+    cache, (fetched, changes), (fetched_again, changes_again) = asyncio.run(scenario())
+    assert sorted(fetched) == [-3, -2]
+    assert changes == 1
+    assert (fetched_again, changes_again) == ([], 0)
+    assert cache.name(-1) == "Fresh name"
+    assert cache.name(-2) == "Group 2"
+    assert cache.name(-3) == "Group 3"
@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+
+import main
+from chat_registry import CHAT_INACTIVE_DAYS, CHAT_SEEN_KEY, seen_day
+from stub_api import message, my_chat_member, process
+
+
+def test_first_contact_registers_the_chat_once(make_application):
+    async def scenario():
+        application = make_application()
+        async with application:
+            await process(application, message(5, 'hi'), message(-7, 'hi'))
+            dirty = application.persistence.dirty
+            await process(application, message(5, 'hi again'), message(-7, 'hi again'))
+            return application.bot_data, dirty, application.persistence.dirty
+
+    bot_data, dirty_after_first, dirty_after_second = asyncio.run(scenario())
+    assert bot_data['users'] == {5}
+    assert bot_data['groups'] == {-7}
+    assert bot_data[CHAT_SEEN_KEY] == {5: seen_day(), -7: seen_day()}
+    # Known chats already seen today are not a persistence change.
+    assert dirty_after_second == dirty_after_first
+
+
+def test_my_chat_member_registers_and_drops_the_chat(make_application):
+    async def scenario():
+        application = make_application()
+        async with application:
+            bot_data = application.bot_data
+            await process(application, my_chat_member(-7, 'member', old_status='left'),
+                          my_chat_member(-8, 'administrator', old_status='left'),
+                          my_chat_member(9, 'member', old_status='kicked'))
+            registered = (set(bot_data['users']), set(bot_data['groups']))
+
+            await process(application, my_chat_member(-7, 'left'), my_chat_member(-8, 'kicked', old_status='administrator'),
+                          my_chat_member(9, 'kicked'),
+                          # Not a membership change: still registered.
+                          my_chat_member(-10, 'administrator', old_status='member'))
+            return registered, bot_data
+
+    (users, groups), bot_data = asyncio.run(scenario())
+    assert users == {9}
+    assert groups == {-7, -8}
+    assert bot_data['users'] == set()
+    assert bot_data['groups'] == set()
+    assert set(bot_data[CHAT_SEEN_KEY]) == set()
+
+
+def test_chat_prune_job_drops_chats_past_the_cutoff(make_application):
+    today = seen_day()
+
+    async def scenario():
+        application = make_application()
+        async with application:
+            bot_data = application.bot_data
+            bot_data['users'] = {1, 2, 3}
+            bot_data['groups'] = {-1, -2}
+            bot_data[CHAT_SEEN_KEY] = {
+                1: today - CHAT_INACTIVE_DAYS - 1,
+                2: today - CHAT_INACTIVE_DAYS,
+                3: today,
+                -1: today - CHAT_INACTIVE_DAYS - 30,
+            }
+            await main.chat_prune_job(SimpleNamespace(application=application, job=SimpleNamespace(data=None)))
+            return bot_data
+
+    bot_data = asyncio.run(scenario())
+    assert bot_data['users'] == {2, 3}
+    # -2 had no last-seen day: its inactivity counts from now instead of dropping it.
+    assert bot_data['groups'] == {-2}
+    assert bot_data[CHAT_SEEN_KEY] == {2: today - CHAT_INACTIVE_DAYS, 3: today, -2: today}
+
+
+def test_chat_prune_job_of_a_shard_only_drops_its_own_chats(make_application):
+    today = seen_day()
+
+    async def scenario():
+        application = make_application()
+        async with application:
+            bot_data = application.bot_data
+            bot_data['groups'] = {-1, -2}
+            bot_data[CHAT_SEEN_KEY] = {-1: today - CHAT_INACTIVE_DAYS - 1, -2: today - CHAT_INACTIVE_DAYS - 1}
+            owns = lambda chat_id: chat_id == -2  # noqa: E731
+            await main.chat_prune_job(SimpleNamespace(application=application, job=SimpleNamespace(data=owns)))
+            return bot_data
+
+    assert asyncio.run(scenario())['groups'] == {-1}
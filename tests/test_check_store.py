@@ -0,0 +1,92 @@
+import pickle
+import random
+
+from check_store import BloomFilter, CheckStore, CheckWindow, check_window_cutoff, pack_number
+
+
+def random_keys(rng, count):
+    return {pack_number(f"09{rng.randrange(10 ** 9):09d}") for _ in range(count)}
+
+
+def test_bloom_filter_false_positive_rate_holds_for_large_filters():
+    # 1,000,000 keys at 24 bits per key is a 24M-bit filter, past the 2**22 bits a probe built
+    # from the top 22 bits of one hash could reach. Three independent probes give ~0.16%.
+    rng = random.Random(1)
+    keys = random_keys(rng, 1_000_000)
+    bloom = BloomFilter(len(keys) * 2)
+    for key in keys:
+        bloom.add(key)
+
+    assert all(key in bloom for key in keys)
+    misses = [key for key in random_keys(rng, 1_000_000) if key not in keys]
+    rate = sum(key in bloom for key in misses) / len(misses)
+    assert rate < 0.0025
+
+
+def test_unpickled_store_rebuilds_a_stale_bloom_filter():
+    store = CheckStore()
+    store.increment('0911111111')
+    store._merge()
+    store.increment('0922222222')
+    # A filter pickled before the probe layout changed sets none of the current bits.
+    stale = BloomFilter(store.bloom.capacity)
+    del stale.version
+    store.bloom = stale
+
+    restored = pickle.loads(pickle.dumps(store))
+    assert restored['0911111111'] == 1
+    assert restored['0922222222'] == 1
+    assert restored.increment('0911111111') == 2
+    assert len(restored) == 2
+
+
+def test_check_window_rolls_over_day_boundaries():
+    window = CheckWindow(days=3)
+    assert window.add('0911111111', '2026-10-30') == (1, 1)
+    assert window.add('0911111111', '2026-10-30') == (2, 2)
+    assert window.add('0911111111', '2026-10-31') == (1, 3)
+    assert window.add_many(['0911111111', '0922222222'], '2026-11-01') == [(1, 4), (1, 1)]
+    assert [ordinal for ordinal, _ in window.buckets] == [CheckWindow.ordinal(day) for day in
+                                                           ('2026-10-30', '2026-10-31', '2026-11-01')]
+
+
+def test_check_window_expires_the_oldest_bucket():
+    window = CheckWindow(days=3)
+    window.add('0911111111', '2026-10-16')
+    window.add('0911111111', '2026-10-17')
+    window.add('0922222222', '2026-10-18')
+    assert len(window.buckets) == 3
+
+    # 10-19 leaves 10-16 behind: three days are 10-17..10-19.
+    assert window.add('0911111111', '2026-10-19') == (1, 2)
+    assert [day for day, _, _ in window.items()] == ['2026-10-17', '2026-10-18', '2026-10-19']
+    assert check_window_cutoff('2026-10-19', days=3) == '2026-10-16'
+
+    # A gap longer than the window drops every bucket; reading alone expires them too.
+    assert window.recent('0911111111', '2026-10-25') == 0
+    assert len(window.buckets) == 0 and len(window) == 0
+
+
+def test_check_window_takes_days_out_of_order_within_the_window():
+    window = CheckWindow(days=3)
+    window.add('0911111111', '2026-10-18')
+    window.set('2026-10-16', '0911111111', 4)
+    window.set('2026-10-17', '0911111111', 2)
+    # Outside the window ending on the newest day: ignored.
+    window.set('2026-10-15', '0911111111', 9)
+
+    assert list(window.items()) == [('2026-10-16', '0911111111', 4), ('2026-10-17', '0911111111', 2),
+                                    ('2026-10-18', '0911111111', 1)]
+    assert window.recent('0911111111', '2026-10-18') == 7
+
+
+def test_check_window_counts_survive_a_pickle_round_trip():
+    window = CheckWindow(days=3)
+    window.add_many(['0911111111', '0922222222', '0911111111'], '2026-10-17')
+    window.add('0911111111', '2026-10-18')
+
+    restored = pickle.loads(pickle.dumps(window))
+    assert list(restored.items()) == list(window.items())
+    assert restored.recent('0911111111', '2026-10-18') == 3
+    assert restored.add('0922222222', '2026-10-19') == (1, 2)
+    assert restored.recent('0911111111', '2026-10-20') == 1
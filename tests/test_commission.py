@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from commission import (
+    COMMISSION_RATES, calculate_batch, commission_factor, commission_type, csv_rows, parse_commission_rows,
+    parse_rates, text_rows
+)
+from stub_api import message, process
+
+
+def test_rate_table():
+    assert parse_rates('killer=0.45, deposit=0.3,m1=0.25,,bonus=') == {'killer': 0.45, 'deposit': 0.3, 'm1': 0.25}
+    assert COMMISSION_RATES == {'killer': 0.45, 'deposit': 0.3, 'm1': 0.25}
+    # amount / 1600 * 0.04 * <rate> * 4.7
+    assert 1600 * commission_factor('killer') == pytest.approx(0.04 * 0.45 * 4.7)
+    assert 1600 * commission_factor('deposit') == pytest.approx(0.04 * 0.3 * 4.7)
+    assert 1600 * commission_factor('m1') == pytest.approx(0.04 * 0.25 * 4.7)
+    assert [commission_type(token) for token in ('Killer', '(M2)', 'dep', 'kill', 'm1', 'm3')] == [
+        'killer', 'deposit', 'deposit', 'killer', 'm1', None]
+
+
+def test_spaced_thousands_are_one_amount():
+    rows = text_rows("killer 12 000 8000\ndeposit 1 250 000\nm1\n12 000  500\nkiller 12 0001")
+    assert rows == [['killer', '12 000', '8000'], ['deposit', '1 250 000'], ['m1'],
+                    ['12 000', '500'], ['killer', '12', '0001']]
+
+    items, skipped = parse_commission_rows(rows)
+    assert items == [('killer', 12000.0), ('killer', 8000.0), ('deposit', 1250000.0),
+                     ('m1', 12000.0), ('m1', 500.0), ('killer', 12.0), ('killer', 1.0)]
+    assert skipped == 0
+
+
+def test_batch_totals_per_type():
+    items, skipped = parse_commission_rows(csv_rows("type,amount\nkiller\n,\"12,000\"\n,8 000\nm2,1600\nnote,x\n"))
+    assert items == [('killer', 12000.0), ('killer', 8000.0), ('deposit', 1600.0)]
+    assert skipped == 2
+
+    rows, totals = calculate_batch(items)
+    assert totals['killer'].count == 2
+    assert totals['killer'].amount == 20000.0
+    assert totals['killer'].commission == pytest.approx(20000 * commission_factor('killer'))
+    assert rows[2].commission == pytest.approx(0.04 * 0.3 * 4.7)
+
+
+def test_commbatch_command_reads_spaced_thousands(make_application, bot_api):
+    async def scenario():
+        application = make_application()
+        async with application:
+            await process(application, message(5, '/commbatch\nkiller 12 000\nm1 5 000 6 500'))
+
+    asyncio.run(scenario())
+    (reply,) = bot_api.texts(5)
+    assert reply.startswith("1. Killer 12,000.00 → 0.6345\n2. M1 5,000.00 → 0.1469\n3. M1 6,500.00 → 0.1909")
@@ -0,0 +1,76 @@
+import asyncio
+import csv
+
+import pytest
+from openpyxl import load_workbook
+
+from export import ALL_DAYS_START, parse_export_args, write_export
+from report_store import ReportRecord, get_day_reports
+from stub_api import message, process
+
+TODAY = '2026-10-18'
+
+
+def test_parse_export_args_accepts_a_range_as_two_days():
+    assert parse_export_args(['2026-10-01', '2026-10-18'], TODAY) == ('2026-10-01', '2026-10-18', 'csv')
+    assert parse_export_args(['2026-10-18', 'xlsx', '2026-10-01'], TODAY) == ('2026-10-01', '2026-10-18', 'xlsx')
+    assert parse_export_args(['2026-10-01..2026-10-18'], TODAY) == ('2026-10-01', '2026-10-18', 'csv')
+    assert parse_export_args(['2026-10-05'], TODAY) == ('2026-10-05', '2026-10-05', 'csv')
+    assert parse_export_args([], TODAY) == (TODAY, TODAY, 'csv')
+    assert parse_export_args(['ALL'], TODAY) == (ALL_DAYS_START, TODAY, 'csv')
+
+
+@pytest.mark.parametrize('args', [
+    ['2026-10-01', '2026-10-02', '2026-10-03'],
+    ['2026-10-01..2026-10-02', '2026-10-03'],
+    ['all', '2026-10-01'],
+    ['2026-13-01'],
+    ['2025-01-01', '2026-10-18'],
+])
+def test_parse_export_args_rejects_what_is_not_one_range(args):
+    with pytest.raises(ValueError):
+        parse_export_args(args, TODAY)
+
+
+PLAIN = ReportRecord('18.10', 'Aung', 'a@gmail.com', 'aung', tele_name='Ko')
+HOSTILE = ReportRecord(
+    date='=1+1', khaifa='@SUM(A1)', contact='=HYPERLINK("http://x","y")', khaifa_key='sum',
+    tele_name='+95 9 123', username='-2+3', age='\t=1', current_work='Sales', phone='09123',
+)
+
+
+def test_csv_export_neutralises_formulas(tmp_path):
+    path = str(tmp_path / 'export.csv')
+    assert write_export(path, 'csv', '-5', [(TODAY, (PLAIN, HOSTILE))]) == 2
+
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        header, *rows = list(csv.reader(file))
+    assert rows[0] == [TODAY, 'Aung', '18.10', 'a@gmail.com', 'Ko', 'N/A', 'N/A', 'N/A', 'N/A']
+    assert rows[1] == [TODAY, "'@SUM(A1)", "'=1+1", "'=HYPERLINK(\"http://x\",\"y\")", "'+95 9 123",
+                       "'-2+3", "'\t=1", 'Sales', '09123']
+
+
+def test_xlsx_export_stores_formulas_as_text(tmp_path):
+    path = str(tmp_path / 'export.xlsx')
+    write_export(path, 'xlsx', '-5', [(TODAY, (HOSTILE,))])
+
+    sheet = load_workbook(path).active
+    cells = list(sheet.iter_rows(min_row=2))[0]
+    assert all(cell.data_type == 's' for cell in cells)
+    assert [cell.value for cell in cells] == [TODAY, HOSTILE.khaifa, HOSTILE.date, HOSTILE.contact, HOSTILE.tele_name,
+                                              HOSTILE.username, HOSTILE.age, HOSTILE.current_work, HOSTILE.phone]
+
+
+def test_export_command_exports_a_two_day_range(make_application, bot_api):
+    async def scenario():
+        application = make_application()
+        async with application:
+            for day in ('2026-10-16', '2026-10-17', TODAY):
+                get_day_reports(application.bot_data, '-5', day, create=True).add(PLAIN)
+            await process(application, message(-5, '/export 2026-10-17 2026-10-18'),
+                          message(-5, '/export 2026-10-16 2026-10-17 2026-10-18'))
+
+    asyncio.run(scenario())
+    (upload,) = [params['multipart'] for method, params in bot_api.calls if method == 'sendDocument']
+    assert b'2 reports (2026-10-17..2026-10-18)' in upload
+    assert bot_api.texts(-5)[-1].startswith('Usage: /export')
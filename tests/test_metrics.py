@@ -0,0 +1,65 @@
+import asyncio
+import re
+
+import httpx
+
+import metrics
+from stub_api import message, process
+from web_server import WebServer, add_monitoring_routes
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_][a-zA-Z0-9_]*="[^"\\]*",?)*\})? (\S+)$')
+
+
+def parse(text: str) -> dict:
+    """The samples of a Prometheus text exposition, {(name, labels): value}, checking its format."""
+    assert text.endswith('\n')
+    helps, types, samples = set(), {}, {}
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            name = line.split()[2]
+            assert name not in helps, f"HELP {name} repeated"
+            helps.add(name)
+        elif line.startswith('# TYPE '):
+            _, _, name, kind = line.split()
+            assert name not in types, f"TYPE {name} repeated"
+            assert kind in ('counter', 'gauge', 'histogram')
+            types[name] = kind
+        else:
+            match = SAMPLE.match(line)
+            assert match, line
+            name, labels, value = match.groups()
+            family = re.sub(r'_(bucket|sum|count)$', '', name) if name not in types else name
+            assert family in types, f"{name} has no TYPE"
+            assert (name, labels) not in samples, f"{line} repeated"
+            samples[name, labels] = float(value)
+    assert set(types) == helps
+    return samples
+
+
+def test_metrics_output_parses_after_building_two_applications(make_application):
+    async def scenario():
+        server = WebServer('127.0.0.1', 0)
+        first, second = make_application(), make_application()
+        add_monitoring_routes(server, first)
+        add_monitoring_routes(server, second)
+        async with second:
+            second.bot_data['users'] = {1, 2, 3}  # and 5, registered by its /chk
+            await process(second, message(5, '/chk 0912345678'))
+            await server.start()
+            try:
+                async with httpx.AsyncClient() as client:
+                    response = await client.get(f'http://127.0.0.1:{server.port}/metrics')
+            finally:
+                await server.stop()
+        return response
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+
+    samples = parse(response.text)
+    assert len(metrics.REGISTRY) == len({metric.name for metric in metrics.REGISTRY})
+    # The gauges read the application registered last.
+    assert samples['bot_data_entries', '{key="users"}'] == 4
+    assert samples['bot_update_queue_depth', None] == 0
+    assert samples['bot_handler_latency_seconds_bucket', '{handler="check_command",le="+Inf"}'] >= 1
@@ -0,0 +1,61 @@
+import asyncio
+import gc
+
+from telegram.error import NetworkError
+
+import outbox
+from outbox import COALESCE_SEPARATOR, INTERACTIVE, BULK, Outgoing, join_unqueued, queue_message
+
+
+def outgoing(text, reply_to=None, **kwargs):
+    fields = dict(chat_id=-5, text=text, priority=BULK, parse_mode=None, reply_to=reply_to, reply_markup=None)
+    fields.update(kwargs)
+    return Outgoing(**fields)
+
+
+def test_merge_joins_plain_messages():
+    merged = outgoing("a").merge(outgoing("b", priority=INTERACTIVE))
+    assert merged.text == "a" + COALESCE_SEPARATOR + "b"
+    assert merged.priority == INTERACTIVE
+
+
+def test_merge_keeps_replies_to_different_messages_apart():
+    assert outgoing("a", reply_to=1).merge(outgoing("b", reply_to=2)) is None
+    assert outgoing("a", reply_to=1).merge(outgoing("b")) is None
+    assert outgoing("a", reply_to=1).merge(outgoing("b", reply_to=1)).reply_to == 1
+
+
+def test_merge_refuses_markup_parse_mode_and_long_text():
+    assert outgoing("a", reply_markup=object()).merge(outgoing("b")) is None
+    assert outgoing("a", parse_mode='HTML').merge(outgoing("b")) is None
+    assert outgoing("a" * 4000).merge(outgoing("b" * 100)) is None
+
+
+class BotWithoutOutbox:
+    rate_limiter = None
+
+    def __init__(self) -> None:
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(0.01)
+        if text == 'fail':
+            raise NetworkError('connection reset')
+        self.sent.append((chat_id, text, kwargs.get('reply_parameters')))
+
+
+def test_queue_message_without_outbox_keeps_and_logs_background_sends(caplog):
+    bot = BotWithoutOutbox()
+
+    async def scenario():
+        queue_message(bot, 5, 'hello', reply_to=7)
+        queue_message(bot, 5, 'fail')
+        # Only the module holds the tasks; they must survive a collection mid-send.
+        gc.collect()
+        assert len(outbox._unqueued_sends) == 2
+        await join_unqueued()
+
+    asyncio.run(scenario())
+    assert [(chat_id, text, reply.message_id) for chat_id, text, reply in bot.sent] == [(5, 'hello', 7)]
+    assert not outbox._unqueued_sends
+    assert 'Background message failed: connection reset' in caplog.text
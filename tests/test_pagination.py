@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import main
+from report_store import ReportRecord, get_day_reports
+from stub_api import callback, message, process
+
+DAY = '2026-10-18'
+ADMIN = main.ADMIN_IDS[0]
+
+
+def add_reports(bot_data: dict, chat_id: int, count: int):
+    reports = get_day_reports(bot_data, str(chat_id), DAY, create=True)
+    for n in range(count):
+        reports.add(ReportRecord('18.10', f'K{n % 7}', f'user{n}@gmail.com', f'k{n % 7}'))
+    return reports
+
+
+def edits(bot_api, chat_id):
+    return [(params['text'], params.get('reply_markup')) for method, params in bot_api.calls
+            if method == 'editMessageText' and int(params['chat_id']) == chat_id]
+
+
+def buttons(reply_markup):
+    keyboard = json.loads(reply_markup)['inline_keyboard'] if reply_markup else []
+    return [button['callback_data'] for row in keyboard for button in row]
+
+
+def test_showdata_pages_are_clamped_and_follow_deletions(make_application, monkeypatch, bot_api):
+    monkeypatch.setattr(main, 'get_data_key', lambda: DAY)
+
+    async def scenario():
+        application = make_application()
+        async with application:
+            pages = add_reports(application.bot_data, -5, 600).pages()
+            last = len(pages) - 1
+            await process(application, callback(-5, f'showdata_{DAY}_1'), callback(-5, f'showdata_{DAY}_{last + 5}'),
+                          callback(-5, 'showdata_noop'), callback(-5, f'showdata_{DAY}_x'))
+            # The day is cleared and a few reports come in: the old last page is out of range.
+            await process(application, message(-5, '/cleardata'))
+            fewer = add_reports(application.bot_data, -5, 20).pages()
+            await process(application, callback(-5, f'showdata_{DAY}_{last}'))
+            await process(application, message(-5, '/cleardata'), callback(-5, f'showdata_{DAY}_0'))
+            return pages, fewer
+
+    pages, fewer = asyncio.run(scenario())
+    assert len(pages) > 2
+    last = len(pages) - 1
+    (second, second_markup), (clamped, clamped_markup), (invalid, _), (after_clear, _), (empty, _) = edits(bot_api, -5)
+    assert second == pages[1]
+    assert buttons(second_markup) == [f'showdata_{DAY}_0', 'showdata_noop', f'showdata_{DAY}_2']
+    assert clamped == pages[last]
+    assert buttons(clamped_markup) == [f'showdata_{DAY}_{last - 1}', 'showdata_noop']
+    assert invalid == "❌ Error: Invalid page."
+    assert after_clear == fewer[-1]
+    assert empty == f"No data collected for {DAY} in this chat."
+
+
+def test_listgroups_pages_are_clamped_and_follow_a_clear(make_application, bot_api):
+    group_ids = [-100 - n for n in range(25)]
+
+    async def scenario():
+        application = make_application()
+        async with application:
+            bot_data = application.bot_data
+            bot_data['groups'] = set(group_ids)
+            for group_id in group_ids[:11]:
+                add_reports(bot_data, group_id, 1)
+            await process(application, message(ADMIN, '/listgroups'),
+                          callback(ADMIN, 'listgroups_all_2'), callback(ADMIN, 'listgroups_all_9'),
+                          callback(ADMIN, 'listgroups_data_1'), callback(5, 'listgroups_all_0'))
+            # The only group with data on the last page is cleared from that page.
+            cleared = sorted(group_ids[:11])[10]
+            await process(application, callback(ADMIN, f'admin_clear_{cleared}_data_1'))
+            return cleared
+
+    cleared = asyncio.run(scenario())
+    first = bot_api.texts(ADMIN)[0]
+    assert first.startswith("👥 Tracked Groups List (25):\n\n1. Group 124 (-124)\n")
+    assert first.count('\n') == 11
+
+    (last, last_markup), (clamped, _), (data_last, _), (after_clear, after_markup) = edits(bot_api, ADMIN)
+    assert last.endswith("21. Group 104 (-104)\n22. Group 103 (-103)\n23. Group 102 (-102)\n"
+                         "24. Group 101 (-101)\n25. Group 100 (-100)")
+    assert 'listgroups_all_1' in buttons(last_markup) and 'listgroups_all_3' not in buttons(last_markup)
+    assert clamped == last
+    assert data_last.endswith(f"11. Group {-cleared} ({cleared})")
+    # The clear shows the list again on the page it was pressed on, now the first and only one.
+    assert after_clear.startswith(f"✅ Group Data Cleared! Group {-cleared} ({cleared})")
+    assert "👥 Tracked Groups with data (10):" in after_clear
+    assert after_clear.endswith("10. Group 101 (-101)")
+    assert 'listgroups_noop' not in buttons(after_markup)
+    assert edits(bot_api, 5) == [("Admin only.", None)]
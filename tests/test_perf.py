@@ -0,0 +1,93 @@
+import asyncio
+import os
+import pstats
+
+import pytest
+
+import main
+import perf
+from perf import PERF_BUCKETS, PERF_BUCKET_GROWTH, PERF_MIN_SECONDS, LatencyHistogram, SamplingProfiler
+from stub_api import message, process
+
+ADMIN = main.ADMIN_IDS[0]
+
+
+def test_bucket_boundaries():
+    bucket, upper_bound = LatencyHistogram.bucket, LatencyHistogram.upper_bound
+    assert bucket(0) == bucket(PERF_MIN_SECONDS / 2) == bucket(PERF_MIN_SECONDS) == 0
+    assert bucket(1000) == bucket(upper_bound(PERF_BUCKETS) * 2) == PERF_BUCKETS - 1
+    assert upper_bound(PERF_BUCKETS - 1) >= 100
+
+    for index in (1, 2, 50, 200, PERF_BUCKETS - 2):
+        bound = upper_bound(index)
+        # Each bucket holds (previous bound, bound]; exact bounds are left to float rounding.
+        assert bucket(bound * (1 - 1e-9)) == index
+        assert bucket(bound * (1 + 1e-9)) == index + 1
+
+    for seconds in (1.5e-5, 3e-4, 0.0123, 0.5, 7.0, 60.0):
+        index = bucket(seconds)
+        assert upper_bound(index - 1) < seconds <= upper_bound(index) <= seconds * PERF_BUCKET_GROWTH
+
+
+def test_percentiles_are_within_one_bucket():
+    histogram = LatencyHistogram()
+    assert histogram.quantile(0.5) == 0.0
+
+    for ms in range(1, 1001):
+        histogram.observe(ms / 1000)
+    assert histogram.count == 1000
+    assert histogram.total == pytest.approx(500.5)
+    assert histogram.max == 1.0
+    for q, exact in ((0.5, 0.5), (0.95, 0.95), (0.99, 0.99)):
+        assert exact <= histogram.quantile(q) <= exact * PERF_BUCKET_GROWTH
+    # Never above the largest sample, even though its bucket reaches further.
+    assert histogram.quantile(1.0) == 1.0
+
+    single = LatencyHistogram()
+    single.observe(0.0123)
+    assert single.quantile(0.5) == single.quantile(0.99) == 0.0123
+
+
+def test_sampling_profiler_toggle():
+    profiler = SamplingProfiler()
+    assert not profiler.enabled and not profiler.should_sample()
+    assert profiler.stop() == (None, "No handler calls were sampled.")
+
+    profiler.start(1.0)
+    assert profiler.enabled and profiler.should_sample()
+    profiler.enter()
+    # One call at a time: nothing else is sampled while one is profiled.
+    assert not profiler.should_sample()
+    profiler.exit()
+    assert profiler.sampled == 1
+
+    profiler.start(0.0)
+    assert profiler.sampled == 0
+    assert not any(profiler.should_sample() for _ in range(100))
+    assert profiler.stop() == (None, "No handler calls were sampled.")
+    assert not profiler.enabled
+
+
+def test_perf_command_profiles_sampled_handlers(make_application, bot_api):
+    async def scenario():
+        application = make_application()
+        async with application:
+            await process(application, message(ADMIN, '/perf reset'), message(ADMIN, '/perf profile on 1'),
+                          message(5, '/chk 0912345678'), message(ADMIN, '/perf'))
+            await process(application, message(ADMIN, '/perf profile off'))
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        perf.PROFILER.stop()
+        perf.reset()
+
+    reset, started, status, stopped = bot_api.texts(ADMIN)
+    assert reset == "Perf counters reset."
+    assert started == "cProfile sampling started (100% of handler calls)."
+    # remember_chat and the command handler of the /chk and of the /perf asking for the status.
+    assert "cProfile sampling: on (4 calls)" in status
+    assert "check_command" in status
+    path = stopped.split('\n', 1)[0][len("Profile written to "):]
+    assert stopped.startswith("Profile written to ./perf_") and os.path.exists(path)
+    assert 'check_command' in {function for _, _, function in pstats.Stats(path).stats}
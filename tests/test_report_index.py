@@ -0,0 +1,68 @@
+import asyncio
+import pickle
+
+import main
+from report_index import ReportIndex, get_report_index, report_keys
+from report_store import ReportRecord, get_day_reports
+from stub_api import message, process
+
+DAY = '2026-10-18'
+FIRST = ReportRecord('18.10', 'Ko', 'A.Ung+sales@Gmail.com', 'ko', tele_name='Aung', phone='+95 9 123 456 789')
+
+
+def store(bot_data: dict, chat_id: str, record: ReportRecord, submitted: float = 1.0):
+    duplicates = get_report_index(bot_data).add(bot_data, chat_id, DAY, record, submitted)
+    get_day_reports(bot_data, chat_id, DAY, create=True).add(record)
+    return duplicates
+
+
+def test_report_keys_are_normalized():
+    assert report_keys(FIRST) == ['email:aung@gmail.com', 'phone:09123456789']
+
+
+def test_duplicate_is_detected_in_any_chat():
+    bot_data = {}
+    assert store(bot_data, '-5', FIRST) == []
+
+    same_phone = ReportRecord('18.10', 'Mg', 'other@gmail.com', 'mg', phone='09 123 456 789')
+    duplicates = store(bot_data, '-6', same_phone, submitted=2.0)
+    assert [(key, seen.chat_id, seen.khaifa, seen.submitted) for key, seen in duplicates] == [
+        ('phone:09123456789', '-5', 'Ko', 1.0)]
+    assert [key for key, _ in store(bot_data, '-6', ReportRecord('18.10', 'Mg', 'aung@gmail.com', 'mg'))] == [
+        'email:aung@gmail.com']
+
+
+def test_clearing_reports_frees_their_keys(make_application, monkeypatch, bot_api):
+    monkeypatch.setattr(main, 'get_data_key', lambda: DAY)
+    report = "Gmail - aung@gmail.com\nDate - 18.10\nKhaifa - Ko"
+
+    async def scenario():
+        application = make_application()
+        async with application:
+            await process(application, message(-5, report), message(-5, report))
+            await process(application, message(-5, '/cleardata'), message(-5, report))
+
+    asyncio.run(scenario())
+    first, duplicate, cleared, after_clear = bot_api.texts(-5)
+    assert 'Gmail aung@gmail.com' not in first
+    assert 'Gmail aung@gmail.com' in duplicate
+    assert cleared.startswith('✅ Data deleted')
+    assert 'Gmail aung@gmail.com' not in after_clear
+
+
+def test_index_is_rebuilt_from_stored_reports_after_loading():
+    bot_data = {}
+    store(bot_data, '-5', FIRST)
+    assert len(bot_data['report_index']) == 2
+
+    # The index is not persisted: it loads empty and is rebuilt from group_data on first use.
+    loaded = pickle.loads(pickle.dumps(bot_data))
+    assert isinstance(loaded['report_index'], ReportIndex)
+    assert len(loaded['report_index']) == 0
+
+    duplicates = store(loaded, '-6', ReportRecord('18.10', 'Mg', 'aung@gmail.com', 'mg'))
+    assert [(key, seen.chat_id, seen.submitted) for key, seen in duplicates] == [('email:aung@gmail.com', '-5', None)]
+    assert len(loaded['report_index']) == 2
+
+    # A new day starts a new index.
+    assert get_report_index(loaded).add(loaded, '-6', '2026-10-19', FIRST, 3.0) == []
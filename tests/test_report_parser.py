@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pytest
+
+from report_parser import MISSING, ParsedReport, parse_report
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+from report_parser_bench import build_corpus, legacy_extract  # noqa: E402
+
+REPORT = (
+    "Gmail        - user@gmail.com\n"
+    "  \n"
+    "Tele name    - Ko Aung\n"
+    "    \n"
+    "Username    - @koaung\n"
+    "    \n"
+    "Date        - 18.10.2026\n"
+    "    \n"
+    "Age         - 25\n"
+    "    \n"
+    "Current work - Driver\n"
+    "    \n"
+    "Phone number      - 09123456789\n"
+    "\n"
+    "Khaifa - Ma Ma"
+)
+
+
+def summary(text):
+    report = parse_report(text)
+    return report.summary if report else None
+
+
+def test_corpus_matches_legacy_extraction():
+    for text in build_corpus(5000):
+        assert summary(text) == legacy_extract(text), text
+
+
+@pytest.mark.parametrize('text', [
+    # re's case-insensitive matching takes these for i and s; lower() does not.
+    REPORT.replace("Khaifa", "Khaıfa"),
+    REPORT.replace("Khaifa", "KHAİFA"),
+    REPORT.replace("Gmail", "GMAİL"),
+    REPORT.replace("Gmail", "Emaıl"),
+    "İ " + REPORT,
+    "Khaifa - Ko\nDate - 1.1\nUſername - x",
+])
+def test_unusual_case_folding_matches_legacy_extraction(text):
+    assert summary(text) == legacy_extract(text)
+
+
+def test_all_fields():
+    assert parse_report(REPORT) == ParsedReport(
+        khaifa="Ma Ma", date="18.10.2026", contact="user@gmail.com", tele_name="Ko Aung",
+        username="@koaung", age="25", current_work="Driver", phone="09123456789",
+    )
+
+
+def test_missing_labels():
+    report = parse_report("Date - 1.1\nKhaifa - Ko")
+    assert (report.khaifa, report.date, report.contact, report.age) == ("Ko", "1.1", MISSING, MISSING)
+
+
+@pytest.mark.parametrize('text', ["", "hello", "0912345678", "Date - today", "Khaifa - Ko", "Khat - Ko\nDate - 1.1"])
+def test_not_a_report(text):
+    assert parse_report(text) is None
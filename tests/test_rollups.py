@@ -0,0 +1,97 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+import main
+from report_store import get_day_reports
+from rollups import REPORT_MAX_DAYS, count_records, summarize
+from stub_api import message, process
+
+
+def report(n: int, khaifa: str) -> str:
+    return f"Gmail - user{n}@gmail.com\nDate - 18.10\nKhaifa - {khaifa}"
+
+
+def recomputed(bot_data: dict) -> dict:
+    return {
+        chat_id: {day: dict((key, (khaifa, count)) for key, khaifa, count in count_records(get_day_reports(bot_data, chat_id, day)))
+                  for day in days}
+        for chat_id, days in bot_data.get('group_data', {}).items()
+    }
+
+
+def test_rollups_match_a_full_recount_after_adds_and_deletes(make_application, monkeypatch, bot_api):
+    async def scenario():
+        application = make_application()
+        async with application:
+            for day, chat_id, khaifas, cleared in (
+                ('2026-10-15', -5, ['Ko', 'Mg', 'Ko'], False),
+                ('2026-10-15', -6, ['Ko'], False),
+                ('2026-10-16', -5, ['Mg', 'Mg'], True),
+                ('2026-10-17', -5, ['ko ', 'Zaw'], False),
+            ):
+                monkeypatch.setattr(main, 'get_data_key', lambda: day)
+                await process(application, *(message(chat_id, report(n, khaifa)) for n, khaifa in enumerate(khaifas)))
+                if cleared:
+                    await process(application, message(chat_id, '/cleardata'),
+                                  message(chat_id, report(9, 'Aye')))
+            await process(application, message(-5, '/report 2026-10-15 2026-10-17'))
+            return application.bot_data
+
+    bot_data = asyncio.run(scenario())
+
+    assert bot_data['rollups'] == recomputed(bot_data)
+    assert summarize(bot_data, '-5', '2026-10-15', '2026-10-17') == (
+        [('2026-10-15', 3), ('2026-10-16', 1), ('2026-10-17', 2)],
+        [('Aye', 1), ('Ko', 3), ('Mg', 1), ('Zaw', 1)],
+    )
+    assert bot_api.texts(-5)[-1].startswith("📊 Report 2026-10-15 → 2026-10-17\nTotal: 6 reports on 3 days")
+
+
+TODAY = '2026-10-18'
+# The first day of the longest range /report accepts that ends today, and the day before it.
+LONGEST = (date(2026, 10, 18) - timedelta(days=REPORT_MAX_DAYS - 1)).isoformat()
+TOO_LONG = (date(2026, 10, 18) - timedelta(days=REPORT_MAX_DAYS)).isoformat()
+
+
+def test_parse_report_range_boundaries():
+    assert main.parse_report_range([], TODAY) == ('2026-10-12', TODAY)
+    assert main.parse_report_range(['2026-10-05'], TODAY) == ('2026-10-05', '2026-10-05')
+    assert main.parse_report_range(['2026-10-05..2026-10-05'], TODAY) == ('2026-10-05', '2026-10-05')
+    assert main.parse_report_range(['2026-10-09', '2026-10-01'], TODAY) == ('2026-10-01', '2026-10-09')
+    assert main.parse_report_range(['2026-10-09..2026-10-01'], TODAY) == ('2026-10-01', '2026-10-09')
+    assert main.parse_report_range([LONGEST, TODAY], TODAY) == (LONGEST, TODAY)
+
+
+@pytest.mark.parametrize('args', [[TOO_LONG, TODAY], ['2026-02-30'], ['yesterday']])
+def test_parse_report_range_rejects(args):
+    with pytest.raises(ValueError):
+        main.parse_report_range(args, TODAY)
+
+
+def test_summarize_skips_empty_days_and_is_inclusive():
+    bot_data = {'rollups': {'-5': {
+        '2026-10-01': {'ko': ('Ko', 2)},
+        '2026-10-05': {'ko': ('Ko', 1), 'mg': ('Mg', 4)},
+        '2026-10-09': {'mg': ('Mg', 1)},
+    }}}
+
+    assert summarize(bot_data, '-5', '2026-10-05', '2026-10-05') == ([('2026-10-05', 5)], [('Ko', 1), ('Mg', 4)])
+    assert summarize(bot_data, '-5', '2026-10-01', '2026-10-09')[0] == [
+        ('2026-10-01', 2), ('2026-10-05', 5), ('2026-10-09', 1)]
+    assert summarize(bot_data, '-5', '2026-10-02', '2026-10-04') == ([], [])
+    assert summarize(bot_data, '-6', '2026-10-01', '2026-10-09') == ([], [])
+
+
+def test_report_command_on_a_range_without_reports(make_application, bot_api):
+    async def scenario():
+        application = make_application()
+        async with application:
+            await process(application, message(-5, '/report 2026-10-02 2026-10-04'),
+                          message(-5, '/report 2026-10-04 2026-13-01'))
+
+    asyncio.run(scenario())
+    no_data, usage = bot_api.texts(-5)
+    assert no_data == "🤷‍♂️ No data found for 2026-10-02 → 2026-10-04 in this chat."
+    assert usage.startswith("Usage: /report")
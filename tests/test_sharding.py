@@ -0,0 +1,95 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+import main
+from chat_registry import CHAT_SEEN_KEY, seen_day, touch_chat
+from shared_store import SHARED_STORE_BUSY_TIMEOUT, SharedDataChats, SharedStore, install_shared_store
+from sharding import shard_of, update_route_key
+from stub_api import message, process
+
+ADMIN = main.ADMIN_IDS[0]
+
+
+def callback_update(data, chat_id=7196380140):
+    return {'update_id': 1, 'callback_query': {
+        'id': '1', 'chat_instance': 'x', 'data': data,
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'a'},
+        'message': {'message_id': 5, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}, 'text': 'x'},
+    }}
+
+
+def test_admin_clear_goes_to_the_groups_shard():
+    assert update_route_key(callback_update('admin_clear_-1001234')) == -1001234
+    assert update_route_key(callback_update('admin_clear_-1001234_data_2')) == -1001234
+    assert update_route_key(callback_update('listgroups_data_1')) == 7196380140
+    assert update_route_key(callback_update('admin_clear_x')) == 7196380140
+
+
+def test_data_chats_are_shared_between_workers(tmp_path):
+    store = SharedStore(str(tmp_path / 'shared.sqlite3'))
+    shard_count = 2
+    workers = [SharedDataChats(store) for _ in range(shard_count)]
+    owns = [lambda chat_id, shard=shard: shard_of(chat_id, shard_count) == shard for shard in range(shard_count)]
+
+    workers[0].sync({'-10': {'2026-10-18': ['x']}, '-12': {}}, owns[0])
+    workers[1].sync({'-11': {'2026-10-18': ['x']}}, owns[1])
+    assert sorted(workers[0]) == [-11, -10]
+
+    workers[1].set(-11, False)
+    workers[0].set(-12, True)
+    assert sorted(workers[1]) == [-12, -10]
+
+    # A restarted worker drops what its own group_data no longer holds, and only that.
+    workers[0].sync({}, owns[0])
+    assert sorted(workers[1]) == []
+    workers[1].set(-13, True)
+    workers[0].sync({'-10': {'2026-10-18': ['x']}}, owns[0])
+    assert sorted(workers[0]) == [-13, -10]
+    store.close()
+
+
+def test_stats_counts_the_active_chats_of_every_worker(tmp_path, make_application, bot_api):
+    store = SharedStore(str(tmp_path / 'shared.sqlite3'))
+    today = seen_day()
+    # Worker 1 had these chats before sharding; worker 0 is the application below.
+    other_worker = {'users': {3}, 'groups': {-11, -13}, CHAT_SEEN_KEY: {3: today - 1, -13: today - 30}}
+    install_shared_store(other_worker, store, owns=lambda chat_id: shard_of(chat_id, 2) == 1)
+    touch_chat(other_worker, -11)
+
+    async def scenario():
+        application = make_application()
+        async with application:
+            install_shared_store(application.bot_data, store, owns=lambda chat_id: shard_of(chat_id, 2) == 0)
+            await process(application, message(-10, 'hi'), message(ADMIN, '/stats'))
+
+    asyncio.run(scenario())
+    assert bot_api.texts(ADMIN)[-1].startswith(
+        "📊 Bot Statistics:\n"
+        "Total Users (Private Chats): 2 (2 active in the last 7 days)\n"
+        "Total Groups: 3 (2 active in the last 7 days)\n"
+    )
+    assert dict(other_worker[CHAT_SEEN_KEY].items()) == {
+        3: today - 1, -13: today - 30, -11: today, -10: today, ADMIN: today}
+    store.close()
+
+
+def test_a_locked_shared_store_fails_fast_instead_of_freezing_the_worker(tmp_path):
+    path = str(tmp_path / 'shared.sqlite3')
+    store = SharedStore(path)
+    bot_data = {}
+    install_shared_store(bot_data, store)
+
+    other_worker = sqlite3.connect(path, isolation_level=None)
+    other_worker.execute("BEGIN IMMEDIATE")
+    started = time.monotonic()
+    with pytest.raises(sqlite3.OperationalError, match='locked'):
+        bot_data['check_records'].increment('0912345678')
+    assert time.monotonic() - started < SHARED_STORE_BUSY_TIMEOUT + 1
+    other_worker.execute("ROLLBACK")
+
+    assert bot_data['check_records'].increment('0912345678') == 1
+    other_worker.close()
+    store.close()
@@ -0,0 +1,198 @@
+import asyncio
+import copy
+import os
+import pickle
+import time
+
+from stub_api import message, process
+from report_store import ReportRecord, get_day_reports
+from storage import JournalPersistence, SqlitePersistence, WriteBehindPersistence, apply_change, seed_persistence
+
+LEGACY_SUMMARY = "18.10    Aung    a@gmail.com"
+
+
+def write_journal(path, changes):
+    with open(path, 'wb') as journal:
+        for seq, change in enumerate(changes, 1):
+            payload = pickle.dumps((seq, change))
+            journal.write(JournalPersistence.RECORD_HEADER.pack(len(payload)) + payload)
+
+
+def test_apply_change_converts_legacy_report():
+    bot_data = {}
+    apply_change(bot_data, ('report', '-5', '2026-10-18', LEGACY_SUMMARY))
+
+    records = get_day_reports(bot_data, '-5', '2026-10-18').records
+    assert records == [ReportRecord.from_summary(LEGACY_SUMMARY)]
+    assert bot_data['rollups']['-5']['2026-10-18']['aung'] == ('Aung', 1)
+
+
+def test_journal_replays_legacy_report(tmp_path):
+    journal_path = tmp_path / 'bot_data.journal'
+    record = ReportRecord('18.10', 'Ko', 'b@gmail.com', 'ko')
+    write_journal(journal_path, [
+        ('report', '-5', '2026-10-18', LEGACY_SUMMARY),
+        ('report', '-5', '2026-10-18', record),
+    ])
+
+    persistence = JournalPersistence(str(tmp_path / 'bot_data.pickle'), str(journal_path))
+    bot_data = asyncio.run(persistence.get_bot_data())
+
+    records = get_day_reports(bot_data, '-5', '2026-10-18').records
+    assert records == [ReportRecord.from_summary(LEGACY_SUMMARY), record]
+
+
+def test_sqlite_applies_legacy_report(tmp_path):
+    persistence = SqlitePersistence(str(tmp_path / 'bot_data.sqlite3'), migrate_from=None)
+    persistence.apply(('report', '-5', '2026-10-18', LEGACY_SUMMARY))
+
+    bot_data = asyncio.run(persistence.get_bot_data())
+    assert get_day_reports(bot_data, '-5', '2026-10-18').records == [ReportRecord.from_summary(LEGACY_SUMMARY)]
+
+
+def read_pickle(path):
+    # PTB's pickler stores the bot as a persistent id.
+    with open(path, 'rb') as file:
+        unpickler = pickle.Unpickler(file)
+        unpickler.persistent_load = lambda pid: None
+        return unpickler.load()
+
+
+class RecordingApplication:
+    """Stands in for the Application in WriteBehindPersistence.record()."""
+
+    def __init__(self) -> None:
+        self.flushes = 0
+
+    def create_task(self, coroutine) -> None:
+        self.flushes += 1
+        coroutine.close()
+
+
+def test_write_behind_flushes_early_at_the_dirty_threshold(tmp_path):
+    persistence = WriteBehindPersistence(str(tmp_path / 'bot_data.pickle'), max_dirty=3)
+    application = RecordingApplication()
+
+    for chat_id in (1, 2):
+        persistence.record(application, ('chat', chat_id, 'private'))
+    assert application.flushes == 0
+
+    persistence.record(application, ('chat', 3, 'private'))
+    assert application.flushes == 1
+    # The flush is already on its way.
+    persistence.record(application, ('chat', 4, 'private'))
+    assert application.flushes == 1
+
+
+def test_write_behind_skips_idle_intervals_and_flushes_user_data(tmp_path):
+    path = tmp_path / 'bot_data.pickle'
+    persistence = WriteBehindPersistence(str(path))
+
+    async def scenario():
+        bot_data = await persistence.get_bot_data()
+        await persistence.update_bot_data(bot_data)
+        assert not path.exists()
+
+        # Only user_data changed: it is written by the next interval all the same.
+        await asyncio.gather(persistence.update_bot_data(bot_data), persistence.update_user_data(5, {'step': 1}))
+        assert path.exists()
+
+        written = os.stat(path).st_mtime_ns
+        await asyncio.gather(persistence.update_bot_data(bot_data), persistence.update_user_data(5, {'step': 1}))
+        assert os.stat(path).st_mtime_ns == written
+
+    asyncio.run(scenario())
+    assert read_pickle(path)['user_data'] == {5: {'step': 1}}
+
+
+def test_write_behind_flushes_on_shutdown(tmp_path, make_application):
+    path = tmp_path / 'bot_data.pickle'
+
+    async def scenario():
+        # Neither the interval nor the threshold is reached before the application stops.
+        application = make_application(WriteBehindPersistence(str(path), flush_interval=3600, max_dirty=1000))
+        async with application:
+            await application.start()
+            await process(application, message(555, '/chk 0912345678'))
+            assert not path.exists()
+            # Application.update_persistence hands over the live bot_data, not a deep copy.
+            assert application.bot_data is await application.persistence.get_bot_data()
+            await application.stop()
+
+    asyncio.run(scenario())
+    bot_data = read_pickle(path)['bot_data']
+    assert type(bot_data) is dict
+    assert bot_data['check_records']['0912345678'] == 1
+    assert 555 in bot_data['users']
+
+
+def test_sqlite_interval_flush_does_not_grow_with_rows(tmp_path, make_application):
+    async def flush_seconds(rows):
+        path = str(tmp_path / f'{rows}.sqlite3')
+        await seed_persistence(SqlitePersistence(path, migrate_from=None), [
+            ('report', str(-1 - row % 50), '2026-10-18', ReportRecord('18.10', 'Ko', f'u{row}@gmail.com', 'ko'))
+            for row in range(rows)
+        ])
+        application = make_application(SqlitePersistence(path, migrate_from=None))
+        async with application:
+            assert len(get_day_reports(application.bot_data, '-1', '2026-10-18')) == rows // 50
+            timings = []
+            for _ in range(5):
+                started = time.perf_counter()
+                await application.update_persistence()
+                timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    small = asyncio.run(flush_seconds(100))
+    large = asyncio.run(flush_seconds(20000))
+    # A deep copy of 20,000 reports alone takes tens of milliseconds.
+    assert large < small * 5 + 0.005
+
+
+def journal_changes(first, count):
+    for n in range(first, first + count):
+        yield ('chat', n, 'private')
+        yield ('check', f'0911{n:06d}', n)
+        yield ('report', '-5', '2026-10-18', ReportRecord('18.10', f'K{n % 3}', f'u{n}@gmail.com', f'k{n % 3}'))
+
+
+def assert_journal_state(bot_data, count):
+    assert bot_data.get('users', set()) == set(range(count))
+    assert [bot_data['check_records'][f'0911{n:06d}'] for n in range(count)] == list(range(count))
+    records = get_day_reports(bot_data, '-5', '2026-10-18') or ()
+    assert [record.contact for record in records] == [f'u{n}@gmail.com' for n in range(count)]
+    rollup = bot_data.get('rollups', {}).get('-5', {}).get('2026-10-18', {})
+    assert sum(khaifa_count for _, khaifa_count in rollup.values()) == count
+
+
+def test_journal_recovers_after_crashes_with_and_without_a_snapshot(tmp_path):
+    snapshot, journal = str(tmp_path / 'bot_data.pickle'), str(tmp_path / 'bot_data.journal')
+    application = RecordingApplication()
+
+    async def run(first, count, compact=False):
+        persistence = JournalPersistence(snapshot, journal, compact_bytes=1 << 30)
+        bot_data = await persistence.get_bot_data()
+        assert_journal_state(bot_data, first)
+        # PTB deep-copies bot_data before update_bot_data; the journal gets the live object.
+        assert copy.deepcopy(bot_data) is bot_data
+        for change in journal_changes(first, count):
+            apply_change(bot_data, change)
+            persistence.record(application, change)
+        if compact:
+            # What the persistence loop does every interval.
+            await persistence.update_bot_data(bot_data)
+            assert os.path.getsize(journal) == 0
+        # Crash: no flush, the journal is left as written.
+        persistence._journal.close()
+
+    asyncio.run(run(0, 10))
+    assert not os.path.exists(snapshot)
+    asyncio.run(run(10, 10, compact=True))
+    asyncio.run(run(20, 10))
+
+    # A record torn by the crash is dropped; everything before it is replayed.
+    with open(journal, 'ab') as file:
+        file.write(JournalPersistence.RECORD_HEADER.pack(100) + b'torn')
+    persistence = JournalPersistence(snapshot, journal)
+    assert_journal_state(asyncio.run(persistence.get_bot_data()), 30)
+    persistence._journal.close()
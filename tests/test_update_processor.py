@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import httpx
+from telegram import Update
+from telegram.ext import Application, CallbackQueryHandler
+from telegram.request import HTTPXRequest
+
+import main
+from report_store import ReportRecord, get_day_reports
+from stub_api import StubBotApi, callback
+from update_processor import ChatOrderedUpdateProcessor
+
+DAY = '2026-10-18'
+PAGES_PER_CHAT = 4
+
+
+async def page_through(chat_ids, bot_api: StubBotApi) -> float:
+    """Press the /showdata page buttons of every chat; returns the seconds until all were handled.
+
+    show_data_page awaits two Bot API calls, so the stub's latency is paid inside the handler.
+    """
+    request = HTTPXRequest(httpx_kwargs={'transport': httpx.MockTransport(bot_api)})
+    application = (
+        Application.builder().token('123:abc').request(request).updater(None)
+        .concurrent_updates(ChatOrderedUpdateProcessor(16)).build()
+    )
+    application.add_handler(CallbackQueryHandler(main.show_data_page, pattern='^showdata_'))
+
+    async with application:
+        for chat_id in chat_ids:
+            reports = get_day_reports(application.bot_data, str(chat_id), DAY, create=True)
+            for n in range(600):
+                reports.add(ReportRecord('18.10', f'K{n % 7}', f'user{n}@gmail.com', f'k{n % 7}'))
+        page_count = len(reports.pages())
+        assert page_count >= PAGES_PER_CHAT
+
+        await application.start()
+        started = time.perf_counter()
+        # Each chat pages backwards: a chat's edits arriving in any other order are out of order.
+        for page in reversed(range(PAGES_PER_CHAT)):
+            for chat_id in chat_ids:
+                await application.update_queue.put(Update.de_json(callback(chat_id, f'showdata_{DAY}_{page}'),
+                                                                  application.bot))
+        await application.update_queue.join()
+        elapsed = time.perf_counter() - started
+        await application.stop()
+
+        pages = reports.pages()
+        for chat_id in chat_ids:
+            edits = bot_api.texts(chat_id, methods=('editMessageText',))
+            assert edits == [pages[page] for page in reversed(range(PAGES_PER_CHAT))], chat_id
+    return elapsed
+
+
+def test_throughput_grows_with_active_chats_and_each_chat_stays_in_order():
+    one_chat = asyncio.run(page_through([-1], StubBotApi(latency=0.05)))
+    eight_chats = asyncio.run(page_through([-1 - n for n in range(8)], StubBotApi(latency=0.05)))
+
+    # One chat: 4 updates x 2 calls x 50 ms, strictly one after another. Eight chats handled
+    # one at a time would take eight times as long; concurrently they take about as long as one.
+    assert one_chat >= PAGES_PER_CHAT * 2 * 0.05
+    assert eight_chats < 3 * one_chat
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import urllib.parse
+
+import httpx
+
+import main
+from storage import WriteBehindPersistence
+from web_server import SECRET_HEADER, Request, Response, WebServer, add_webhook_route, text_response
+
+SECRET = 's3cret'
+
+
+class StubBotApi(WebServer):
+    """Answers Bot API calls the way Telegram would and records them."""
+
+    def __init__(self) -> None:
+        super().__init__('127.0.0.1', 0)
+        self.calls = []
+
+    async def _dispatch(self, request: Request) -> Response:
+        method = request.path.rsplit('/', 1)[-1]
+        if 'json' in request.headers.get('content-type', ''):
+            params = json.loads(request.body)
+        else:
+            params = {key: values[0] for key, values in urllib.parse.parse_qs(request.body.decode()).items()}
+        self.calls.append((method, params))
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'bot', 'username': 'bot'}
+        elif method == 'sendMessage':
+            result = {'message_id': len(self.calls), 'date': 0, 'text': params.get('text', ''),
+                      'chat': {'id': int(params['chat_id']), 'type': 'private'}}
+        else:
+            result = True
+        return text_response(json.dumps({'ok': True, 'result': result}), content_type='application/json')
+
+    def sent(self, chat_id):
+        return [params['text'] for method, params in self.calls
+                if method == 'sendMessage' and int(params['chat_id']) == chat_id]
+
+
+def update(text, chat_id=555):
+    return {'update_id': 1, 'message': {
+        'message_id': 1, 'date': 0, 'text': text,
+        'chat': {'id': chat_id, 'type': 'private', 'first_name': 'u'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'u'},
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 4}],
+    }}
+
+
+def test_webhook_route(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def scenario():
+        api = StubBotApi()
+        await api.start()
+        monkeypatch.setattr(main, 'TOKEN', '123:abc')
+        monkeypatch.setattr(main, 'TELEGRAM_API_URL', f'http://127.0.0.1:{api.port}/bot')
+        application = main.build_application(WriteBehindPersistence(str(tmp_path / 'bot_data.pickle')), polling=False)
+
+        server = WebServer('127.0.0.1', 0)
+        add_webhook_route(server, application, secret=SECRET)
+        try:
+            async with application:
+                await application.start()
+                await server.start()
+                url = f'http://127.0.0.1:{server.port}/telegram'
+                async with httpx.AsyncClient() as client:
+                    body = json.dumps(update('/chk 0912345678'))
+
+                    assert (await client.post(url, content=body)).status_code == 403
+                    assert (await client.post(url, content=body, headers={SECRET_HEADER: 'wrong'})).status_code == 403
+                    assert (await client.post(url, content=body, headers={SECRET_HEADER: 'sécret'.encode('latin-1')})).status_code == 403
+
+                    for malformed in (b'not json', b'[1]', b'{}', b'{"update_id": 2, "message": 5}'):
+                        response = await client.post(url, content=malformed, headers={SECRET_HEADER: SECRET})
+                        assert response.status_code == 400, malformed
+
+                    response = await client.post(url, content=body, headers={SECRET_HEADER: SECRET})
+                    assert response.status_code == 200
+
+                for _ in range(100):
+                    if api.sent(555):
+                        break
+                    await asyncio.sleep(0.05)
+                assert len(api.sent(555)) == 1
+                assert '0912345678' in api.sent(555)[0]
+                await application.stop()
+        finally:
+            await server.stop()
+            await api.stop()
+
+    asyncio.run(scenario())
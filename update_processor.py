@@ -0,0 +1,81 @@
+import os
+import sys
+import asyncio
+from typing import Any, Awaitable, Dict, Hashable, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# How many updates are handled at the same time. Updates of the same chat are never handled
+# concurrently: they run one after another in the order Telegram delivered them. 1 turns
+# concurrency off.
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '16'))
+
+
+def ordering_key(update: object) -> Optional[Hashable]:
+    if isinstance(update, Update):
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            # Inline queries and the like have no chat; keep each user's updates in order.
+            return ('user', update.effective_user.id)
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Process updates of different chats concurrently and updates of one chat in order.
+
+    The Application starts one task per update, in arrival order, and each task passes
+    through the processor's semaphore before do_process_update runs. That semaphore is made
+    effectively unbounded so it never makes a task wait: do_process_update is then entered in
+    arrival order and can chain each update behind the previous one of its chat before
+    anything yields. The real limit is `concurrency`, applied afterwards, so updates waiting
+    for their chat do not hold a slot another chat could use.
+
+    Handlers mutate bot_data without awaiting between reading and writing it, which makes
+    those mutations atomic on the single event loop even with concurrent updates.
+    """
+
+    __slots__ = ('concurrency', '_slots', '_tails')
+
+    def __init__(self, concurrency: int = UPDATE_CONCURRENCY) -> None:
+        super().__init__(max_concurrent_updates=sys.maxsize)
+        self.concurrency = concurrency
+        self._slots: Optional[asyncio.Semaphore] = None
+        # chat key -> future completed when the chat's latest queued update has been handled
+        self._tails: Dict[Hashable, asyncio.Future] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = ordering_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        previous = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+
+        try:
+            if previous is not None:
+                await previous
+            async with self._slots:
+                await coroutine
+        finally:
+            done.set_result(None)
+            if self._tails.get(key) is done:
+                del self._tails[key]
+
+    @property
+    def pending_chats(self) -> int:
+        return len(self._tails)
+
+    async def initialize(self) -> None:
+        # Created here rather than in __init__ so it belongs to the loop the application runs on.
+        self._slots = asyncio.Semaphore(self.concurrency)
+
+    async def shutdown(self) -> None:
+        pass
+
+
+def build_update_processor(concurrency: int = UPDATE_CONCURRENCY) -> Optional[ChatOrderedUpdateProcessor]:
+    return ChatOrderedUpdateProcessor(concurrency) if concurrency > 1 else None
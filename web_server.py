@@ -1,18 +1,263 @@
-from flask import Flask
-from threading import Thread
+import os
+import hmac
+import json
+import time
+import asyncio
+import secrets
 import logging
-log = logging.getLogger('werkzeug')
-log.setLevel(logging.ERROR)
-app = Flask('')
-@app.route('/')
-def home():
-    return "Telegram Bot is Running and Alive!"
-def run():
-    print("✨ Keep Alive Web Server Starting on 0.0.0.0:8080...")
-    app.run(host='0.0.0.0', port=8080)
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
-    print("✅ Keep Alive System (Web Server) initialized in background thread.")
-if __name__ == '__main__':
-    run()
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# The web server runs on the bot's own asyncio loop in both modes. It answers "/" for
+# keep-alive pings and serves /healthz and /metrics. With BOT_MODE=webhook, main() also
+# registers WEBHOOK_URL + WEBHOOK_PATH with Telegram and receives updates here instead of
+# long polling.
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEB_HOST = os.getenv('WEB_HOST', '0.0.0.0')
+WEB_PORT = int(os.getenv('PORT', '8080'))
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+# Telegram echoes this in X-Telegram-Bot-Api-Secret-Token. Without a configured value a random
+# one is used; set_webhook is called on every start, so it does not need to survive restarts.
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+MAX_BODY_SIZE = 1024 * 1024
+
+# /healthz reports "stalled" (HTTP 503) when updates are queued but none has been handled for
+# this many seconds.
+HEALTH_STALL_SECONDS = float(os.getenv('HEALTH_STALL_SECONDS', '60'))
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error',
+           503: 'Service Unavailable'}
+
+
+class Request:
+    __slots__ = ('method', 'path', 'query', 'headers', 'body')
+
+    def __init__(self, method: str, path: str, query: str, headers: Dict[str, str], body: bytes) -> None:
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+
+Response = Tuple[int, str, bytes]
+Route = Callable[[Request], Awaitable[Response]]
+
+
+def secret_matches(header: str, secret: str) -> bool:
+    # Headers are decoded as latin-1, so any header value encodes back to its raw bytes;
+    # compare_digest on str would raise TypeError for non-ASCII input.
+    return hmac.compare_digest(header.encode('latin-1'), secret.encode('utf-8'))
+
+
+def text_response(text: str, status: int = 200, content_type: str = 'text/plain; charset=utf-8') -> Response:
+    return status, content_type, text.encode('utf-8')
+
+
+class WebServer:
+    """A small HTTP/1.1 server running on the bot's event loop.
+
+    It only needs to serve a handful of fixed routes (the webhook, keep-alive and
+    monitoring), so it is built on asyncio streams rather than pulling in a web framework.
+    Connections are kept alive, as Telegram reuses them for webhook deliveries.
+    """
+
+    def __init__(self, host: str = WEB_HOST, port: int = WEB_PORT) -> None:
+        self.host = host
+        self.port = port
+        self.routes: Dict[Tuple[str, str], Route] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+        async def alive(request: Request) -> Response:
+            return text_response("Telegram Bot is Running and Alive!")
+
+        self.add_route('GET', '/', alive)
+
+    def add_route(self, method: str, path: str, handler: Route) -> None:
+        self.routes[(method, path)] = handler
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # With port 0 the OS picks a free port (tests); report the one actually bound.
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Web server listening on %s:%s", self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Idle keep-alive connections would otherwise linger until the loop shuts down.
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*self._connections.values(), return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                status, content_type, body = await self._dispatch(request)
+                keep_alive = request.headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError:
+            return None
+
+        lines = head.decode('latin-1').split('\r\n')
+        method, target, _ = lines[0].split(' ', 2)
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', '0'))
+        if length > MAX_BODY_SIZE:
+            raise ValueError("request body too large")
+        body = await reader.readexactly(length) if length else b''
+
+        path, _, query = target.partition('?')
+        return Request(method.upper(), path, query, headers, body)
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                return text_response("Method Not Allowed", 405)
+            return text_response("Not Found", 404)
+        try:
+            return await handler(request)
+        except Exception:
+            logger.exception("Error handling %s %s", request.method, request.path)
+            return text_response("Internal Server Error", 500)
+
+
+def add_webhook_route(server: WebServer, application, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET) -> None:
+    from telegram import Update
+
+    async def webhook(request: Request) -> Response:
+        if not secret_matches(request.headers.get(SECRET_HEADER, ''), secret):
+            return text_response("Forbidden", 403)
+        try:
+            data = json.loads(request.body)
+            if not isinstance(data, dict):
+                raise ValueError("update is not an object")
+            update = Update.de_json(data, application.bot)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return text_response("Bad Request", 400)
+
+        # Acknowledge right away; the update is processed by the application like a polled one.
+        await application.update_queue.put(update)
+        return text_response("OK")
+
+    server.add_route('POST', path, webhook)
+
+
+def add_monitoring_routes(server: WebServer, application) -> None:
+    metrics.register_application_gauges(application)
+
+    async def healthz(request: Request) -> Response:
+        now = time.time()
+        pending = application.update_queue.qsize() + getattr(application.update_processor, 'pending_chats', 0)
+        last_update = metrics.Health.last_update_at
+        last_flush = metrics.Health.last_flush_at
+        stalled = pending > 0 and now - (last_update or metrics.Health.started_at) > HEALTH_STALL_SECONDS
+        healthy = application.running and not stalled
+
+        body = {
+            'status': 'ok' if healthy else ('stalled' if stalled else 'stopped'),
+            'mode': BOT_MODE,
+            'uptime_seconds': round(now - metrics.Health.started_at, 1),
+            'pending_updates': pending,
+            'last_update_at': last_update,
+            'seconds_since_update': round(now - last_update, 1) if last_update else None,
+            'last_flush_at': last_flush,
+            'seconds_since_flush': round(now - last_flush, 1) if last_flush else None,
+        }
+        return text_response(json.dumps(body), 200 if healthy else 503, 'application/json')
+
+    async def prometheus(request: Request) -> Response:
+        return text_response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    server.add_route('GET', '/healthz', healthz)
+    server.add_route('GET', '/metrics', prometheus)
+
+
+def attach_to_polling(application, server: WebServer) -> None:
+    """Run `server` alongside run_polling: started after initialize, stopped on shutdown."""
+    post_init = application.post_init
+    post_shutdown = application.post_shutdown
+
+    async def start_server(app) -> None:
+        await server.start()
+        if post_init:
+            await post_init(app)
+
+    async def stop_server(app) -> None:
+        await server.stop()
+        if post_shutdown:
+            await post_shutdown(app)
+
+    application.post_init = start_server
+    application.post_shutdown = stop_server
+
+
+async def run_webhook(application, server: Optional[WebServer] = None) -> None:
+    """Serve `application` through a webhook until SIGINT/SIGTERM, like run_polling does."""
+    import signal
+    from telegram import Update
+
+    if not WEBHOOK_URL:
+        raise RuntimeError("BOT_MODE=webhook needs WEBHOOK_URL (the public https base URL)")
+
+    server = server or WebServer()
+    add_webhook_route(server, application)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    async with application:
+        await application.start()
+        await server.start()
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        print(f"✅ Webhook mode: receiving updates on {WEB_HOST}:{WEB_PORT}{WEBHOOK_PATH}")
+        try:
+            await stop.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+